@@ -1,12 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory, jsonify
 import os
-from PIL import Image
-import pillow_heif
-import io
+import time
 import pandas as pd
 from function.e_slip import extract_info
 from function.physical import physical_slip
-from function.e_slip.bank_annotation import annotation_bank
+from function.e_slip.logo_index import get_logo_index
+from function.physical.detector import get_detector, get_detector_metrics
+from function.bulk_extract import BANK_CLASS_MAPPING, normalize_bank, run_bulk_extraction
+from function.jobs import get_job_queue
+from function.results_catalog import get_results_catalog
+from function.results_store import get_results_store
+from function.image_io import DecodedImage
+from function.previews import PREVIEW_SIZES, ensure_previews, remove_previews, schedule_previews
+from function.rule_engine import get_parse_metrics
 from datetime import datetime
 
 app = Flask(__name__)
@@ -15,29 +21,10 @@ app = Flask(__name__)
 UPLOAD_E_SLIP_FOLDER = os.path.abspath('uploads/e-slips')
 UPLOAD_PHYSICAL_FOLDER = os.path.abspath('uploads/physicals')
 MODEL_PATH = os.path.abspath('models/best.pt')
-BANK_CLASS_MAPPING = {
-            'bangkok bank': 'bangkok',
-            'bangkok': 'bangkok',
-            'bkk': 'bangkok',
-            'bbl': 'bangkok',
-            'kasikornbank': 'kbank',
-            'kbank': 'kbank',
-            'k-bank': 'kbank',
-            'kasikorn': 'kbank',
-            'kplus': 'kbank',
-            'k+': 'kbank',
-            'scb': 'scb',
-            'siam commercial bank': 'scb',
-            'siam commercial': 'scb',
-            'siam': 'scb',
-            'krungthai': 'krungthai',
-            'krungthai bank': 'krungthai',
-            'ktb': 'krungthai',
-            'krung thai': 'krungthai',
-            'krungthai_bank': 'krungthai'
-        }
-
 EXTRACT_ALL_DATA_PATH = os.path.abspath('app_extraction_csv')
+RESULT_FILES_PER_PAGE = 10 # result files per section on /view_results
+RESULT_ROWS_PER_PAGE = 50  # rows shown for an opened result file
+API_MAX_BATCH = int(os.environ.get('API_MAX_BATCH', 50)) # images per /api/v1/extract/batch request
 
 # Keep a general UPLOAD_FOLDER reference for simplicity in some existing functions if needed,
 # or refactor them later. For now, previews might use this if not distinguished by type.
@@ -50,30 +37,19 @@ if not os.path.exists(UPLOAD_E_SLIP_FOLDER):
 if not os.path.exists(UPLOAD_PHYSICAL_FOLDER):
     os.makedirs(UPLOAD_PHYSICAL_FOLDER)
 
-# Re-added convert_heic_to_jpeg function
-def convert_heic_to_jpeg(heic_path):
-    try:
-        pillow_heif.register_heif_opener()
-        heif_file = pillow_heif.read_heif(heic_path)
-        image = Image.frombytes(
-            heif_file.mode, 
-            heif_file.size, 
-            heif_file.data,
-            "raw",
-        )
-        output = io.BytesIO()
-        image.save(output, format='JPEG')
-        output.seek(0)
-        return output
-    except Exception as e:
-        print(f"Error converting HEIC image: {e}")
-        return None
+# Build the in-memory logo template index once at start-up (rebuilt only if bank_logos/ changes)
+get_logo_index(extract_info.BANK_LOGO_PATH)
+
+# Load and warm up the slip detector once so the first physical slip does not pay for it
+if os.path.exists(MODEL_PATH):
+    get_detector(MODEL_PATH)
 
 @app.route('/')
 def index():
     message = request.args.get('message', None)
     uploaded_filename_param = request.args.get('uploaded_filename', None)
     slip_type_param = request.args.get('slip_type', None) # For auto-preview after upload
+    job_id = request.args.get('job_id', None) # bulk extraction job to show progress for
     
     e_slip_files = []
     if os.path.exists(app.config['UPLOAD_E_SLIP_FOLDER']):
@@ -91,6 +67,7 @@ def index():
                            message=message, 
                            uploaded_filename_param=uploaded_filename_param, 
                            slip_type_param=slip_type_param, # Pass to template
+                           job_id=job_id,
                            e_slip_files=e_slip_files,
                            physical_slip_files=physical_slip_files)
 
@@ -118,13 +95,15 @@ def upload_file():
             return redirect(url_for('index', message='Invalid slip type selected'))
             
         file_path = os.path.join(target_folder, filename)
+        remove_previews(file_path) # replacing an upload: its old derivatives are never served again
         file.save(file_path)
+        schedule_previews(file_path)
         return redirect(url_for('index', 
                                 message=f'{slip_type.capitalize()} "{filename}" uploaded successfully', 
                                 uploaded_filename=filename,
                                 slip_type=slip_type)) # Pass slip_type for auto-preview context
 
-# Route to serve uploaded files for preview
+# Route to serve uploaded files for preview: ?size=thumb|display (default, cached JPEG derivatives) or original
 @app.route('/uploads_preview/<slip_type>/<path:filename>')
 def serve_upload_for_preview(slip_type, filename):
     target_folder = ""
@@ -142,8 +121,23 @@ def serve_upload_for_preview(slip_type, filename):
     if not os.path.exists(file_path_abs):
         return "File not found", 404
 
-    if filename.lower().endswith('.heic'):
-        converted_image = convert_heic_to_jpeg(file_path_abs)
+    size = request.args.get('size', 'display')
+    if size in PREVIEW_SIZES:
+        try:
+            path, etag = ensure_previews(file_path_abs)[size]
+            return send_file(path, mimetype='image/jpeg', etag=etag, conditional=True, max_age=0,
+                             download_name=os.path.splitext(filename)[0] + '.jpg')
+        except Exception as e:
+            print(f"Error building preview for {filename}, serving the original: {e}")
+    elif size != 'original':
+        return "Invalid preview size", 400
+
+    if filename.lower().endswith(('.heic', '.heif')):
+        try:
+            converted_image = DecodedImage.open(file_path_abs).to_jpeg()
+        except Exception as e:
+            print(f"Error converting HEIC image: {e}")
+            converted_image = None
         if converted_image:
             return send_file(converted_image, mimetype='image/jpeg', as_attachment=False, download_name=os.path.splitext(filename)[0] + '.jpg')
         else:
@@ -158,17 +152,13 @@ def process_e_slip_route(filename):
     if not os.path.exists(file_path):
         return "File not found", 404
     try:
-        extracted_data_df = extract_info.process_image(file_path)
-        
-        # Get bank class information from annotation_bank
-        detected_bank = annotation_bank(file_path, 'bank_logos')
-        
-        # Get raw OCR text
-        from function.e_slip.ocr_tesseract import ocr_pytesseract
-        raw_ocr_text, _ = ocr_pytesseract(file_path)
+        # One pass: OCR text, detected bank and extracted fields all come back together
+        result = extract_info.process_image(file_path)
+        extracted_data_df = result.to_dataframe()
+        raw_ocr_text = result.ocr_text
         
         # Normalize the detected bank name
-        bank_class = BANK_CLASS_MAPPING.get(detected_bank.lower() if detected_bank else '', detected_bank)
+        bank_class = BANK_CLASS_MAPPING.get(result.bank.lower() if result.bank else '', result.bank)
         
         if extracted_data_df is not None and not extracted_data_df.empty:
             data_html = extracted_data_df.to_html(classes='table table-striped', index=False)
@@ -191,12 +181,9 @@ def process_physical_slip_route(filename):
     if not os.path.exists(file_path):
         return "File not found", 404
     try:
-        image, after_yolo, conf, classname, binary, detected_4_coor_with_contour, perspective_trans, thresh, binaryInv, extracted_text = physical_slip.process_physical_slip(file_path, MODEL_PATH)
-        
-        # Get raw OCR text by running OCR on the processed image
-        import pytesseract
-        custom_config = r'--oem 3 --psm 6'
-        raw_ocr_text = pytesseract.image_to_string(binaryInv, lang='tha+eng', config=custom_config)
+        result = physical_slip.extract_physical_slip(file_path, MODEL_PATH)
+        classname, extracted_text = result.bank, result.fields
+        raw_ocr_text = result.raw_ocr
         
         # Normalize the classname to ensure consistent color mapping
         bank_class = BANK_CLASS_MAPPING.get(classname.lower() if classname else '', classname)
@@ -244,6 +231,7 @@ def delete_file_route(slip_type, filename):
 
     try:
         if os.path.exists(file_path) and os.path.isfile(file_path):
+            remove_previews(file_path)
             os.remove(file_path)
             return redirect(url_for('index', message=f'{slip_type.capitalize()} "{filename}" deleted successfully.'))
         else:
@@ -254,138 +242,53 @@ def delete_file_route(slip_type, filename):
 
 @app.route('/extract_all_data', methods=['POST'])
 def extract_all_data():
-    """Extract data from all uploaded files and export to CSV"""
-    try:
-        
-        # Create results directory if it doesn't exist
-        results_dir = EXTRACT_ALL_DATA_PATH
-        if not os.path.exists(results_dir):
-            os.makedirs(results_dir)
-        
-        # Generate timestamp for unique filenames
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Initialize data storage
-        e_slip_data = []
-        physical_slip_data = []
-        failed_files = []
-        
-        # Process E-slips
-        if os.path.exists(app.config['UPLOAD_E_SLIP_FOLDER']):
-            e_slip_files = [f for f in os.listdir(app.config['UPLOAD_E_SLIP_FOLDER']) 
-                           if not f.startswith('.') and os.path.isfile(os.path.join(app.config['UPLOAD_E_SLIP_FOLDER'], f))]
-            
-            for filename in e_slip_files:
-                try:
-                    file_path = os.path.join(app.config['UPLOAD_E_SLIP_FOLDER'], filename)
-                    extracted_data_df = extract_info.process_image(file_path)
-                    
-                    if extracted_data_df is not None and not extracted_data_df.empty:
-                        # Add metadata
-                        extracted_data_df['filename'] = filename
-                        extracted_data_df['slip_type'] = 'e-slip'
-                        extracted_data_df['processing_timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        
-                        # Get bank information
-                        detected_bank = annotation_bank(file_path, 'bank_logos')
-                        bank_class = BANK_CLASS_MAPPING.get(detected_bank.lower() if detected_bank else '', detected_bank)
-                        extracted_data_df['detected_bank'] = bank_class
-                        
-                        e_slip_data.append(extracted_data_df)
-                    else:
-                        failed_files.append(f"e-slip: {filename} - No data extracted")
-                        
-                except Exception as e:
-                    failed_files.append(f"e-slip: {filename} - Error: {str(e)}")
-        
-        # Process Physical slips
-        if os.path.exists(app.config['UPLOAD_PHYSICAL_FOLDER']):
-            physical_slip_files = [f for f in os.listdir(app.config['UPLOAD_PHYSICAL_FOLDER']) 
-                                  if not f.startswith('.') and os.path.isfile(os.path.join(app.config['UPLOAD_PHYSICAL_FOLDER'], f))]
-            
-            for filename in physical_slip_files:
-                try:
-                    file_path = os.path.join(app.config['UPLOAD_PHYSICAL_FOLDER'], filename)
-                    image, after_yolo, conf, classname, binary, detected_4_coor_with_contour, perspective_trans, thresh, binaryInv, extracted_text = physical_slip.process_physical_slip(file_path, MODEL_PATH)
-                    
-                    if extracted_text:
-                        # Convert extracted text to DataFrame format
-                        if isinstance(extracted_text, dict):
-                            df = pd.DataFrame([extracted_text])
-                        elif isinstance(extracted_text, list):
-                            # Convert list of text lines to a single text field
-                            text_content = '\n'.join([line for line in extracted_text if line.strip()])
-                            df = pd.DataFrame([{'extracted_text': text_content}])
-                        else:
-                            df = pd.DataFrame([{'extracted_text': str(extracted_text)}])
-                        
-                        # Add metadata
-                        df['filename'] = filename
-                        df['slip_type'] = 'physical'
-                        df['processing_timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        df['detected_bank'] = BANK_CLASS_MAPPING.get(classname.lower() if classname else '', classname)
-                        df['confidence'] = conf
-                        
-                        physical_slip_data.append(df)
-                    else:
-                        failed_files.append(f"physical: {filename} - No data extracted")
-                        
-                except Exception as e:
-                    failed_files.append(f"physical: {filename} - Error: {str(e)}")
-        
-        # Save results to CSV files
-        success_count = 0
-        
-        if e_slip_data:
-            e_slip_combined = pd.concat(e_slip_data, ignore_index=True)
-            e_slip_csv_path = os.path.join(results_dir, f'e_slip_extraction_{timestamp}.csv')
-            e_slip_combined.to_csv(e_slip_csv_path, index=False)
-            success_count += len(e_slip_data)
-        
-        if physical_slip_data:
-            physical_slip_combined = pd.concat(physical_slip_data, ignore_index=True)
-            physical_csv_path = os.path.join(results_dir, f'physical_slip_extraction_{timestamp}.csv')
-            physical_slip_combined.to_csv(physical_csv_path, index=False)
-            success_count += len(physical_slip_data)
-        
-        # Create a summary report
-        summary_data = {
-            'processing_timestamp': [datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
-            'total_e_slips_processed': [len(e_slip_data)],
-            'total_physical_slips_processed': [len(physical_slip_data)],
-            'total_files_processed': [success_count],
-            'total_failed_files': [len(failed_files)],
-            'failed_files_list': ['; '.join(failed_files) if failed_files else 'None']
-        }
-        
-        summary_df = pd.DataFrame(summary_data)
-        summary_csv_path = os.path.join(results_dir, f'extraction_summary_{timestamp}.csv')
-        summary_df.to_csv(summary_csv_path, index=False)
-        
-        # Prepare success message
-        message_parts = []
-        if e_slip_data:
-            message_parts.append(f"E-slips: {len(e_slip_data)} files processed")
-        if physical_slip_data:
-            message_parts.append(f"Physical slips: {len(physical_slip_data)} files processed")
-        
-        if success_count > 0:
-            success_msg = f"Data extraction completed! {', '.join(message_parts)}. Results saved to app_extraction_csv/ folder. Click 'View Extraction Results' to see the data."
-            if failed_files:
-                success_msg += f" Note: {len(failed_files)} files failed to process."
-        else:
-            success_msg = "No data could be extracted from uploaded files. Please check your files and try again."
-            
-        return redirect(url_for('index', message=success_msg))
-        
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return redirect(url_for('index', message=f'Error during bulk extraction: {str(e)}'))
+    """Queue a background job that extracts data from all uploaded files and exports to CSV"""
+    # incremental by default: only new or changed uploads go through the pipeline
+    incremental = not request.form.get('full_rescan')
+    e_slip_folder, physical_folder = app.config['UPLOAD_E_SLIP_FOLDER'], app.config['UPLOAD_PHYSICAL_FOLDER']
+
+    def run(job):
+        summary = run_bulk_extraction(e_slip_folder, physical_folder, EXTRACT_ALL_DATA_PATH, MODEL_PATH,
+                                      incremental=incremental, progress=job)
+        return summary.to_dict()
+
+    job = get_job_queue().submit('extract_all_data', run)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job.id, 'status_url': url_for('job_status', job_id=job.id)}), 202
+    return redirect(url_for('index', job_id=job.id,
+                            message=f"Extraction job {job.id} started. Results will be saved to app_extraction_csv/ folder when it finishes."))
+
+@app.route('/jobs')
+def list_jobs():
+    return jsonify([job.progress() for job in get_job_queue().jobs()])
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a background job: counts, percent, elapsed time and ETA"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job.progress())
+
+@app.route('/jobs/<job_id>/files')
+def job_files(job_id):
+    """Per-file status of a background job"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job.file_status())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Stop a job after the file it is working on; files already done are still saved"""
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job.progress())
 
 @app.route('/view_results')
 def view_results():
-    """Display all extraction results"""
+    """Display extraction results from the results catalogue, one page of files and rows at a time"""
     try:
         results_dir = EXTRACT_ALL_DATA_PATH
         
@@ -396,60 +299,51 @@ def view_results():
                                  physical_slip_results=[], 
                                  summary_results=[])
         
-        # Get all CSV files from results directory
-        e_slip_results = []
-        physical_slip_results = []
-        summary_results = []
+        catalog = get_results_catalog(results_dir)
+        catalog.sync() # stat() only; rescans just the files that changed
         
-        for filename in os.listdir(results_dir):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(results_dir, filename)
-                try:
-                    # Determine file type based on filename
-                    if 'e_slip_extraction' in filename:
-                        df = pd.read_csv(file_path)
-                        e_slip_results.append({
-                            'filename': filename,
-                            'data': df,
-                            'record_count': len(df),
-                            'file_path': file_path,
-                            'creation_time': os.path.getmtime(file_path)
-                        })
-                    elif 'physical_slip_extraction' in filename:
-                        df = pd.read_csv(file_path)
-                        physical_slip_results.append({
-                            'filename': filename,
-                            'data': df,
-                            'record_count': len(df),
-                            'file_path': file_path,
-                            'creation_time': os.path.getmtime(file_path)
-                        })
-                    elif 'extraction_summary' in filename:
-                        df = pd.read_csv(file_path)
-                        summary_results.append({
-                            'filename': filename,
-                            'data': df,
-                            'file_path': file_path,
-                            'creation_time': os.path.getmtime(file_path)
-                        })
-                except Exception as e:
-                    print(f"Error reading {filename}: {e}")
-                    continue
+        page = max(1, request.args.get('page', 1, type=int)) # page of result files in each section
+        selected = request.args.get('file') # result file whose rows are shown
+        rows_page = max(1, request.args.get('rows_page', 1, type=int))
         
-        # Sort by creation time (newest first)
-        e_slip_results.sort(key=lambda x: x['creation_time'], reverse=True)
-        physical_slip_results.sort(key=lambda x: x['creation_time'], reverse=True)
-        summary_results.sort(key=lambda x: x['creation_time'], reverse=True)
+        def card(filename, entry, rows_per_page):
+            pages = max(1, -(-(entry['rows'] or 0) // rows_per_page))
+            current = min(rows_page, pages) if filename == selected else 1
+            columns, rows = catalog.read_rows(filename, (current - 1) * rows_per_page, rows_per_page)
+            return {
+                'filename': filename,
+                'record_count': entry['rows'],
+                'columns': entry['columns'],
+                'creation_time_str': datetime.fromtimestamp(entry['created']).strftime("%Y-%m-%d %H:%M:%S"),
+                'table_html': pd.DataFrame(rows, columns=columns).to_html(classes='table table-sm table-striped', index=False),
+                'rows_page': current,
+                'rows_pages': pages,
+            }
         
-        # Convert timestamps to readable format
-        for result_list in [e_slip_results, physical_slip_results, summary_results]:
-            for result in result_list:
-                result['creation_time_str'] = datetime.fromtimestamp(result['creation_time']).strftime("%Y-%m-%d %H:%M:%S")
+        sections = {}
+        page_count = 1
+        for kind in ('summary', 'e_slip', 'physical_slip'):
+            files = catalog.files(kind)
+            page_count = max(page_count, -(-len(files) // RESULT_FILES_PER_PAGE))
+            shown = files[(page - 1) * RESULT_FILES_PER_PAGE:page * RESULT_FILES_PER_PAGE]
+            cards = []
+            for filename, entry in shown:
+                if kind == 'summary':
+                    # one-row files, always shown
+                    cards.append(card(filename, entry, RESULT_ROWS_PER_PAGE))
+                elif filename == selected:
+                    cards.append(card(filename, entry, RESULT_ROWS_PER_PAGE))
+                else:
+                    # metadata only; rows are read when the file is opened
+                    cards.append({'filename': filename, 'record_count': entry['rows'], 'columns': entry['columns'],
+                                  'creation_time_str': datetime.fromtimestamp(entry['created']).strftime("%Y-%m-%d %H:%M:%S")})
+            sections[kind] = cards
         
         return render_template('view_results.html', 
-                             e_slip_results=e_slip_results,
-                             physical_slip_results=physical_slip_results,
-                             summary_results=summary_results,
+                             e_slip_results=sections['e_slip'],
+                             physical_slip_results=sections['physical_slip'],
+                             summary_results=sections['summary'],
+                             page=page, page_count=page_count, selected_file=selected,
                              message=None)
                              
     except Exception as e:
@@ -480,5 +374,126 @@ def download_csv(filename):
     except Exception as e:
         return f"Error downloading file: {str(e)}", 500
 
+@app.route('/results/query')
+def query_results():
+    """Filter / aggregate extracted slips from the indexed results store.
+
+    e.g. /results/query?bank=kbank&month=2025-04&min_amount=5000
+         /results/query?date_from=2025-01-01&agg=sum&group_by=from_bank
+    """
+    args = request.args
+    try:
+        filters = {name: normalize_bank(args[name].strip().lower()) for name in ('bank', 'from_bank', 'to_bank', 'detected_bank')
+                   if args.get(name)}
+        for name in ('slip_type', 'ref_number', 'date_from', 'date_to'):
+            if args.get(name):
+                filters[name] = args[name]
+        if args.get('month'): # yyyy-mm
+            filters['date_from'], filters['date_to'] = f"{args['month']}-01", f"{args['month']}-31"
+        for name in ('min_amount', 'max_amount'):
+            if args.get(name):
+                filters[name] = float(args[name].replace(',', ''))
+        result = get_results_store(EXTRACT_ALL_DATA_PATH).query(
+            agg=args.get('agg'), group_by=args.get('group_by'), order_by=args.get('order_by', 'transaction_date'),
+            descending=args.get('order', 'asc') == 'desc', limit=int(args.get('limit', 100)),
+            offset=int(args.get('offset', 0)), **filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+# JSON API: images are decoded from the request body and never written to uploads/
+def _api_flag(name, default=False):
+    value = request.values.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+def _api_slip_type():
+    slip_type = request.values.get('slip_type')
+    if slip_type not in ('e-slip', 'physical'):
+        raise ValueError("slip_type must be 'e-slip' or 'physical'")
+    return slip_type
+
+def _api_result(slip_type, filename, result, error=None, include_ocr=False):
+    # one image's JSON: bank, fields and per-stage timings (seconds), or the error
+    data = {'filename': filename, 'slip_type': slip_type, 'bank': None, 'fields': None, 'error': None, 'timings': {}}
+    if result is not None:
+        data['bank'] = normalize_bank(result.bank) if result.bank else None
+        data['fields'] = result.fields or None
+        data['timings'] = dict(result.timings)
+        if slip_type == 'e-slip':
+            data['match_score'] = result.match_score
+            data['ocr_confidence'] = result.ocr_confidence
+            error = error or result.error
+        else:
+            data['confidence'] = float(result.confidence)
+        if include_ocr:
+            data['raw_ocr'] = result.ocr_text if slip_type == 'e-slip' else result.raw_ocr
+    if error is None and not data['fields']:
+        error = 'No data extracted'
+    data['error'] = None if error is None else str(error)
+    return data
+
+def _api_extract(slip_type, images, use_cache):
+    # [(image, result, error)] in input order
+    if slip_type == 'e-slip':
+        return [(image, extract_info.process_image(image, use_cache=use_cache), None) for image in images]
+    if len(images) == 1:
+        try:
+            return [(images[0], physical_slip.extract_physical_slip(images[0], MODEL_PATH, use_cache=use_cache), None)]
+        except Exception as e:
+            return [(images[0], None, e)]
+    return list(physical_slip.process_physical_slips_batched(images, MODEL_PATH, use_cache=use_cache))
+
+@app.route('/api/v1/extract', methods=['POST'])
+def api_extract():
+    """Extract one slip: multipart field 'file' (or the raw request body) plus slip_type.
+
+    Optional: include_ocr=1 adds the raw OCR text, cache=1 uses the result cache.
+    """
+    t0 = time.perf_counter()
+    try:
+        slip_type = _api_slip_type()
+        upload = request.files.get('file')
+        data, filename = (upload.read(), upload.filename) if upload is not None else (request.get_data(), request.values.get('filename', ''))
+        if not data:
+            raise ValueError('No image in the request')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    image = DecodedImage(data, filename)
+    _, result, error = _api_extract(slip_type, [image], _api_flag('cache'))[0]
+    body = _api_result(slip_type, filename, result, error, _api_flag('include_ocr'))
+    body['timings']['request'] = time.perf_counter() - t0
+    return jsonify(body), 200 if body['error'] is None else 422
+
+@app.route('/api/v1/extract/batch', methods=['POST'])
+def api_extract_batch():
+    """Extract many slips of one slip_type from the multipart field 'files' (repeated)."""
+    t0 = time.perf_counter()
+    try:
+        slip_type = _api_slip_type()
+        uploads = request.files.getlist('files')
+        if not uploads:
+            raise ValueError("No images in the request (multipart field 'files')")
+        if len(uploads) > API_MAX_BATCH:
+            raise ValueError(f'At most {API_MAX_BATCH} images per batch')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    images = [DecodedImage(upload.read(), upload.filename) for upload in uploads]
+    include_ocr = _api_flag('include_ocr')
+    results = [_api_result(slip_type, image.name, result, error, include_ocr)
+               for image, result, error in _api_extract(slip_type, images, _api_flag('cache'))]
+    return jsonify({'slip_type': slip_type, 'count': len(results),
+                    'failed': sum(r['error'] is not None for r in results), 'results': results,
+                    'timings': {'request': time.perf_counter() - t0}})
+
+@app.route('/metrics/models')
+def model_metrics():
+    """Load and inference times of the shared slip detectors"""
+    return jsonify(get_detector_metrics())
+
+@app.route('/metrics/parsers')
+def parser_metrics():
+    """Call counts and parse times of the field extraction rule sets"""
+    return jsonify(get_parse_metrics())
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""Measure how bulk extraction scales with the number of worker processes.
+
+Run from the project root:
+    python -m benchmarks.bench_bulk_parallel [--glob "dataset/*/e-slip/*"] [--workers 1 2 4 8 16 32]
+
+For every worker count it runs the whole set through function.bulk_executor (result cache off),
+reports wall time, throughput, speed-up and parallel efficiency against the first worker count
+(one worker by default), and checks that every run extracted the same banks and fields.
+"""
+import os
+os.environ['RESULT_CACHE_PATH'] = '' # measure the pipeline, not the cache (inherited by the workers)
+
+import argparse
+import glob
+import time
+from function.bulk_executor import extract_files_parallel
+from function.e_slip.extract_info import BANK_LOGO_PATH
+
+def slip_type_of(path):
+    # dataset/<bank>/<e-slip|physical>/<file>
+    return 'physical' if path.replace('\\', '/').split('/')[-2] == 'physical' else 'e-slip'
+
+def fingerprint(result):
+    if result is None:
+        return None
+    return (result.bank, repr(result.fields))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--glob', default='dataset/*/e-slip/*')
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--repeat', type=int, default=1, help='process the file list this many times per run')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.glob)) * args.repeat
+    items = [(slip_type_of(p), p) for p in paths]
+    print(f"{len(items)} files, {os.cpu_count()} cores")
+
+    baseline_workers, baseline_time, baseline = None, None, None
+    for workers in args.workers:
+        t0 = time.perf_counter()
+        results = {}
+        errors = 0
+        for slip_type, path, result, error, seconds in extract_files_parallel(items, args.model, BANK_LOGO_PATH, workers=workers):
+            results.setdefault(path, fingerprint(result))
+            errors += error is not None
+        elapsed = time.perf_counter() - t0
+        if baseline_time is None:
+            baseline_workers, baseline_time, baseline = workers, elapsed, results
+        speedup = baseline_time / elapsed
+        same = sum(results.get(p) == baseline.get(p) for p in baseline)
+        print(f"  workers={workers:<3} time={elapsed:7.2f}s  {len(items) / elapsed:6.2f} files/s  "
+              f"speed-up={speedup:5.2f}x  efficiency={speedup * baseline_workers / workers:4.0%}  errors={errors}  "
+              f"same results as first run={same}/{len(baseline)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compare the PyTorch and exported ONNX slip detectors on the physical-slip dataset.
+
+Run from the project root (needs ultralytics, onnx and onnxruntime):
+    python -m benchmarks.bench_detector [--model models/best.pt] [--backends onnx onnx-int8]
+
+For every image it reports latency per backend and whether the top detection agrees with
+the PyTorch one (same class and IoU >= --iou).
+"""
+import argparse
+import glob
+import time
+from function.physical.detector import get_detector
+from function.physical.physical_slip import load_physical_image
+
+def load(path):
+    # same decoding and resizing as process_physical_slip
+    try:
+        return load_physical_image(path)
+    except ValueError:
+        return None
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='models/best.pt')
+    parser.add_argument('--glob', default='dataset/*/physical/*')
+    parser.add_argument('--backends', nargs='+', default=['onnx', 'onnx-int8'])
+    parser.add_argument('--iou', type=float, default=0.5)
+    args = parser.parse_args()
+
+    backends = ['pytorch'] + [b for b in args.backends if b != 'pytorch']
+    detectors = {b: get_detector(args.model, b) for b in backends}
+    latencies = {b: [] for b in backends}
+    agree = {b: 0 for b in backends}
+    n = 0
+
+    for path in sorted(glob.glob(args.glob)):
+        image = load(path)
+        if image is None:
+            continue
+        n += 1
+        tops = {}
+        for backend, detector in detectors.items():
+            t0 = time.perf_counter()
+            detections = detector.detect(image)
+            latencies[backend].append(time.perf_counter() - t0)
+            tops[backend] = detections[0] if detections else None
+        ref = tops['pytorch']
+        line = []
+        for backend in backends:
+            top = tops[backend]
+            same = (ref is None and top is None) or (ref is not None and top is not None and
+                                                     top.class_name == ref.class_name and iou(top.box, ref.box) >= args.iou)
+            agree[backend] += same
+            line.append(f"{backend}={top.class_name if top else None}:{top.confidence if top else 0:.2f}")
+        print(f"{path}: {' '.join(line)}")
+
+    print(f"\n{n} images")
+    for backend in backends:
+        lat = sorted(latencies[backend])
+        if not lat:
+            continue
+        mean = sum(lat) / len(lat) * 1000
+        p95 = lat[min(len(lat) - 1, int(0.95 * len(lat)))] * 1000
+        print(f"  {backend:<10} mean={mean:.1f} ms  p95={p95:.1f} ms  agreement with pytorch={agree[backend]}/{n}")
+
+if __name__ == '__main__':
+    main()
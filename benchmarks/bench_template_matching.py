@@ -0,0 +1,69 @@
+"""Compare exhaustive and pyramid template search on the e-slip dataset.
+
+Run from the project root:
+    python -m benchmarks.bench_template_matching [--glob "dataset/*/e-slip/*"]
+
+For every slip it runs the template-matching stage of annotation_bank in both modes and
+reports matchTemplate calls, wall time and whether both modes pick the same bank.
+"""
+import argparse
+import glob
+import time
+import cv2
+from function.e_slip.bank_annotation import match_scaled_templates, pyramid_template_matching, TEMPLATE_MATCH_THRESHOLD
+from function.e_slip.logo_index import get_logo_index
+from function.e_slip.preprocess import preprocess_slip_for_template_matching
+
+def classify(processed_img, index, search):
+    # template-matching stage only: first bank whose logo clears the threshold
+    calls = 0
+    for bank, templates in index.banks.items():
+        for template in templates:
+            if search == 'pyramid':
+                _, max_val, _, _, n = pyramid_template_matching(processed_img, template.scaled, template.coarse)
+            else:
+                _, max_val, _, _, n = match_scaled_templates(processed_img, template.scaled)
+            calls += n
+            if max_val > TEMPLATE_MATCH_THRESHOLD:
+                return bank, max_val, calls
+    return None, None, calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--glob', default='dataset/*/e-slip/*')
+    parser.add_argument('--logos', default='bank_logos')
+    args = parser.parse_args()
+
+    index = get_logo_index(args.logos)
+    paths = sorted(glob.glob(args.glob))
+    totals = {'exhaustive': [0, 0.0, 0], 'pyramid': [0, 0.0, 0]} # calls, seconds, correct
+    agree = 0
+
+    for path in paths:
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            continue
+        processed_img = preprocess_slip_for_template_matching(img)
+        truth = path.replace('\\', '/').split('/')[-3]
+        picks = {}
+        for search in totals:
+            t0 = time.perf_counter()
+            bank, score, calls = classify(processed_img, index, search)
+            totals[search][0] += calls
+            totals[search][1] += time.perf_counter() - t0
+            totals[search][2] += bank == truth
+            picks[search] = bank
+        agree += picks['exhaustive'] == picks['pyramid']
+        print(f"{path}: exhaustive={picks['exhaustive']} pyramid={picks['pyramid']}")
+
+    n = len(paths)
+    print(f"\n{n} slips, template stage only")
+    for search, (calls, seconds, correct) in totals.items():
+        print(f"  {search:<10} calls={calls:<6} ({calls / max(n, 1):.1f}/slip)  time={seconds:.2f}s  "
+              f"({seconds / max(n, 1) * 1000:.1f} ms/slip)  correct={correct}/{n}")
+    print(f"  same bank in both modes: {agree}/{n}")
+    if totals['pyramid'][1] > 0:
+        print(f"  speed-up: {totals['exhaustive'][1] / totals['pyramid'][1]:.1f}x")
+
+if __name__ == '__main__':
+    main()
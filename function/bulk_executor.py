@@ -0,0 +1,72 @@
+#  Process-pool executor for bulk extraction.
+#  Every worker process loads the slip detector, the logo template index and the OCR engines once
+#  in its initializer, then takes files from the pool's shared queue, so bulk runs scale with the
+#  number of cores instead of using one. BULK_WORKERS (default 1 = in-process) sets the degree of
+#  parallelism. Workers are spawned rather than forked: the web process runs threads (job queue,
+#  OCR pool, SQLite connections) that must not be copied into a child.
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', 1))
+
+def _init_worker(model_path, logo_path):
+    # one OCR handle per engine per worker, read by ocr_engine when it is first imported below
+    os.environ['OCR_POOL_SIZE'] = '1'
+    # one core per worker: keep OpenCV (and PyTorch, if used) from starting their own thread pools
+    import cv2
+    import numpy as np
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+    from function.e_slip.logo_index import get_logo_index
+    from function.e_slip.ocr_engine import get_ocr_engine
+    get_logo_index(logo_path)
+    blank = np.full((32, 32), 255, dtype=np.uint8)
+    for psm in (3, 6): # e-slip and physical-slip engines
+        try:
+            get_ocr_engine(lang='tha+eng', psm=psm).image_to_string(blank)
+        except Exception as e:
+            print(f"OCR warm-up failed in worker {os.getpid()}: {e}")
+    if os.path.exists(model_path):
+        from function.physical.detector import get_detector
+        get_detector(model_path)
+
+def _extract_file(slip_type, file_path, model_path):
+    # runs in a worker: (slip_type, file_path, result, error message, seconds)
+    t0 = time.perf_counter()
+    try:
+        if slip_type == 'e-slip':
+            from function.e_slip.extract_info import process_image
+            result = process_image(file_path)
+        else:
+            from function.physical.physical_slip import extract_physical_slip
+            result = extract_physical_slip(file_path, model_path)
+        return slip_type, file_path, result, None, time.perf_counter() - t0
+    except Exception as e:
+        return slip_type, file_path, None, str(e), time.perf_counter() - t0
+
+def extract_files_parallel(items, model_path, logo_path, workers=None, should_stop=None):
+    """Run [(slip_type, file_path)] on a pool of warm worker processes.
+
+    Yields (slip_type, file_path, result, error message, seconds) as files finish. Once
+    should_stop() returns True, files that have not started yet are dropped.
+    """
+    workers = workers or BULK_WORKERS
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(model_path, logo_path)) as pool:
+        futures = [pool.submit(_extract_file, slip_type, file_path, model_path) for slip_type, file_path in items]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+                if should_stop is not None and should_stop():
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
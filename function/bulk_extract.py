@@ -0,0 +1,334 @@
+#  Bulk extraction behind /extract_all_data.
+#  A manifest (app_extraction_csv/manifest.json) remembers size, mtime, content hash and the last
+#  result of every upload. In incremental mode only new or changed files go through the pipeline;
+#  everything else keeps its previous row, and the cumulative files are rebuilt from the manifest.
+#  Files that failed last time are retried on every run.
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+import pandas as pd
+from function.e_slip import extract_info
+from function.physical import physical_slip
+from function.result_cache import PIPELINE_VERSION, file_sha256, config_hash
+from function.rule_engine import rules_signature
+from function.months import THAI_MONTHS, FUZZY_MONTHS
+from function.bulk_executor import BULK_WORKERS, extract_files_parallel
+from function.result_sink import EXTENSIONS, check_format, open_sink
+from function.results_catalog import get_results_catalog
+from function.results_store import get_results_store, to_record
+
+# manifest rows made by other parser rules or month tables are re-processed, like other pipeline versions
+PARSERS_SIGNATURE = config_hash([rules_signature('e_slip'), rules_signature('physical'), THAI_MONTHS, FUZZY_MONTHS])
+
+BANK_CLASS_MAPPING = {
+            'bangkok bank': 'bangkok',
+            'bangkok': 'bangkok',
+            'bkk': 'bangkok',
+            'bbl': 'bangkok',
+            'kasikornbank': 'kbank',
+            'kbank': 'kbank',
+            'k-bank': 'kbank',
+            'kasikorn': 'kbank',
+            'kplus': 'kbank',
+            'k+': 'kbank',
+            'scb': 'scb',
+            'siam commercial bank': 'scb',
+            'siam commercial': 'scb',
+            'siam': 'scb',
+            'krungthai': 'krungthai',
+            'krungthai bank': 'krungthai',
+            'ktb': 'krungthai',
+            'krung thai': 'krungthai',
+            'krungthai_bank': 'krungthai'
+        }
+
+MANIFEST_NAME = 'manifest.json'
+RESULT_PREFIX = {'e-slip': 'e_slip_extraction', 'physical': 'physical_slip_extraction'}
+
+def normalize_bank(name):
+    return BANK_CLASS_MAPPING.get(name.lower() if name else '', name)
+
+def list_uploads(folder):
+    if not os.path.exists(folder):
+        return []
+    return sorted(f for f in os.listdir(folder) if not f.startswith('.') and os.path.isfile(os.path.join(folder, f)))
+
+def e_slip_row(filename, result):
+    # one CSV row for an EslipResult; raises ValueError (with result.error when set) when nothing was extracted
+    if not result.fields:
+        raise ValueError(result.error or "No data extracted")
+    row = dict(result.fields)
+    row['filename'] = filename
+    row['slip_type'] = 'e-slip'
+    row['processing_timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    row['detected_bank'] = normalize_bank(result.bank)
+    return row
+
+def physical_row(filename, result):
+    # one CSV row for a PhysicalSlipResult; raises ValueError when nothing was extracted
+    extracted_text = result.fields
+    if not extracted_text:
+        raise ValueError("No data extracted")
+    if isinstance(extracted_text, dict):
+        row = dict(extracted_text)
+    elif isinstance(extracted_text, list):
+        # Convert list of text lines to a single text field
+        row = {'extracted_text': '\n'.join([line for line in extracted_text if line.strip()])}
+    else:
+        row = {'extracted_text': str(extracted_text)}
+    row['filename'] = filename
+    row['slip_type'] = 'physical'
+    row['processing_timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    row['detected_bank'] = normalize_bank(result.bank)
+    row['confidence'] = result.confidence
+    return row
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {} # "<slip_type>/<filename>" -> {size, mtime_ns, sha256, pipeline_version, processed_at, row, error}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {path}: {e}")
+
+    def needs_processing(self, key, file_path):
+        """True if file_path is new, changed, failed last time or was parsed by another pipeline version or
+        other parser rules (hashes only when size/mtime moved)."""
+        entry = self.entries.get(key)
+        if entry is None or entry.get('error') or entry.get('pipeline_version') != PIPELINE_VERSION \
+                or entry.get('parsers') != PARSERS_SIGNATURE:
+            return True
+        st = os.stat(file_path)
+        if entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return False
+        sha = file_sha256(file_path)
+        if sha != entry['sha256']:
+            return True
+        # touched but identical content: remember the new mtime and keep the result
+        with self._lock:
+            entry['size'], entry['mtime_ns'] = st.st_size, st.st_mtime_ns
+        return False
+
+    def record(self, key, file_path, row=None, error=None):
+        st = os.stat(file_path)
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_sha256(file_path),
+                 'pipeline_version': PIPELINE_VERSION, 'parsers': PARSERS_SIGNATURE,
+                 'processed_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'row': row, 'error': error}
+        with self._lock:
+            self.entries[key] = entry
+
+    def prune(self, keys):
+        """Forget files that are no longer uploaded; returns their keys."""
+        with self._lock:
+            removed = [k for k in self.entries if k not in keys]
+            for k in removed:
+                del self.entries[k]
+        return removed
+
+    def keyed_rows(self):
+        return [(k, e['row']) for k, e in sorted(self.entries.items()) if e.get('row')]
+
+    def rows(self, slip_type):
+        prefix = f'{slip_type}/'
+        return [e['row'] for k, e in sorted(self.entries.items()) if k.startswith(prefix) and e.get('row')]
+
+    def save(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': self.entries}, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+
+@dataclass
+class BulkSummary:
+    incremental: bool
+    processed: dict = field(default_factory=lambda: {'e-slip': 0, 'physical': 0}) # extracted this run
+    skipped: int = 0              # unchanged since the last run
+    removed: int = 0              # dropped from the manifest because the upload is gone
+    failed_files: list = field(default_factory=list)
+    output_paths: list = field(default_factory=list)
+    cancelled: bool = False       # stopped early; files done so far are still merged
+
+    def to_dict(self):
+        return {'incremental': self.incremental, 'processed': dict(self.processed), 'skipped': self.skipped,
+                'removed': self.removed, 'failed_files': list(self.failed_files),
+                'output_files': [os.path.basename(p) for p in self.output_paths], 'cancelled': self.cancelled}
+
+    @property
+    def success_count(self):
+        return sum(self.processed.values())
+
+def _write_csv(rows, path):
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+def _write_rows(rows, path_without_ext, fmt):
+    # whole result set through a sink into a temporary file, swapped in when complete
+    directory, name = os.path.split(path_without_ext)
+    with open_sink(os.path.join(directory, f'.{name}.tmp'), fmt) as sink:
+        for row in rows:
+            sink.write(row)
+    path = path_without_ext + EXTENSIONS[fmt]
+    os.replace(sink.path, path)
+    return path
+
+def run_bulk_extraction(e_slip_folder, physical_folder, results_dir, model_path, incremental=True, progress=None, workers=None,
+                        output_format=None):
+    """Extract every upload (or only new/changed ones when incremental) and write the result set.
+
+    Rows extracted in this run are streamed to e_slip_extraction_<timestamp> and
+    physical_slip_extraction_<timestamp> as they are produced. The cumulative
+    *_extraction_all files are then rebuilt from the manifest. output_format is csv, ndjson or
+    parquet (default BULK_OUTPUT_FORMAT); the summary is always CSV.
+
+    workers > 1 (default BULK_WORKERS) spreads the files over that many warm worker processes.
+
+    progress, if given, is told the plan and each finished file (see function.jobs.Job) and can
+    stop the run between files through progress.cancelled().
+    """
+    output_format = check_format(output_format)
+    os.makedirs(results_dir, exist_ok=True)
+    workers = workers or BULK_WORKERS
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    manifest = Manifest(os.path.join(results_dir, MANIFEST_NAME))
+    summary = BulkSummary(incremental=incremental)
+    sinks = {} # slip_type -> sink for this run's rows, opened on the first row
+    store = get_results_store(results_dir)
+    store_changes = {'upsert': [], 'delete': []} # written to the store with each checkpoint
+
+    uploads = {'e-slip': [(f, os.path.join(e_slip_folder, f)) for f in list_uploads(e_slip_folder)],
+               'physical': [(f, os.path.join(physical_folder, f)) for f in list_uploads(physical_folder)]}
+    removed_keys = manifest.prune({f'{slip_type}/{f}' for slip_type, files in uploads.items() for f, _ in files})
+    summary.removed = len(removed_keys)
+    store_changes['delete'].extend(removed_keys)
+    if store.count() == 0:
+        # first run with the store (or it was deleted): index every result the manifest already has
+        store_changes['upsert'].extend(to_record(k, row, normalize_bank) for k, row in manifest.keyed_rows())
+
+    todo, skipped_keys = {}, []
+    for slip_type, files in uploads.items():
+        todo[slip_type] = []
+        for filename, file_path in files:
+            if incremental and not manifest.needs_processing(f'{slip_type}/{filename}', file_path):
+                skipped_keys.append(f'{slip_type}/{filename}')
+            else:
+                todo[slip_type].append((filename, file_path))
+    summary.skipped = len(skipped_keys)
+    if progress is not None:
+        progress.plan([f'{slip_type}/{f}' for slip_type, files in todo.items() for f, _ in files], skipped_keys)
+
+    def stop_requested():
+        summary.cancelled = summary.cancelled or (progress is not None and progress.cancelled())
+        return summary.cancelled
+
+    def checkpoint():
+        manifest.save()
+        store.upsert_many(store_changes['upsert'])
+        store.delete(store_changes['delete'])
+        store_changes['upsert'], store_changes['delete'] = [], []
+
+    def emit(slip_type, row):
+        sink = sinks.get(slip_type)
+        if sink is None:
+            sink = open_sink(os.path.join(results_dir, f'{RESULT_PREFIX[slip_type]}_{timestamp}'), output_format)
+            sinks[slip_type] = sink
+            summary.output_paths.append(sink.path)
+        sink.write(row)
+        if sink.count % sink.flush_every == 0:
+            checkpoint() # together with the flushed rows; a re-run resumes from here
+
+    def record(slip_type, filename, file_path, make_row, result, error, seconds=None):
+        key = f'{slip_type}/{filename}'
+        try:
+            if error is not None:
+                raise error
+            row = make_row(filename, result)
+        except Exception as e:
+            row, error_msg = None, str(e)
+            summary.failed_files.append(f"{slip_type}: {filename} - Error: {error_msg}")
+            manifest.record(key, file_path, error=error_msg)
+            store_changes['delete'].append(key)
+        else:
+            error_msg = None
+            summary.processed[slip_type] += 1
+            manifest.record(key, file_path, row=row)
+            store_changes['upsert'].append(to_record(key, row, normalize_bank))
+            emit(slip_type, row)
+        if progress is not None:
+            progress.file_done(key, error_msg, seconds)
+
+    try:
+        if workers > 1:
+            # warm worker processes, one file at a time each, rows written as files finish
+            names = {path: filename for files in todo.values() for filename, path in files}
+            items = [(slip_type, path) for slip_type, files in todo.items() for _, path in files]
+            for slip_type, file_path, result, error, seconds in extract_files_parallel(
+                    items, model_path, extract_info.BANK_LOGO_PATH, workers=workers, should_stop=stop_requested):
+                make_row = e_slip_row if slip_type == 'e-slip' else physical_row
+                record(slip_type, names[file_path], file_path, make_row, result,
+                       RuntimeError(error) if error else None, seconds)
+        else:
+            # Process E-slips
+            for filename, file_path in todo['e-slip']:
+                if stop_requested():
+                    break
+                t0 = time.perf_counter()
+                try:
+                    result = extract_info.process_image(file_path)
+                    record('e-slip', filename, file_path, e_slip_row, result, None, time.perf_counter() - t0)
+                except Exception as e:
+                    record('e-slip', filename, file_path, e_slip_row, None, e, time.perf_counter() - t0)
+
+            # Process Physical slips: decode, detect in batches of PHYSICAL_BATCH_SIZE, then OCR each slip on a thread pool
+            names = {path: filename for filename, path in todo['physical']}
+            if names and not stop_requested():
+                batches = physical_slip.process_physical_slips_batched(list(names), model_path)
+                try:
+                    for file_path, result, error in batches:
+                        seconds = sum(result.timings.values()) if result is not None else None
+                        record('physical', names[file_path], file_path, physical_row, result, error, seconds)
+                        if stop_requested():
+                            break
+                finally:
+                    batches.close() # stops the decode thread and the OCR pool early on cancel
+    finally:
+        for sink in sinks.values():
+            sink.close()
+        checkpoint()
+
+    # cumulative result set: every upload's last successful row
+    for slip_type, prefix in RESULT_PREFIX.items():
+        rows = manifest.rows(slip_type)
+        path = os.path.join(results_dir, f'{prefix}_all')
+        if rows:
+            summary.output_paths.append(_write_rows(rows, path, output_format))
+        elif os.path.exists(path + EXTENSIONS[output_format]):
+            os.remove(path + EXTENSIONS[output_format])
+
+    # Create a summary report
+    summary_data = {
+        'processing_timestamp': [datetime.now().strftime("%Y-%m-%d %H:%M:%S")],
+        'mode': [('incremental' if incremental else 'full') + (' (cancelled)' if summary.cancelled else '')],
+        'total_e_slips_processed': [summary.processed['e-slip']],
+        'total_physical_slips_processed': [summary.processed['physical']],
+        'total_files_processed': [summary.success_count],
+        'total_files_skipped': [summary.skipped],
+        'total_files_removed': [summary.removed],
+        'total_failed_files': [len(summary.failed_files)],
+        'failed_files_list': ['; '.join(summary.failed_files) if summary.failed_files else 'None']
+    }
+    summary.output_paths.append(_write_csv(summary_data, os.path.join(results_dir, f'extraction_summary_{timestamp}.csv')))
+
+    # keep the results catalogue behind /view_results current
+    catalog = get_results_catalog(results_dir)
+    for path in summary.output_paths:
+        catalog.register(path, save=False)
+    catalog.sync() # drops files the run removed
+    catalog.save()
+    return summary
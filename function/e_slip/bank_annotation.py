@@ -1,27 +1,34 @@
 import cv2
 import numpy as np
 import os 
-from function.e_slip.preprocess import preprocess_bank_slip_for_template_matching
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from function.e_slip.preprocess import (preprocess_bank_slip_for_template_matching, preprocess_slip_for_template_matching,
+                                        SLIP_MATCH_WIDTH)
+from function.image_io import DecodedImage
+from function.e_slip.logo_index import (LogoTemplateIndex, get_logo_index, scale_template, downsample_templates,
+                                        FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS, PYRAMID_DOWNSAMPLE)
 
-def multi_scale_template_matching(image, template, scales=[0.5, 0.75, 1.0, 1.25, 1.5]):
+TEMPLATE_MATCH_THRESHOLD = 0.7
+TEMPLATE_SEARCH = 'pyramid' # 'pyramid' (coarse-to-fine) or 'exhaustive' (every scale on the full image)
+BANK_MATCH_WORKERS = int(os.environ.get('BANK_MATCH_WORKERS', 1)) # >1 scores banks in parallel
+
+def match_scaled_templates(image, scaled_templates):
+    # image is already preprocessed, scaled_templates = [(scale, resized template)]
     best_max_val = -1
     best_max_loc = None
     best_scale = 1.0
-    
-    image, template = preprocess_bank_slip_for_template_matching(image, template)
-    
-    for scale in scales:
-        # Resize template
-        width = int(template.shape[1] * scale)
-        height = int(template.shape[0] * scale)
-        resized_template = cv2.resize(template, (width, height))
-        
+    best_resized_template = None
+    calls = 0
+
+    for scale, resized_template in scaled_templates:
         # Skip if template is larger than image
         if resized_template.shape[0] > image.shape[0] or resized_template.shape[1] > image.shape[1]:
             continue
             
         # Perform template matching
         result = cv2.matchTemplate(image, resized_template, cv2.TM_CCOEFF_NORMED)
+        calls += 1
         min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
         
         # Update best match if current match is better
@@ -31,21 +38,89 @@ def multi_scale_template_matching(image, template, scales=[0.5, 0.75, 1.0, 1.25,
             best_scale = scale
             best_resized_template = resized_template
 
+    return best_scale, best_max_val, best_max_loc, best_resized_template, calls
+
+def pyramid_template_matching(image, scaled_templates, coarse_templates=None, threshold=TEMPLATE_MATCH_THRESHOLD,
+                              downsample=PYRAMID_DOWNSAMPLE, candidates=2):
+    """Coarse-to-fine search: sweep every scale on a downsampled image, then re-match the best
+    coarse scales and their neighbours at full resolution inside a window around the coarse hit.
+    Stops as soon as a full-resolution score clears threshold. Same return value as match_scaled_templates.
+    """
+    if coarse_templates is None:
+        coarse_templates = downsample_templates(scaled_templates, downsample)
+    calls = 0
+
+    # coarse scale sweep
+    small = cv2.resize(image, None, fx=downsample, fy=downsample, interpolation=cv2.INTER_AREA)
+    coarse = []
+    for i, (scale, template) in enumerate(coarse_templates):
+        if template.shape[0] > small.shape[0] or template.shape[1] > small.shape[1]:
+            continue
+        result = cv2.matchTemplate(small, template, cv2.TM_CCOEFF_NORMED)
+        calls += 1
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        coarse.append((max_val, i, max_loc))
+    if not coarse:
+        return match_scaled_templates(image, scaled_templates)
+    coarse.sort(key=lambda c: c[0], reverse=True)
+
+    # local refinement around the best scale(s) and location(s)
+    best_max_val, best_max_loc, best_scale, best_resized_template = -1, None, 1.0, None
+    tried = set()
+    for _, i, (cx, cy) in coarse[:candidates]:
+        for j in (i, i - 1, i + 1):
+            if j in tried or j < 0 or j >= len(scaled_templates):
+                continue
+            tried.add(j)
+            scale, template = scaled_templates[j]
+            th, tw = template.shape[:2]
+            if th > image.shape[0] or tw > image.shape[1]:
+                continue
+            margin = int(0.25 * max(th, tw)) + int(2 / downsample)
+            x0 = min(max(0, int(cx / downsample) - margin), image.shape[1] - tw)
+            y0 = min(max(0, int(cy / downsample) - margin), image.shape[0] - th)
+            x1 = min(image.shape[1], x0 + tw + 2 * margin)
+            y1 = min(image.shape[0], y0 + th + 2 * margin)
+            result = cv2.matchTemplate(image[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            calls += 1
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            if max_val > best_max_val:
+                best_max_val = max_val
+                best_max_loc = (x0 + max_loc[0], y0 + max_loc[1])
+                best_scale = scale
+                best_resized_template = template
+            if best_max_val > threshold:
+                return best_scale, best_max_val, best_max_loc, best_resized_template, calls
+
+    return best_scale, best_max_val, best_max_loc, best_resized_template, calls
+
+def multi_scale_template_matching(image, template, scales=[0.5, 0.75, 1.0, 1.25, 1.5], search='exhaustive', return_calls=False):
+    image, template = preprocess_bank_slip_for_template_matching(image, template)
+    
+    scaled_templates = scale_template(template, scales)
+    if search == 'pyramid':
+        best_scale, best_max_val, best_max_loc, best_resized_template, calls = pyramid_template_matching(image, scaled_templates)
+    else:
+        best_scale, best_max_val, best_max_loc, best_resized_template, calls = match_scaled_templates(image, scaled_templates)
+
     box_image = image.copy()
     # convert to rgb
     box_image = cv2.cvtColor(box_image, cv2.COLOR_GRAY2BGR)
     # draw box
-    cv2.rectangle(
-        box_image, 
-        best_max_loc, 
-        (best_max_loc[0] + best_resized_template.shape[1], best_max_loc[1] + best_resized_template.shape[0]), 
-        (0, 255, 0), 
-        2
-    )
+    if best_resized_template is not None:
+        cv2.rectangle(
+            box_image, 
+            best_max_loc, 
+            (best_max_loc[0] + best_resized_template.shape[1], best_max_loc[1] + best_resized_template.shape[0]), 
+            (0, 255, 0), 
+            2
+        )
     
+    if return_calls:
+        return best_scale, best_max_val, best_max_loc, box_image, calls
     return best_scale, best_max_val, best_max_loc, box_image
 
-def flann_matching(image, object):
+def flann_matching(image, object, draw=False):
     # Initiate SIFT detector
     sift = cv2.SIFT_create()
     
@@ -72,59 +147,149 @@ def flann_matching(image, object):
             matchesMask[i]=[1,0]
             good_matches.append(m)
     
-    draw_params = dict(matchColor = (0,255,0),
-                    singlePointColor = (255,0,0),
-                    matchesMask = matchesMask,
-                    flags = cv2.DrawMatchesFlags_DEFAULT)
-    
-    result = cv2.drawMatchesKnn(object,kp2,image,kp1,matches,None,**draw_params)
+    # visualisation is only rendered on request
+    result = None
+    if draw:
+        draw_params = dict(matchColor = (0,255,0),
+                        singlePointColor = (255,0,0),
+                        matchesMask = matchesMask,
+                        flags = cv2.DrawMatchesFlags_DEFAULT)
+        
+        result = cv2.drawMatchesKnn(object,kp2,image,kp1,matches,None,**draw_params)
 
     return result, len(good_matches)
 
-def annotation_bank(img, template_path):
-    objects = os.listdir(template_path)
+def flann_vote(image, index):
+    """Describe the slip once and score every logo with a single knn query.
+
+    All logo descriptors are matched in one call against a FLANN index of the slip; good
+    matches are voted to their logo by label, so a logo's votes equal the good-match count
+    flann_matching would give it. Returns {bank: votes of its best logo}.
+    """
+    if index.descriptors is None:
+        return {}
+
+    sift = cv2.SIFT_create()
+    _, des = sift.detectAndCompute(image, None)
+    if des is None or len(des) < 2:
+        return {}
+
+    flann = cv2.FlannBasedMatcher(FLANN_INDEX_PARAMS, FLANN_SEARCH_PARAMS)
+    matches = flann.knnMatch(index.descriptors, des, k=2)
+
+    good = np.zeros(len(index.labelled_templates), dtype=int)
+    for pair in matches:
+        if len(pair) < 2:
+            continue
+        m, n = pair
+        # ratio test as per Lowe's paper
+        if m.distance < 0.7*n.distance:
+            good[index.labels[m.queryIdx]] += 1
+
+    votes = {}
+    for template, count in zip(index.labelled_templates, good):
+        votes[template.bank] = max(votes.get(template.bank, 0), int(count))
+    return votes
+
+def _score_bank(processed_img, templates, search, stop=None):
+    # best template-matching value over one bank's logos; gives up early once stop is set
+    best_max_val = -1
+    for template in templates:
+        if stop is not None and stop.is_set():
+            break
+        if search == 'pyramid':
+            _, max_val, _, _, _ = pyramid_template_matching(processed_img, template.scaled, template.coarse)
+        else:
+            _, max_val, _, _, _ = match_scaled_templates(processed_img, template.scaled)
+        best_max_val = max(best_max_val, max_val)
+        if best_max_val > TEMPLATE_MATCH_THRESHOLD:
+            break
+    return best_max_val
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _get_executor(workers):
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bank-match')
+        return _executors[workers]
+
+def _score_banks_parallel(processed_img, index, search, workers):
+    # OpenCV releases the GIL, so banks really are scored at the same time.
+    # Returns {bank: score} with the same winner as the sequential loop: the first bank in logo
+    # order that clears the threshold. A passing bank stops the banks after it in logo order (they
+    # cannot win any more); the banks before it are always waited for.
+    banks = list(index.banks)
+    stops = {bank: threading.Event() for bank in banks}
+    executor = _get_executor(workers)
+    futures = {executor.submit(_score_bank, processed_img, index.banks[bank], search, stops[bank]): bank
+               for bank in banks}
+    scores = {}
+    for future in as_completed(futures):
+        if future.cancelled():
+            continue
+        bank = futures[future]
+        scores[bank] = future.result()
+        if scores[bank] > TEMPLATE_MATCH_THRESHOLD:
+            for later, other in futures.items():
+                if banks.index(other) > banks.index(bank):
+                    stops[other].set()
+                    later.cancel()
+    return scores
+
+def annotation_bank(img, template_path, return_score=False, search=None, workers=None):
+    # template_path: bank_logos folder or a prebuilt LogoTemplateIndex (no disk reads per call)
+    # return_score=True -> (bank, score); score is the template-matching value when a logo
+    # clears 0.7, otherwise the bank's FLANN votes (see flann_vote)
+    # search: 'pyramid' or 'exhaustive' template search, defaults to TEMPLATE_SEARCH
+    # workers: >1 scores all banks concurrently on a shared thread pool, defaults to BANK_MATCH_WORKERS
+    search = search or TEMPLATE_SEARCH
+    workers = workers or BANK_MATCH_WORKERS
+    index = template_path if isinstance(template_path, LogoTemplateIndex) else get_logo_index(template_path)
     best_match = (0, None)
-    best_max_val = 0
 
-    if isinstance(img, str):
+    decoded = None
+    if isinstance(img, DecodedImage):
+        # matching works on a 1000px-wide copy, so a large JPEG can be decoded at a fraction of its size
+        decoded = img
+        img = decoded.gray_reduced(decoded.reduction_for(SLIP_MATCH_WIDTH / decoded.size[0]))
+    elif isinstance(img, str):
         img = cv2.imread(img, cv2.IMREAD_GRAYSCALE)
     elif isinstance(img, np.ndarray):
         img = img
     else:
         print(f"Error: Invalid image path or type: {type(img)}")
-        return None
-
-    for object in objects:
-
-        banks = os.listdir(os.path.join(template_path, object))
+        return (None, 0) if return_score else None
 
-        for bank in banks:
-            temp = os.path.join(template_path, object, bank)
-            template_img = cv2.imread(temp, cv2.IMREAD_GRAYSCALE)
+    # the slip only needs to be preprocessed once for every template
+    processed_img = preprocess_slip_for_template_matching(img)
 
-            print(f'template: {bank}')
-
-            print(f'    - Template Matching Method')
-            scales = np.arange(0.1, 2.0, 0.1)
-            best_scale, best_max_val, best_max_loc, box_image = multi_scale_template_matching(img, template_img, scales)
-            print(f'        Best scale: {float(best_scale):.1f}')
-            print(f'        Best max value: {float(best_max_val):.4f}')
-            if best_max_val > 0.7:
-                best_match = (best_max_val, object)
+    print(f'    - Template Matching Method')
+    if workers > 1 and len(index.banks) > 1:
+        scores = _score_banks_parallel(processed_img, index, search, workers)
+    else:
+        scores = {}
+        for object, templates in index.banks.items():
+            scores[object] = _score_bank(processed_img, templates, search)
+            if scores[object] > TEMPLATE_MATCH_THRESHOLD:
                 break
 
-            # flann matching
-            print(f'    - Flann Matching Method')
-            flann_result, flann_good_match = flann_matching(img, template_img)
-            print(f'        flann good match: {flann_good_match}')
-                
+    # first bank in logo order that clears the threshold, whichever way the banks were scored
+    for object in index.banks:
+        if scores.get(object, -1) > TEMPLATE_MATCH_THRESHOLD:
+            best_match = (scores[object], object)
+            break
+
+    if best_match[1] is None:
+        # no logo cleared the template threshold -> one FLANN vote over all logos
+        print(f'    - Flann Matching Method')
+        votes = flann_vote(decoded.gray if decoded is not None else img, index)
+        print(f'        flann votes: {votes}')
+        for object, flann_good_match in votes.items():
             if flann_good_match > best_match[0]:
                 best_match = (flann_good_match, object)
-
-            if best_match[0] > 50:
-                break
-
-        if best_match[0] > 50 or best_max_val > 0.7:
-            break
     
+    if return_score:
+        return best_match[1], best_match[0]
     return best_match[1]
@@ -1,41 +1,14 @@
 import re
+import time
+from dataclasses import dataclass, field, asdict
 import pandas as pd # Import pandas for DataFrame conversion
+from function.rule_engine import register_transform, register_hook, load_rulesets, find_ruleset, rules_signature
+from function.months import MONTHS, THAI_MONTHS, FUZZY_MONTHS, MonthTable, normalize_year as _normalize_year
 
 BANK_LOGO_PATH = r'bank_logos'
 
 def get_thai_month_map():
-    return {
-        "ม.ค.": "01", "ก.พ.": "02", "มี.ค.": "03", "เม.ย.": "04",
-        "พ.ค.": "05", "มิ.ย.": "06", "ก.ค.": "07", "ส.ค.": "08",
-        "ก.ย.": "09", "ต.ค.": "10", "พ.ย.": "11", "ธ.ค.": "12",
-        "ม.ค": "01", "ก.พ": "02", "มี.ค": "03", "เม.ย": "04",
-        "พ.ค": "05", "มิ.ย": "06", "ก.ค": "07", "ส.ค": "08",
-        "ก.ย": "09", "ต.ค": "10", "พ.ย": "11", "ธ.ค": "12",
-        "มค.": "01", "กพ.": "02", "มีค.": "03", "เมย.": "04",
-        "พค.": "05", "มิย.": "06", "กค.": "07", "สค.": "08",
-        "กย.": "09", "ตค.": "10", "พย.": "11", "ธค.": "12",
-        "มค": "01", "กพ": "02", "มีค": "03", "เมย": "04",
-        "พค": "05", "มิย": "06", "กค": "07", "สค": "08",
-        "กย": "09", "ตค": "10", "พย": "11", "ธค": "12",
-        "ก.ุพ.": "02", "ก.ุพ": "02", "ก.พ.": "02",
-        "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04",
-        "May": "05", "Jun": "06", "Jul": "07", "Aug": "08",
-        "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12"
-    }
-
-def _normalize_year(year_str):
-    try:
-        year = int(year_str)
-        if year < 100:
-            if year > 50:
-                year += 2500
-            else:
-                year += 2000
-        if year > 2500:
-            year -= 543
-        return year
-    except ValueError:
-        return None
+    return THAI_MONTHS # built once in function.months; MONTHS is the folded lookup table over it
 
 def _clean_name(name_str):
     if name_str:
@@ -43,54 +16,97 @@ def _clean_name(name_str):
         return name_str.strip()
     return None
 
-# --- Bank-Specific Extraction Functions ---
+# --- Bank-Specific Extraction ---
+# Field rules per bank are data (function/rules/e_slip/<bank>.json, see function.rule_engine); the
+# transforms and hooks below are the parts of a slip layout a single regex cannot express.
 
-def _extract_bangkok_info(ocr_text: str, thai_month_map: dict) -> dict:
-    res = {
-        'transaction_date': None, 'transaction_time': None, 'amount': None,
-        'from_account_name': None, 'to_account_name': None, 'to_bank': None, 'ref_number': None
-    }
-    
-    # Date and Time
-    match_dt_a = re.search(r"(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{2,4})[,\s]+(\d{2}:\d{2})", ocr_text, re.IGNORECASE)
-    if match_dt_a:
-        date_str_capture, time_str_capture = match_dt_a.groups()
-        try:
-            parts = date_str_capture.split()
-            day_val = int(parts[0])
-            month_abbr = parts[1][:3].capitalize()
-            year_val = _normalize_year(parts[2])
-            month_num_str = thai_month_map.get(month_abbr)
-            if year_val and month_num_str:
-                res['transaction_date'] = f"{year_val}-{month_num_str}-{day_val:02d}"
-                res['transaction_time'] = time_str_capture
-        except Exception:
-            pass # Date/time parsing failed
+@register_transform('account_name')
+def _account_name(name, context):
+    return _clean_name(name)
 
-    # Amount
-    amount_match = re.search(r"Amount\s+([“\-”,\d]+\.\d{2})\s*(?:tHe|THB|tie|tne)", ocr_text)
-    if amount_match:
-        try:
-            res['amount'] = float(amount_match.group(1).replace(",", "").replace("“", "").replace("”", ""))
-        except ValueError:
-            pass
-
-    # Reference Number
-    ref_match_main = re.search(r"Transaction reference\s*([A-Z0-9]{10,})", ocr_text)
-    if ref_match_main:
-        res['ref_number'] = ref_match_main.group(1).strip()
-    else:
-        ref_match_bank = re.search(r"Bank reference no\.\s*(\d+)", ocr_text)
-        if ref_match_bank:
-            res['ref_number'] = ref_match_bank.group(1).strip()
+@register_transform('english_month_date')
+def _english_month_date(match, context):
+    # "05 Apr 2025, 14:30" -> ("2025-04-05", "14:30")
+    date_str_capture, time_str_capture = match.groups()
+    try:
+        parts = date_str_capture.split()
+        day_val = int(parts[0])
+        year_val = _normalize_year(parts[2])
+        month_num_str = context['months'].lookup(parts[1][:3])
+        if year_val and month_num_str:
+            return f"{year_val}-{month_num_str}-{day_val:02d}", time_str_capture
+    except Exception:
+        pass # Date/time parsing failed
+    return None
 
-    # From Account Name
-    from_match = re.search(r"(?:From\s+)?©\s*(.*?)(?:\n|\s{2,}|Bangkok Bank)", ocr_text)
-    if from_match:
-        res['from_account_name'] = _clean_name(from_match.group(1))
+@register_transform('kbank_date')
+def _kbank_date(match, context):
+    day_str, thai_month_input, year_str, time_val = match.groups()
+    try:
+        day_val = int(day_str)
+        month_key = thai_month_input.strip() # "มีค.", "มี.ค", "ก.ุพ." all fold to one key
+        month_num_str = context['months'].lookup(month_key)
+        if not month_num_str and len(month_key) == 3 and month_key[1] != '.': # stray third character, e.g. "สคร"
+            month_num_str = context['months'].lookup(month_key[:2])
+
+        year_val = _normalize_year(year_str)
+        if year_val and month_num_str:
+            return f"{year_val}-{month_num_str}-{day_val:02d}", time_val
+    except Exception:
+        pass
+    return None
+
+@register_transform('scb_date')
+def _scb_date(match, context):
+    date_str_capture, time_str_capture = match.groups()
+    try:
+        parts = date_str_capture.split()
+        day_val = int(parts[0])
+        # "เม.ย." / "เมย", garbled forms like "wig." for "เม.ย.", else the first 2 chars of an abbreviation
+        month_num_str = context['months'].lookup(parts[1], prefix=True)
+
+        year_val = _normalize_year(parts[2])
+        if year_val and month_num_str:
+            return f"{year_val}-{month_num_str}-{day_val:02d}", time_str_capture
+    except Exception:
+        pass
+    return None
+
+@register_transform('krungthai_date')
+def _krungthai_date(match, context):
+    # Example: "01 เม.ย. 2568 - 18:41" or "01 w.A. 2565 - 23:53" (w.A. for พ.ค.)
+    date_str_capture, time_str_capture = match.groups()
+    try:
+        parts = date_str_capture.split()
+        day_val = int(parts[0])
+        month_num_str = context['months'].lookup(parts[1], prefix=True)
+
+        year_val = _normalize_year(parts[2])
+        if year_val and month_num_str:
+            return f"{year_val}-{month_num_str}-{day_val:02d}", time_str_capture
+    except Exception:
+        pass
+    return None
 
+@register_transform('scb_from_name')
+def _scb_from_name(name_candidate, context):
+    name_candidate = name_candidate.strip()
+    if "PLANET SCB" in name_candidate: return "PLANET SCB"
+    return _clean_name(name_candidate)
+
+@register_transform('krungthai_from_name')
+def _krungthai_from_name(name_candidate, context):
+    if "Krungthai" not in name_candidate and "รหัสอ้างอิง" not in name_candidate and "G-Wallet" not in name_candidate and len(name_candidate) > 3:
+        return _clean_name(name_candidate)
+    return None
+
+_BANGKOK_TO_BLOCK = re.compile(r"(?:@|To)\s*(.*?)(?:\n\s*\S{3,}-\S{1,}-\S{3,}|\n\s*Biller ID|\n\s*Bank reference no|PromptPay|Kasikornbank|Siam Commercial Bank|Kiatnakin Phatra Bank|ttb|\d{3,}-\d{1,}-\d{3,})", re.DOTALL)
+_BANGKOK_LINE_MAN = re.compile(r"น\s*(LINE MAN.*?)(?:\nBiller|\(QR by ttb\))")
+
+@register_hook('bangkok_recipient')
+def _bangkok_recipient(ocr_text, res, context):
     # To Account Name and To Bank
-    to_block_match = re.search(r"(?:@|To)\s*(.*?)(?:\n\s*\S{3,}-\S{1,}-\S{3,}|\n\s*Biller ID|\n\s*Bank reference no|PromptPay|Kasikornbank|Siam Commercial Bank|Kiatnakin Phatra Bank|ttb|\d{3,}-\d{1,}-\d{3,})", ocr_text, re.DOTALL)
+    to_block_match = _BANGKOK_TO_BLOCK.search(ocr_text)
     if to_block_match:
         block_content = to_block_match.group(1).strip()
         to_account_name_candidate = block_content.split('\n')[0].strip()
@@ -108,74 +124,45 @@ def _extract_bangkok_info(ocr_text: str, thai_month_map: dict) -> dict:
                (res['to_account_name'] and kw.lower() in res['to_account_name'].lower()):
                 res['to_bank'] = bank_name
                 if kw == "LINE MAN (QR by ttb)": # Special case for LINE MAN
-                    lm_match = re.search(r"น\s*(LINE MAN.*?)(?:\nBiller|\(QR by ttb\))", ocr_text)
+                    lm_match = _BANGKOK_LINE_MAN.search(ocr_text)
                     if lm_match: res['to_account_name'] = _clean_name(lm_match.group(1).strip())
                 break
     if not res['to_account_name']:
-        line_man_match = re.search(r"น\s*(LINE MAN.*?)(?:\nBiller|\(QR by ttb\))", ocr_text)
+        line_man_match = _BANGKOK_LINE_MAN.search(ocr_text)
         if line_man_match:
             res['to_account_name'] = _clean_name(line_man_match.group(1).strip())
             if "ttb" in res['to_account_name'] or "ttb" in ocr_text: res['to_bank'] = "ttb"
-            
-    return res
 
-def _extract_kbank_info(ocr_text: str, thai_month_map: dict) -> dict:
-    res = {
-        'transaction_date': None, 'transaction_time': None, 'amount': None,
-        'from_account_name': None, 'to_account_name': None, 'to_bank': None, 'ref_number': None
-    }
+_KBANK_ACCOUNT = re.compile(r"XXX-X-X\d{3,6}-X")
+_KBANK_DATE_LINE = re.compile(r"\d{1,2}\s*[ก-ฮ]+\.")
+_KBANK_TIME = re.compile(r"(\d{2}:\d{2})\s*(?:น\.|u\.)")
+# Pattern 1: Direct Transfer (Name \n Bank/PromptPay)
+# (Name line) \n (Bank line OR PromptPay line OR another name line for billers)
+# Avoid capturing "เลขที่รายการ" or amount lines as name
+# ([^\n]+?) -> Non-greedy name capture
+# (?:XXX-X-X\d{3,6}-X|รหัสพร้อมเพย์|Pay|ธ\.[ก-ฮฯ]+|Shop|Wallet|บจก\.|หจก\.|[A-Z\s]{5,}) -> Bank indicator
+_KBANK_TO_TRANSFER = re.compile(
+    r"([^\n]+?)\n\s*(?:(XXX-X-X\d{3,6}-X)|(ธ\.[ก-ฮฯ\s]+(?:ไทย|พาณิชย์|กรุงศรี)?)|รหัสพร้อมเพย์|Prompt\s*Pay|Payee ID|([A-Z\s]{5,}[Ss]hop)|[A-Z\s]+Wallet|บจก\.|หจก\.)",
+    re.IGNORECASE
+)
+# Pattern 2: Bill Payment / QR Payment (often 1-2 lines for recipient name, then "เลขที่รายการ" or "N hin" or Ref No.)
+_KBANK_BILLER = re.compile(
+    r"([^\n]+)\s*(?:\n\s*([^\n]+))?\s*\n+(?:เลขที่รายการ|N\s+hin|Ref No\.|รหัสอ้างอิง|20\d{10,})", # 20... is QR payment ref
+    re.MULTILINE
+)
+_KBANK_REF_LINE = re.compile(r"\d{10,}")
+
+@register_hook('kbank_accounts')
+def _kbank_accounts(ocr_text, res, context):
     lines = [line.strip() for line in ocr_text.split('\n') if line.strip()]
 
-    # Date and Time
-    match_dt_b = re.search(r"(\d{1,2})\s*([ก-ฮ]+\.(?:[คมย]|พฤศจิกายน|มิถุนายน)\.|[ก-ฮ]\.[ก-ฮุ]\.|[ก-ฮ]{2,3}(?:\.|\s))\s*(\d{2,4})\s+(\d{2}:\d{2})\s*(?:น\.|u\.)", ocr_text)
-    if match_dt_b:
-        day_str, thai_month_input, year_str, time_val = match_dt_b.groups()
-        try:
-            day_val = int(day_str)
-            # Normalize month input (e.g., "มีค." to "มี.ค.", "ก.ุพ." to "ก.ุพ.")
-            month_key_to_lookup = thai_month_input.strip()
-            if not month_key_to_lookup.endswith('.') and len(month_key_to_lookup) > 1 and month_key_to_lookup not in thai_month_map :
-                if len(month_key_to_lookup) == 3 and month_key_to_lookup[1] != '.': # e.g. มีค
-                     month_key_to_lookup = f"{month_key_to_lookup[0]}.{month_key_to_lookup[1]}."
-                elif not month_key_to_lookup.endswith('.'):
-                     month_key_to_lookup += "."
-
-
-            month_num_str = thai_month_map.get(month_key_to_lookup)
-            if not month_num_str and '.' in month_key_to_lookup: # try without last dot if common like ก.พ
-                 month_num_str = thai_month_map.get(month_key_to_lookup[:-1])
-
-
-            year_val = _normalize_year(year_str)
-            if year_val and month_num_str:
-                res['transaction_date'] = f"{year_val}-{month_num_str}-{day_val:02d}"
-                res['transaction_time'] = time_val
-        except Exception:
-            pass
-
-    # Amount
-    amount_match = re.search(r"จํานวน(?:เงิน)?:\s*([,\d]+\.\d{2})\s*บาท", ocr_text)
-    if not amount_match: #KBank sometimes has "จํานวน:" then amount on next line or after spaces
-        amount_match = re.search(r"จํานวน:\s*\n*\s*([,\d]+\.\d{2})\s*บาท", ocr_text, re.MULTILINE)
-    if amount_match:
-        try:
-            res['amount'] = float(amount_match.group(1).replace(",", ""))
-        except ValueError:
-            pass
-
-    # Reference Number
-    ref_match = re.search(r"เลขที่รายการ:\s*([A-Z0-9]+)", ocr_text)
-    if ref_match:
-        res['ref_number'] = ref_match.group(1).strip()
-
     # From Account Name
     # Find line with "ธ.กสิกรไทย" or KBank account pattern, name is usually line above
-    from_account_idx = -1
     for i, line in enumerate(lines):
-        if ("ธ.กสิกรไทย" in line or re.search(r"XXX-X-X\d{3,6}-X", line)) and i > 0:
+        if ("ธ.กสิกรไทย" in line or _KBANK_ACCOUNT.search(line)) and i > 0:
             name_candidate = lines[i-1]
             if not any(kw in name_candidate for kw in ["โอนเจินสําเร็จ", "จ่ายบิล", "ชําระเงิน", "K PLUS", "บาท"]) and \
-               not re.match(r"\d{1,2}\s*[ก-ฮ]+\.", name_candidate) and len(name_candidate) > 2 and "รายการ:" not in name_candidate:
+               not _KBANK_DATE_LINE.match(name_candidate) and len(name_candidate) > 2 and "รายการ:" not in name_candidate:
                 res['from_account_name'] = _clean_name(name_candidate)
                 # Check for two-line name (e.g., title on one line, name on next)
                 if i > 1 and any(title in lines[i-2] for title in ["น.ส.", "นาย", "นาง", "บจก.", "หจก."]) and len(name_candidate.split()) <= 2 : # Allow for first name + last initial
@@ -193,24 +180,16 @@ def _extract_kbank_info(ocr_text: str, thai_month_map: dict) -> dict:
             if from_name_end_idx != -1:
                  from_name_end_idx += 10 # approx end
             else: # if from_name was not found or too short, search after first account number
-                first_acc_num_match = re.search(r"XXX-X-X\d{3,6}-X", ocr_text)
+                first_acc_num_match = _KBANK_ACCOUNT.search(ocr_text)
                 if first_acc_num_match:
                     from_name_end_idx = first_acc_num_match.end()
                 else: # Fallback to after date/time if everything else fails
-                    dt_match_end = re.search(r"(\d{2}:\d{2})\s*(?:น\.|u\.)", ocr_text)
+                    dt_match_end = _KBANK_TIME.search(ocr_text)
                     from_name_end_idx = dt_match_end.end() if dt_match_end else 50 # Arbitrary start if no markers
 
             search_text_for_to = ocr_text[from_name_end_idx:]
             
-            # Pattern 1: Direct Transfer (Name \n Bank/PromptPay)
-            # (Name line) \n (Bank line OR PromptPay line OR another name line for billers)
-            # Avoid capturing "เลขที่รายการ" or amount lines as name
-            # ([^\n]+?) -> Non-greedy name capture
-            # (?:XXX-X-X\d{3,6}-X|รหัสพร้อมเพย์|Pay|ธ\.[ก-ฮฯ]+|Shop|Wallet|บจก\.|หจก\.|[A-Z\s]{5,}) -> Bank indicator
-            to_transfer_match = re.search(
-                r"([^\n]+?)\n\s*(?:(XXX-X-X\d{3,6}-X)|(ธ\.[ก-ฮฯ\s]+(?:ไทย|พาณิชย์|กรุงศรี)?)|รหัสพร้อมเพย์|Prompt\s*Pay|Payee ID|([A-Z\s]{5,}[Ss]hop)|[A-Z\s]+Wallet|บจก\.|หจก\.)",
-                search_text_for_to, re.IGNORECASE
-            )
+            to_transfer_match = _KBANK_TO_TRANSFER.search(search_text_for_to)
             if to_transfer_match:
                 cand_to_name = to_transfer_match.group(1).strip()
                 if not any(kw in cand_to_name for kw in ["เลขที่รายการ", "จํานวน", "ค่าธรรมเนียม", "บาท", "สแกนตรวจสอบสลิป"]) and len(cand_to_name) > 2:
@@ -232,14 +211,10 @@ def _extract_kbank_info(ocr_text: str, thai_month_map: dict) -> dict:
                     if "กสิกรไทย" in (res['to_bank'] or ""): res['to_bank'] = "Kasikornbank"
                     elif "ไทยพาณิชย์" in (res['to_bank'] or ""): res['to_bank'] = "SCB"
             
-            # Pattern 2: Bill Payment / QR Payment (often 1-2 lines for recipient name, then "เลขที่รายการ" or "N hin" or Ref No.)
             if not to_section_found:
                  # Look for name(s) before "เลขที่รายการ" or specific biller identifiers
                  # Try to capture 1 or 2 lines as recipient name
-                biller_match = re.search(
-                    r"([^\n]+)\s*(?:\n\s*([^\n]+))?\s*\n+(?:เลขที่รายการ|N\s+hin|Ref No\.|รหัสอ้างอิง|20\d{10,})", # 20... is QR payment ref
-                    search_text_for_to, re.MULTILINE
-                )
+                biller_match = _KBANK_BILLER.search(search_text_for_to)
                 if biller_match:
                     b_line1 = biller_match.group(1).strip()
                     b_line2 = biller_match.group(2).strip() if biller_match.group(2) else ""
@@ -247,7 +222,7 @@ def _extract_kbank_info(ocr_text: str, thai_month_map: dict) -> dict:
                     if not any(kw in b_line1 for kw in ["เลขที่รายการ", "จํานวน", "ค่าธรรมเนียม", "บาท", "สแกนตรวจสอบสลิป", "XXX-X-X"]) and len(b_line1) > 2:
                         potential_name = b_line1
                         if b_line2 and not any(kw in b_line2 for kw in ["เลขที่รายการ", "จํานวน", "ค่าธรรมเนียม", "บาท", "สแกนตรวจสอบสลิป", "XXX-X-X"]) \
-                           and not re.match(r"\d{10,}", b_line2) and not "Pay" in b_line2 and not "ธ." in b_line2 : # Avoid ref numbers and bank lines
+                           and not _KBANK_REF_LINE.match(b_line2) and not "Pay" in b_line2 and not "ธ." in b_line2 : # Avoid ref numbers and bank lines
                             potential_name += " " + b_line2
                         
                         res['to_account_name'] = _clean_name(potential_name.strip())
@@ -263,73 +238,21 @@ def _extract_kbank_info(ocr_text: str, thai_month_map: dict) -> dict:
         except Exception:
             pass # KBank 'to' parsing is tricky
 
-    return res
-
-def _extract_scb_info(ocr_text: str, thai_month_map: dict) -> dict:
-    res = {
-        'transaction_date': None, 'transaction_time': None, 'amount': None,
-        'from_account_name': None, 'to_account_name': None, 'to_bank': None, 'ref_number': None
-    }
-
-    # Date and Time
-    match_dt_c = re.search(r"(\d{1,2}\s+(?:[ก-ฮ]+\.(?:[คมย]|พฤศจิกายน|มิถุนายน)\.|[ก-ฮ]{2,3}(?:\.|\s))\s+\d{4})\s+-\s+(\d{2}:\d{2})", ocr_text)
-    if not match_dt_c: # Alternative format like "01 เม.ย. 2568 - 21:45" but also handles "04 wig. 2568 - 13:19"
-        match_dt_c = re.search(r"(\d{1,2}\s+[A-Za-zก-ฮ]+\.?\s+\d{4})\s+-\s+(\d{2}:\d{2})", ocr_text)
-
-    if match_dt_c:
-        date_str_capture, time_str_capture = match_dt_c.groups()
-        try:
-            parts = date_str_capture.split()
-            day_val = int(parts[0])
-            month_input = parts[1].replace(".","") # Remove dots for lookup e.g. "เม.ย" -> "เมย"
-            
-            month_num_str = None
-            for k,v in thai_month_map.items(): # Match abbreviation like "wig." for "พ.ค." or similar
-                if month_input.lower().startswith(k.replace(".","").lower()[:2]): # Match first 2 chars of abbreviation
-                    month_num_str = v
-                    break
-            if not month_num_str: month_num_str = thai_month_map.get(parts[1]) # Try direct match with dot
-            if not month_num_str: month_num_str = thai_month_map.get(parts[1] + ".") # Try with added dot
-
-            year_val = _normalize_year(parts[2])
-            if year_val and month_num_str:
-                res['transaction_date'] = f"{year_val}-{month_num_str}-{day_val:02d}"
-                res['transaction_time'] = time_str_capture
-        except Exception:
-            pass
-
-    # Amount
-    amount_match = re.search(r"จํานวนเงิน\s*([,\d]+\.\d{2})", ocr_text)
-    if not amount_match: # SCB card slips sometimes have "จํานวนเงิ่น"
-        amount_match = re.search(r"จํานวนเงิ่น\s*([,\d]+\.\d{2})", ocr_text)
-    if amount_match:
-        try:
-            res['amount'] = float(amount_match.group(1).replace(",", ""))
-        except ValueError:
-            pass
-
-    # Reference Number
-    ref_match = re.search(r"รหัสอ้างอิง:\s*([A-Za-z0-9]+)", ocr_text)
-    if ref_match:
-        res['ref_number'] = ref_match.group(1).strip()
-
-    # From Account Name
-    from_match = re.search(r"จาก\s*(?:©|@)\s*(.*?)(?:\n|XXX-XXX\d{3}-\d|\d{4}\s*\d{2}xx\s*xxxx\s*\d{4}|รหัสอ้างอิง)", ocr_text)
-    if from_match:
-        name_candidate = from_match.group(1).strip()
-        if "PLANET SCB" in name_candidate: res['from_account_name'] = "PLANET SCB"
-        else: res['from_account_name'] = _clean_name(name_candidate)
-
+_SCB_TO = re.compile(r"ไปยัง\s*(?:@|0|©)?\s*(.*?)(?:\n|x-\d{4}|X{3}-\d{3}|Biller ID|\d{4}\s*\d{2}xx|Comp code|บัญชีรับชําระ|เลขที่เครื่องชําระเงิน|รหัสร้านค้า|\d{3,}-\d{1,}-\d{3,})")
+_SCB_PROVIDER_INFO = re.compile(r"ข้อมูลเพิ่มเติมจากผู้ให้บริการ\s*\n\s*(.*?)(?:\s*\(.*?\))?\s*\n")
+_SCB_PLANET_INFO = re.compile(r"ข้อมูลเพิ่มเติมจากผู้ให้บริการ\s*\n\s*([A-Z\s]+)\s*\n")
 
+@register_hook('scb_recipient')
+def _scb_recipient(ocr_text, res, context):
     # To Account Name and To Bank
-    to_match = re.search(r"ไปยัง\s*(?:@|0|©)?\s*(.*?)(?:\n|x-\d{4}|X{3}-\d{3}|Biller ID|\d{4}\s*\d{2}xx|Comp code|บัญชีรับชําระ|เลขที่เครื่องชําระเงิน|รหัสร้านค้า|\d{3,}-\d{1,}-\d{3,})", ocr_text)
+    to_match = _SCB_TO.search(ocr_text)
     if to_match:
         to_name_candidate = to_match.group(1).strip()
         res['to_account_name'] = _clean_name(to_name_candidate)
 
         if "พร้อมเพย์" in to_name_candidate or "พร้อมแพย์" in to_name_candidate:
             res['to_bank'] = "PromptPay"
-            info_prov_match = re.search(r"ข้อมูลเพิ่มเติมจากผู้ให้บริการ\s*\n\s*(.*?)(?:\s*\(.*?\))?\s*\n", ocr_text)
+            info_prov_match = _SCB_PROVIDER_INFO.search(ocr_text)
             if info_prov_match:
                 actual_name = info_prov_match.group(1).strip()
                 if len(actual_name) > 3 and "ผู้รับเงินสามารถสแกน" not in actual_name:
@@ -340,7 +263,7 @@ def _extract_scb_info(ocr_text: str, thai_month_map: dict) -> dict:
         elif "PLANET SCB" in to_name_candidate:
             res['to_bank'] = "SCB Planet"
             # Extract name from "ข้อมูลเพิ่มเติมจากผู้ให้บริการ" if available for Planet SCB
-            planet_info_match = re.search(r"ข้อมูลเพิ่มเติมจากผู้ให้บริการ\s*\n\s*([A-Z\s]+)\s*\n", ocr_text)
+            planet_info_match = _SCB_PLANET_INFO.search(ocr_text)
             if planet_info_match:
                 res['to_account_name'] = _clean_name(planet_info_match.group(1).strip())
             else:
@@ -364,71 +287,15 @@ def _extract_scb_info(ocr_text: str, thai_month_map: dict) -> dict:
             elif "Bangkok Bank" in context_after_to_name: res['to_bank'] = "Bangkok Bank"
             # SCB to SCB is often implicit, leave as None if no other bank is found
 
-    return res
-
-def _extract_krungthai_info(ocr_text: str, thai_month_map: dict) -> dict:
-    res = {
-        'transaction_date': None, 'transaction_time': None, 'amount': None,
-        'from_account_name': None, 'to_account_name': None, 'to_bank': None, 'ref_number': None
-    }
-    
-    # Date and Time
-    # Example: "01 เม.ย. 2568 - 18:41" or "01 w.A. 2565 - 23:53" (w.A. for พ.ค.)
-    match_dt_c = re.search(r"(\d{1,2}\s+(?:[ก-ฮA-Za-z]+\.(?:[คมยสตน]|[คมยสตน]\.)?)\s+\d{4})\s+-\s+(\d{2}:\d{2})", ocr_text)
-    if match_dt_c:
-        date_str_capture, time_str_capture = match_dt_c.groups()
-        try:
-            parts = date_str_capture.split()
-            day_val = int(parts[0])
-            month_input_raw = parts[1]
-            
-            month_num_str = None
-            # Try matching parts of the month input, e.g. "w.A." could be พ.ค.
-            cleaned_month_input = month_input_raw.replace(".","").lower()
-            for k_map, v_map in thai_month_map.items():
-                cleaned_k_map = k_map.replace(".","").lower()
-                if cleaned_month_input.startswith(cleaned_k_map[:2]) and len(cleaned_k_map) >1 : # Match first 2 chars
-                     month_num_str = v_map
-                     break
-            if not month_num_str: month_num_str = thai_month_map.get(month_input_raw) # Direct match
-            if not month_num_str and not month_input_raw.endswith('.'): month_num_str = thai_month_map.get(month_input_raw + ".") # Try with dot
-
-
-            year_val = _normalize_year(parts[2])
-            if year_val and month_num_str:
-                res['transaction_date'] = f"{year_val}-{month_num_str}-{day_val:02d}"
-                res['transaction_time'] = time_str_capture
-        except Exception:
-            pass
-
-    # Amount
-    amount_match = re.search(r"จํานวนเงิน\s*([,\d]+\.\d{2})\s*บาท", ocr_text)
-    if amount_match:
-        try:
-            res['amount'] = float(amount_match.group(1).replace(",", ""))
-        except ValueError:
-            pass
-
-    # Reference Number
-    ref_match = re.search(r"รหัสอ(?:ฮ|า)้างอิง\s*([A-Za-z0-9\s]+)", ocr_text) # Allow for OCR error "อฮ้างอิง"
-    if ref_match:
-        res['ref_number'] = ref_match.group(1).strip().split('\n')[0] # Take first line if multi-line
-
-    # From Account Name
-    from_match = re.search(r"^(?:©|๐|iG)?\s*(น\.ส\.|นาย|นาง|นส\.)\s*(.*?)\n\s*กรุงไทย", ocr_text, re.MULTILINE | re.IGNORECASE)
-    if not from_match: # Simpler from pattern if the above is too specific
-        from_match = re.search(r"^(?:©|๐|iG)?\s*([^\n]+?)\n\s*กรุงไทย", ocr_text, re.MULTILINE | re.IGNORECASE)
-
-    if from_match:
-        name_parts = [p for p in from_match.groups() if p]
-        name_candidate = " ".join(name_parts).strip()
-        if "Krungthai" not in name_candidate and "รหัสอ้างอิง" not in name_candidate and "G-Wallet" not in name_candidate and len(name_candidate) > 3:
-             res['from_account_name'] = _clean_name(name_candidate)
-
+# Krungthai format: "โปยัง\nNAME\nBANK" or "le)\nNAME\nBANK" or "๒ BILLER_NAME \n (ID)"
+_KRUNGTHAI_TO_BLOCK = re.compile(r"(?:โปยัง|le\)|Vv|๑|๒)\s*\n?\s*(.*?)(?:\n\s*([ก-ฮA-Za-z\s\.]*(?:Bank|ไทย|เพย์|Pay|Wallet|shop|G-Wallet|ออมสิน))|\n\s*\(?\d{5,}\)?|\n\s*จํานวนเงิน|\n\s*รหัสอ้างอิง\s*1|\n\s*หมายเลขอ้างอิง\s*1)", re.DOTALL | re.MULTILINE | re.IGNORECASE)
+_KRUNGTHAI_G_WALLET_PREFIX = re.compile(r"^\(G-WALLET\)", re.IGNORECASE)
+_KRUNGTHAI_G_WALLET_NAME = re.compile(r"([^\n(]+)\s*\(G-WALLET\)", re.IGNORECASE)
 
+@register_hook('krungthai_recipient')
+def _krungthai_recipient(ocr_text, res, context):
     # To Account Name and To Bank
-    # Krungthai format: "โปยัง\nNAME\nBANK" or "le)\nNAME\nBANK" or "๒ BILLER_NAME \n (ID)"
-    to_block_match = re.search(r"(?:โปยัง|le\)|Vv|๑|๒)\s*\n?\s*(.*?)(?:\n\s*([ก-ฮA-Za-z\s\.]*(?:Bank|ไทย|เพย์|Pay|Wallet|shop|G-Wallet|ออมสิน))|\n\s*\(?\d{5,}\)?|\n\s*จํานวนเงิน|\n\s*รหัสอ้างอิง\s*1|\n\s*หมายเลขอ้างอิง\s*1)", ocr_text, re.DOTALL | re.MULTILINE | re.IGNORECASE)
+    to_block_match = _KRUNGTHAI_TO_BLOCK.search(ocr_text)
     
     if to_block_match:
         to_name_candidate_full = to_block_match.group(1).strip()
@@ -436,7 +303,7 @@ def _extract_krungthai_info(ocr_text: str, thai_month_map: dict) -> dict:
         to_name_first_line = to_name_candidate_full.split('\n')[0].strip()
 
         if not any(kw in to_name_first_line for kw in ["จํานวนเงิน","ค่าธรรมเนียม","วันที่ทํา","รหัสอ้างอิง", "XXX-X-XX", "G-Wallet"]) and \
-           not re.match(r"^\(G-WALLET\)", to_name_first_line, re.IGNORECASE) and len(to_name_first_line) > 2 :
+           not _KRUNGTHAI_G_WALLET_PREFIX.match(to_name_first_line) and len(to_name_first_line) > 2 :
             res['to_account_name'] = _clean_name(to_name_first_line)
         
         # Explicit bank line
@@ -461,73 +328,180 @@ def _extract_krungthai_info(ocr_text: str, thai_month_map: dict) -> dict:
             elif "G-Wallet" in to_name_candidate_full.upper() or "(G-WALLET)" in to_name_candidate_full.upper(): # Check full block for G-Wallet
                 res['to_bank'] = "G-Wallet"
                 if not res['to_account_name'] or "G-Wallet" in res['to_account_name'] : # If name is just G-Wallet, try to find actual name
-                    actual_name_gwallet = re.search(r"([^\n(]+)\s*\(G-WALLET\)", to_name_candidate_full, re.IGNORECASE)
+                    actual_name_gwallet = _KRUNGTHAI_G_WALLET_NAME.search(to_name_candidate_full)
                     if actual_name_gwallet:
                         res['to_account_name'] = _clean_name(actual_name_gwallet.group(1))
 
+E_SLIP_RULES = load_rulesets('e_slip') # compiled once, at import
 
-    return res
+def _month_context(thai_month_map):
+    # parser context; a caller's own month map gets its own lookup table
+    if thai_month_map is None or thai_month_map is THAI_MONTHS:
+        return {'months': MONTHS}
+    return {'months': MonthTable(thai_month_map)}
+
+def _extract_bangkok_info(ocr_text: str, thai_month_map: dict = None) -> dict:
+    return E_SLIP_RULES['bangkok'].parse(ocr_text, _month_context(thai_month_map))
+
+def _extract_kbank_info(ocr_text: str, thai_month_map: dict = None) -> dict:
+    return E_SLIP_RULES['kbank'].parse(ocr_text, _month_context(thai_month_map))
+
+def _extract_scb_info(ocr_text: str, thai_month_map: dict = None) -> dict:
+    return E_SLIP_RULES['scb'].parse(ocr_text, _month_context(thai_month_map))
+
+def _extract_krungthai_info(ocr_text: str, thai_month_map: dict = None) -> dict:
+    return E_SLIP_RULES['krungthai'].parse(ocr_text, _month_context(thai_month_map))
 
 # --- Main Processing Function ---
-from .ocr_tesseract import ocr_pytesseract
-from .bank_annotation import annotation_bank
+from .ocr_tesseract import ocr_slip, OCR_CONFIG
+from .bank_annotation import annotation_bank, TEMPLATE_SEARCH
+from .logo_index import get_logo_index
+from function.result_cache import get_result_cache, cache_key
+from function.image_io import DecodedImage
+
+@dataclass
+class EslipResult:
+    """Everything one pass over an e-slip produces, so callers never re-run a stage."""
+    file_path: str
+    ocr_text: str = None
+    bank: str = None          # normalized bank name used to pick the parser
+    match_score: float = None # logo score from annotation_bank (None if inferred from OCR text)
+    ocr_confidence: float = None # mean Tesseract word confidence
+    fields: dict = None       # output of the _extract_*_info parser, plus from_bank
+    timings: dict = field(default_factory=dict) # seconds per stage
+    error: str = None
+
+    def to_dataframe(self):
+        if not self.fields:
+            return None
+        return pd.DataFrame([self.fields])
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+def _infer_bank_from_text(ocr_text):
+    text = ocr_text.lower()
+    if "kasikorn" in text or "kbank" in text: return "kbank"
+    elif "siam commercial bank" in text or "scb" in text: return "scb"
+    elif "bangkok bank" in text : return "bangkok"
+    elif "krungthai" in text or "ktb" in text: return "krungthai"
+    # Add more fallbacks if needed
+    return None
 
-def process_image(file_path: str):
-    """Orchestrates OCR, bank identification, and information extraction."""
+def _eslip_cache_key(image):
+    # image bytes + everything that changes the result: logo templates, template search, OCR settings,
+    # parser rules (files and hook code) and month tables
+    config = {'logos': get_logo_index(BANK_LOGO_PATH).signature, 'search': TEMPLATE_SEARCH,
+              'ocr': OCR_CONFIG, 'rules': rules_signature('e_slip'), 'months': [THAI_MONTHS, FUZZY_MONTHS]}
+    return cache_key('e_slip', image.sha256, config)
+
+def process_image(file_path, use_cache: bool = True) -> EslipResult:
+    """Orchestrates OCR, bank identification, and information extraction in a single pass.
+
+    file_path may also be raw image bytes or a DecodedImage; the image is read and decoded once
+    for every stage. Results of unchanged files are served from the result cache unless
+    use_cache is False.
+    """
+    start = time.perf_counter()
     try:
-        ocr_text, _ = ocr_pytesseract(file_path) # We only need the text
+        image = DecodedImage.ensure(file_path)
+    except (OSError, TypeError) as e:
+        print(f"Could not read {file_path}: {e}")
+        return EslipResult(file_path=str(file_path), error=str(e))
+    file_path = image.name
+    cache = get_result_cache() if use_cache else None
+    key = None
+    if cache is not None:
+        try:
+            key = _eslip_cache_key(image)
+            cached = cache.get(key)
+        except Exception as e:
+            print(f"Result cache unavailable for {file_path}: {e}")
+            cache, cached = None, None
+        if cached is not None:
+            payload, raw_ocr = cached
+            result = EslipResult.from_dict({**payload, 'ocr_text': raw_ocr})
+            result.file_path = file_path
+            result.timings = {'cache': time.perf_counter() - start}
+            return result
+
+    result = process_image_uncached(image)
+    if cache is not None and result.error is None:
+        try:
+            payload = result.to_dict()
+            cache.put(key, 'e_slip', payload, payload.pop('ocr_text'))
+        except Exception as e:
+            print(f"Could not cache result for {file_path}: {e}")
+    return result
+
+def process_image_uncached(file_path) -> EslipResult:
+    start = time.perf_counter()
+    image = DecodedImage.ensure(file_path) # OCR and logo matching share one read and one decode
+    file_path = image.name
+    result = EslipResult(file_path=file_path)
+    try:
+        t0 = time.perf_counter()
+        ocr = ocr_slip(image) # single pass, no box rendering
+        result.timings['ocr'] = time.perf_counter() - t0
+        ocr_text = ocr.text
+        result.ocr_text = ocr_text
+        result.ocr_confidence = ocr.mean_confidence
         if not ocr_text:
             print(f"OCR failed to extract text from {file_path}")
-            return None
-
-        bank_name = annotation_bank(file_path, BANK_LOGO_PATH) 
-        if not bank_name:
+            result.error = "OCR failed to extract text"
+            return result
+
+        t0 = time.perf_counter()
+        bank_name, match_score = annotation_bank(image, BANK_LOGO_PATH, return_score=True)
+        result.timings['bank_annotation'] = time.perf_counter() - t0
+        if bank_name:
+            result.match_score = match_score
+        else:
             print(f"Bank identification failed for {file_path}")
             # Fallback: try to infer from OCR text if no logo match
-            if "kasikorn" in ocr_text.lower() or "kbank" in ocr_text.lower(): bank_name = "kbank"
-            elif "siam commercial bank" in ocr_text.lower() or "scb" in ocr_text.lower(): bank_name = "scb"
-            elif "bangkok bank" in ocr_text.lower() : bank_name = "bangkok"
-            elif "krungthai" in ocr_text.lower() or "ktb" in ocr_text.lower(): bank_name = "krungthai"
-            # Add more fallbacks if needed
-            else:
+            bank_name = _infer_bank_from_text(ocr_text)
+            if not bank_name:
                 print("Could not determine bank from OCR text either.")
-                return None 
+                result.error = "Could not determine bank"
+                return result
         
         print(f"Identified bank: {bank_name} for file: {file_path}")
 
-        thai_months = get_thai_month_map()
-        extracted_info = None
-
         # Map bank_name (from annotation_bank) to function calls
         # The names returned by annotation_bank might need to be normalized here
         # For example, if annotation_bank returns "Kasikornbank", map it to "kbank"
         normalized_bank_name = bank_name.lower()
+        result.bank = normalized_bank_name
 
-        if "bangkok" in normalized_bank_name: # Assuming annotation_bank might return "Bangkok Bank Logo" or similar
-            extracted_info = _extract_bangkok_info(ocr_text, thai_months)
-        elif "kbank" in normalized_bank_name or "kasikorn" in normalized_bank_name:
-            extracted_info = _extract_kbank_info(ocr_text, thai_months)
-        elif "scb" in normalized_bank_name or "siam commercial" in normalized_bank_name:
-            extracted_info = _extract_scb_info(ocr_text, thai_months)
-        elif "krungthai" in normalized_bank_name or "ktb" in normalized_bank_name:
-            extracted_info = _extract_krungthai_info(ocr_text, thai_months)
-        # Add other banks as needed
+        t0 = time.perf_counter()
+        extracted_info = None
+
+        ruleset = find_ruleset(E_SLIP_RULES, normalized_bank_name) # function/rules/e_slip/*.json "match"
+        if ruleset is not None:
+            extracted_info = ruleset.parse(ocr_text, {'months': MONTHS})
         else:
             print(f"No specific extraction logic for bank: {bank_name}")
-            return None
+            result.error = f"No extraction logic for bank: {bank_name}"
+            return result
+        result.timings['extraction'] = time.perf_counter() - t0
 
         if extracted_info:
             extracted_info['from_bank'] = normalized_bank_name
-            # Convert the dictionary to a Pandas DataFrame before returning
-            # This makes it consistent with app.py's expectation
-            df = pd.DataFrame([extracted_info]) # Create DataFrame from a single dictionary
-            return df
+            result.fields = extracted_info
         else:
             print(f"Extraction failed for bank {bank_name} on file {file_path}")
-            return None
+            result.error = f"Extraction failed for bank {bank_name}"
+        return result
 
     except Exception as e:
         print(f"Error in process_image for {file_path}: {e}")
         import traceback
         traceback.print_exc()
-        return None
\ No newline at end of file
+        result.error = str(e)
+        return result
+    finally:
+        result.timings['total'] = time.perf_counter() - start
@@ -0,0 +1,122 @@
+#  In-memory index of the bank logo templates used by annotation_bank.
+#  Every logo is read, pre-processed, pre-scaled and SIFT-described once; the index is
+#  only rebuilt when the mtime of bank_logos/ (or one of its bank folders) changes.
+import os
+import threading
+from dataclasses import dataclass, field
+import cv2
+import numpy as np
+from .preprocess import preprocess_template_for_template_matching
+
+TEMPLATE_SCALES = np.arange(0.1, 2.0, 0.1)
+PYRAMID_DOWNSAMPLE = 0.5 # coarse level of the pyramid template search
+
+# FLANN parameters (same as flann_matching)
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_PARAMS = dict(algorithm = FLANN_INDEX_KDTREE, trees = 5)
+FLANN_SEARCH_PARAMS = dict(checks=50)
+
+def scale_template(template, scales):
+    # [(scale, resized template)] for every scale, same rounding as multi_scale_template_matching
+    scaled = []
+    for scale in scales:
+        width = int(template.shape[1] * scale)
+        height = int(template.shape[0] * scale)
+        if width < 1 or height < 1:
+            continue
+        scaled.append((scale, cv2.resize(template, (width, height))))
+    return scaled
+
+def downsample_templates(scaled, factor=PYRAMID_DOWNSAMPLE):
+    # coarse copies of scale_template's output, index for index
+    return [(scale, cv2.resize(template, (max(1, int(template.shape[1] * factor)), max(1, int(template.shape[0] * factor))),
+                               interpolation=cv2.INTER_AREA))
+            for scale, template in scaled]
+
+@dataclass
+class LogoTemplate:
+    bank: str
+    name: str
+    gray: np.ndarray                            # template as read from disk (grayscale)
+    processed: np.ndarray                       # resized to 240px, blurred, Otsu
+    scaled: list = field(default_factory=list)  # [(scale, processed template resized to scale)]
+    descriptors: np.ndarray = None              # SIFT descriptors of gray
+    coarse: list = field(default_factory=list)  # scaled, downsampled for the pyramid search
+
+class LogoTemplateIndex:
+    def __init__(self, template_path, scales=TEMPLATE_SCALES):
+        self.template_path = os.path.abspath(template_path)
+        self.scales = scales
+        self.banks = {} # bank -> [LogoTemplate], banks and files in sorted order
+        self.signature = None
+        self.descriptors = None # every logo's SIFT descriptors stacked into one matrix
+        self.labels = None      # row -> position of its logo in self.labelled_templates
+        self.labelled_templates = []
+        self.build()
+
+    def _signature(self):
+        # mtimes of the root and each bank folder; changes when logos are added, removed or replaced
+        sig = [os.stat(self.template_path).st_mtime_ns]
+        for entry in sorted(os.scandir(self.template_path), key=lambda e: e.name):
+            if entry.is_dir():
+                sig.append((entry.name, entry.stat().st_mtime_ns))
+        return tuple(sig)
+
+    def build(self):
+        banks = {}
+        sift = cv2.SIFT_create()
+        for bank in sorted(os.listdir(self.template_path)):
+            bank_dir = os.path.join(self.template_path, bank)
+            if not os.path.isdir(bank_dir):
+                continue
+            templates = []
+            for name in sorted(os.listdir(bank_dir)):
+                gray = cv2.imread(os.path.join(bank_dir, name), cv2.IMREAD_GRAYSCALE)
+                if gray is None:
+                    print(f"Skipping unreadable logo template: {bank}/{name}")
+                    continue
+                processed = preprocess_template_for_template_matching(gray)
+                _, descriptors = sift.detectAndCompute(gray, None)
+                scaled = scale_template(processed, self.scales)
+                templates.append(LogoTemplate(bank, name, gray, processed, scaled, descriptors, downsample_templates(scaled)))
+            if templates:
+                banks[bank] = templates
+        self.banks = banks
+        self._merge_descriptors()
+        self.signature = self._signature()
+
+    def _merge_descriptors(self):
+        templates = [t for t in self.templates() if t.descriptors is not None and len(t.descriptors) > 0]
+        if templates:
+            self.descriptors = np.vstack([t.descriptors for t in templates]).astype(np.float32)
+            self.labels = np.concatenate([np.full(len(t.descriptors), i) for i, t in enumerate(templates)])
+        else:
+            self.descriptors, self.labels = None, None
+        self.labelled_templates = templates
+
+    def is_stale(self):
+        try:
+            return self._signature() != self.signature
+        except OSError:
+            return True
+
+    def templates(self):
+        for bank, templates in self.banks.items():
+            for template in templates:
+                yield template
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_logo_index(template_path):
+    """Shared LogoTemplateIndex for this folder; rebuilt only when the folder changed."""
+    key = os.path.abspath(template_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = LogoTemplateIndex(key)
+            _indexes[key] = index
+        elif index.is_stale():
+            print(f"Logo templates changed, rebuilding index for {key}")
+            index.build()
+        return index
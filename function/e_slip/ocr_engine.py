@@ -0,0 +1,198 @@
+#  Pool of long-lived Tesseract API handles (tesserocr), so the tha+eng traineddata
+#  is loaded once per handle instead of once per pytesseract subprocess call.
+#  Without tesserocr (e.g. on Windows, where pip has no wheel for it) the pool falls back to
+#  pytesseract with the same interface: it then only limits concurrent calls, and every call
+#  still starts a tesseract process that loads the language data again.
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+import pytesseract
+from pytesseract import Output
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+OCR_POOL_SIZE = int(os.environ.get('OCR_POOL_SIZE', 2))
+OCR_TIMEOUT = float(os.environ.get('OCR_TIMEOUT', 30)) # seconds, per call
+
+class OcrTimeout(RuntimeError):
+    pass
+
+def _tessdata_path():
+    # tesserocr needs the tessdata folder; reuse the install that pytesseract points at
+    if os.environ.get('TESSDATA_PREFIX'):
+        return os.environ['TESSDATA_PREFIX']
+    path = os.path.join(os.path.dirname(pytesseract.pytesseract.tesseract_cmd), 'tessdata')
+    return path if os.path.isdir(path) else None
+
+def _parse_tsv(tsv):
+    # same layout as pytesseract.image_to_data(output_type=Output.DICT)
+    keys = ['level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+            'left', 'top', 'width', 'height', 'conf', 'text']
+    data = {k: [] for k in keys}
+    for row in tsv.splitlines():
+        cols = row.split('\t')
+        if len(cols) < 11 or cols[0] == 'level':
+            continue
+        if len(cols) == 11:
+            cols.append('')
+        for k, v in zip(keys[:10], cols[:10]):
+            data[k].append(int(v))
+        data['conf'].append(float(cols[10]))
+        data['text'].append(cols[11])
+    return data
+
+def text_from_data(data):
+    # Rebuild plain text from word rows: words joined by spaces, one line per
+    # text line and a blank line between paragraphs, as Tesseract lays out its text output.
+    # Only runs of spaces inside a line differ: they come back as one space
+    out = []
+    prev_par = prev_line = None
+    for i, level in enumerate(data['level']):
+        if level != 5:
+            continue
+        par = (data['page_num'][i], data['block_num'][i], data['par_num'][i])
+        line = par + (data['line_num'][i],)
+        if line != prev_line:
+            if prev_line is not None:
+                out.append('\n\n' if par != prev_par else '\n')
+            prev_par, prev_line = par, line
+        else:
+            out.append(' ')
+        out.append(data['text'][i])
+    if out:
+        out.append('\n')
+    return ''.join(out)
+
+class TesseractEnginePool:
+    """Thread-safe pool of Tesseract handles for one (lang, psm, oem) configuration.
+
+    Handles are created lazily up to ``size`` and reused; a call waits at most ``timeout``
+    seconds for a free handle and for recognition itself.
+    """
+
+    def __init__(self, lang='tha+eng', psm=3, oem=3, size=OCR_POOL_SIZE, timeout=OCR_TIMEOUT):
+        self.lang = lang
+        self.psm = psm
+        self.oem = oem
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._handles = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return 'tesserocr' if tesserocr is not None else 'pytesseract'
+
+    def _new_handle(self):
+        if tesserocr is None:
+            return None # pytesseract has no persistent handle
+        return tesserocr.PyTessBaseAPI(path=_tessdata_path() or tesserocr.get_languages()[0],
+                                       lang=self.lang, psm=self.psm, oem=self.oem)
+
+    def _acquire(self, timeout):
+        try:
+            return self._handles.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._new_handle()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._handles.get(timeout=timeout)
+        except queue.Empty:
+            raise OcrTimeout(f"No free OCR engine after {timeout}s (pool size {self.size})")
+
+    def _release(self, handle):
+        if handle is not None:
+            handle.Clear()
+        self._handles.put(handle)
+
+    def _set_image(self, handle, image):
+        image = np.ascontiguousarray(image)
+        if image.ndim == 3:
+            image = np.ascontiguousarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        height, width = image.shape[:2]
+        bpp = 1 if image.ndim == 2 else image.shape[2]
+        handle.SetImageBytes(image.tobytes(), width, height, bpp, width * bpp)
+
+    def _recognize(self, handle, image, timeout):
+        self._set_image(handle, image)
+        if not handle.Recognize(int(timeout * 1000)):
+            raise OcrTimeout(f"OCR did not finish within {timeout}s")
+
+    def _config(self):
+        return f'--oem {self.oem} --psm {self.psm}'
+
+    def image_to_string(self, image, timeout=None):
+        """OCR a numpy image (grayscale or BGR) and return its text."""
+        timeout = timeout or self.timeout
+        handle = self._acquire(timeout)
+        try:
+            if handle is None:
+                return pytesseract.image_to_string(image, lang=self.lang, config=self._config(), timeout=timeout)
+            self._recognize(handle, image, timeout)
+            return handle.GetUTF8Text()
+        finally:
+            self._release(handle)
+
+    def image_to_data(self, image, timeout=None):
+        """OCR a numpy image and return word boxes as a pytesseract-style dict."""
+        timeout = timeout or self.timeout
+        handle = self._acquire(timeout)
+        try:
+            if handle is None:
+                return pytesseract.image_to_data(image, lang=self.lang, config=self._config(),
+                                                 output_type=Output.DICT, timeout=timeout)
+            self._recognize(handle, image, timeout)
+            return _parse_tsv(handle.GetTSVText(0))
+        finally:
+            self._release(handle)
+
+    def ocr(self, image, timeout=None):
+        """Single OCR pass returning (text, data) with data in pytesseract dict layout."""
+        timeout = timeout or self.timeout
+        handle = self._acquire(timeout)
+        try:
+            if handle is None:
+                # one tesseract run: the text is rebuilt from the word rows
+                data = pytesseract.image_to_data(image, lang=self.lang, config=self._config(),
+                                                 output_type=Output.DICT, timeout=timeout)
+                data['conf'] = [float(c) for c in data['conf']]
+                return text_from_data(data), data
+            self._recognize(handle, image, timeout)
+            # both come from the same recognition result
+            return handle.GetUTF8Text(), _parse_tsv(handle.GetTSVText(0))
+        finally:
+            self._release(handle)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_ocr_engine(lang='tha+eng', psm=3, oem=3, size=None, timeout=None):
+    """Return the shared pool for this OCR configuration, creating it on first use.
+
+    size and timeout default to OCR_POOL_SIZE and OCR_TIMEOUT and are part of the pool's key,
+    so a caller asking for a different size gets its own pool rather than an existing one.
+    """
+    size = size or OCR_POOL_SIZE
+    timeout = timeout or OCR_TIMEOUT
+    key = (lang, psm, oem, size, timeout)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if tesserocr is None and not _pools:
+                print("tesserocr is not installed: OCR falls back to pytesseract, one tesseract process per call")
+            pool = TesseractEnginePool(lang, psm, oem, size=size, timeout=timeout)
+            _pools[key] = pool
+        return pool
@@ -1,12 +1,17 @@
 #  download tesseract-ocr-w64-setup-5.5.0.20241111.exe (64 bit)
 #  from - https://github.com/UB-Mannheim/tesseract/wiki
 import pytesseract
-from pytesseract import Output
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from dataclasses import dataclass, field
 from typing import Tuple
 import random
 import cv2
+import numpy as np
 from .preprocess import preprocess_bank_slip
+from .ocr_engine import get_ocr_engine
+
+# the e-slip OCR settings; part of result-cache and OCR-replay keys
+OCR_CONFIG = {'lang': 'tha+eng', 'psm': 3, 'oem': 3}
 
 def get_random_rgb_tuple() -> Tuple[int, int, int]:
     return (
@@ -15,18 +20,37 @@ def get_random_rgb_tuple() -> Tuple[int, int, int]:
         random.randint(0, 255)
     )
 
-def ocr_pytesseract(img):
+@dataclass
+class OcrResult:
+    text: str
+    words: list = field(default_factory=list) # (text, confidence, (x, y, w, h)) per recognised word
+    box_image: np.ndarray = None              # only drawn when debug=True
 
-    img = preprocess_bank_slip(img)
-    text = pytesseract.image_to_string(img, lang='tha+eng')
-    d = pytesseract.image_to_data(img, lang='tha+eng', output_type=Output.DICT)
+    @property
+    def mean_confidence(self):
+        confs = [conf for _, conf, _ in self.words if conf >= 0]
+        return sum(confs) / len(confs) if confs else None
 
-    n_boxes = len(d['level'])
-    box_image = img.copy()
-    box_image = cv2.cvtColor(box_image, cv2.COLOR_GRAY2BGR)
-    for i in range(n_boxes):
+def draw_boxes(img, d):
+    box_image = cv2.cvtColor(img.copy(), cv2.COLOR_GRAY2BGR)
+    for i in range(len(d['level'])):
         (x, y, w, h) = (d['left'][i], d['top'][i], d['width'][i], d['height'][i])
-        # convert to rgb
-        box = cv2.rectangle(box_image, (x, y), (x + w, y + h), get_random_rgb_tuple(), 2)
+        cv2.rectangle(box_image, (x, y), (x + w, y + h), get_random_rgb_tuple(), 2)
+    return box_image
+
+def ocr_slip(img, debug=False) -> OcrResult:
+    """One OCR pass: text, word boxes and confidences; the box image only when debug=True."""
+    img = preprocess_bank_slip(img)
+    text, d = get_ocr_engine(**OCR_CONFIG).ocr(img)
+
+    words = [
+        (d['text'][i], d['conf'][i], (d['left'][i], d['top'][i], d['width'][i], d['height'][i]))
+        for i in range(len(d['level'])) if d['level'][i] == 5 and d['text'][i].strip()
+    ]
+    box_image = draw_boxes(img, d) if debug else None
+    return OcrResult(text=text, words=words, box_image=box_image)
 
-    return text, box
\ No newline at end of file
+def ocr_pytesseract(img, debug=False):
+    # kept for existing callers; box is None unless debug=True
+    result = ocr_slip(img, debug=debug)
+    return result.text, result.box_image
@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
 import math
+from function.image_io import DecodedImage
+
+SLIP_MATCH_WIDTH = 1000 # slips are resized to this width for logo matching
 
 def resize_image(image, width):
     height = int(image.shape[0] * (width / image.shape[1]))
@@ -11,7 +14,9 @@ def cut_image(image):
     return image[0:math.ceil(h/1.5), 0:w]
 
 def preprocess_bank_slip(img):
-    if isinstance(img, str):
+    if isinstance(img, DecodedImage):
+        image = img.gray
+    elif isinstance(img, str):
         image = cv2.imread(img, cv2.IMREAD_GRAYSCALE)
     elif isinstance(img, np.ndarray):
         image = img
@@ -27,20 +32,24 @@ def preprocess_bank_slip(img):
 
     return thresh
 
-def preprocess_bank_slip_for_template_matching(image, template):
+def preprocess_slip_for_template_matching(image):
     # resize image width
-    image = resize_image(image, 1000)
+    image = resize_image(image, SLIP_MATCH_WIDTH)
     # cut half of image
     image = cut_image(image)
-    
-    # resize object width
-    template = resize_image(template, 240)
-
     # gaussian blur image
     image = cv2.GaussianBlur(image, (3, 3), 0)
+    return preprocess_bank_slip(image)
+
+def preprocess_template_for_template_matching(template):
+    # resize object width
+    template = resize_image(template, 240)
+    # gaussian blur template
     template = cv2.GaussianBlur(template, (3, 3), 0)
-    
-    image = preprocess_bank_slip(image)
-    template = preprocess_bank_slip(template)
+    return preprocess_bank_slip(template)
+
+def preprocess_bank_slip_for_template_matching(image, template):
+    image = preprocess_slip_for_template_matching(image)
+    template = preprocess_template_for_template_matching(template)
 
-    return image, template
+    return image, template
\ No newline at end of file
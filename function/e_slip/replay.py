@@ -0,0 +1,303 @@
+"""Offline OCR replay: re-run the e-slip bank parsers over stored OCR text, without Tesseract.
+
+results_csv/eslip_ocr.csv holds the raw OCR of every dataset slip. Replaying it through the
+parsers regenerates results_csv/eslip_result.csv and the evaluation/*.csv reports (the notebook's
+simple_evaluation, plus a check of each parsed date against the date in its reference number)
+in about a second, so a change to a rule file or a parser hook can be checked
+without OCR-ing the dataset again. Stored OCR is keyed by the image's sha256 and the OCR config
+(function.e_slip.ocr_tesseract.OCR_CONFIG), so text from an image that has since changed, or from
+other OCR settings, is never replayed as if it were current.
+
+Run from the project root:
+    python -m function.e_slip.replay [--ocr-csv results_csv/eslip_ocr.csv] [--bank-column predicted_bank]
+"""
+import argparse
+import json
+import os
+import re
+import time
+from datetime import date, timedelta
+from dataclasses import dataclass
+import pandas as pd
+from function.result_cache import file_sha256, config_hash
+from function.rule_engine import find_ruleset
+from function.months import MONTHS
+from .extract_info import E_SLIP_RULES
+from .ocr_tesseract import OCR_CONFIG
+
+OCR_CSV = os.path.join('results_csv', 'eslip_ocr.csv')
+RESULT_CSV = os.path.join('results_csv', 'eslip_result.csv')
+EVALUATION_DIR = 'evaluation'
+
+# fields simple_evaluation reports on (eslip_result.csv also carries bank, image_path and ocr)
+# references that carry the transaction date
+_REF_YMD = re.compile(r'^(20\d{2})(\d{2})(\d{2})')   # Bangkok Bank, SCB, Krungthai, KBank QR: yyyymmdd...
+_REF_KBANK = re.compile(r'^0(\d{2})(\d{3})\d{6}')   # KBank transfers: 0, year - 2010, day of year, hhmmss...
+DATE_CHECK_TOLERANCE = timedelta(days=1) # a transfer just before midnight may be referenced on the next day
+
+EVALUATED_COLUMNS = ['transaction_date', 'transaction_time', 'amount', 'from_account_name',
+                     'to_account_name', 'to_bank', 'ref_number']
+
+@dataclass
+class OcrRecord:
+    bank: str            # labelled bank (dataset folder)
+    predicted_bank: str  # logo classification at OCR time
+    image_path: str
+    ocr: str
+    content_hash: str    # sha256 of the image the text was read from
+    config: dict         # OCR settings the text was produced with
+    current_hash: str    # sha256 of the image on disk now, None when it is missing
+
+    @property
+    def stale(self):
+        return self.current_hash is None or self.current_hash != self.content_hash or self.config != OCR_CONFIG
+
+def _local_path(image_path):
+    # the dataset CSVs were written on Windows
+    return image_path.replace('\\', os.sep)
+
+class OcrStore:
+    """Stored OCR text, looked up by (image sha256, OCR config)."""
+
+    def __init__(self, records, csv_path=None):
+        self.records = records
+        self.csv_path = csv_path
+        self._by_key = {(r.content_hash, config_hash(r.config)): r for r in records if r.content_hash}
+
+    @classmethod
+    def from_csv(cls, csv_path=OCR_CSV):
+        """Records of an eslip_ocr.csv. Rows without image_sha256 / ocr_config columns (written before
+        replay existed) are taken to be OCR of the image as it is now, made with OCR_CONFIG."""
+        df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+        records = []
+        for row in df.to_dict('records'):
+            path = _local_path(row['image_path'])
+            current_hash = file_sha256(path) if os.path.isfile(path) else None
+            records.append(OcrRecord(bank=row.get('bank'), predicted_bank=row.get('predicted_bank'),
+                                     image_path=row['image_path'], ocr=row['ocr'],
+                                     content_hash=row.get('image_sha256') or current_hash,
+                                     config=json.loads(row['ocr_config']) if row.get('ocr_config') else OCR_CONFIG,
+                                     current_hash=current_hash))
+        return cls(records, csv_path)
+
+    def get(self, content_hash, config=None):
+        return self._by_key.get((content_hash, config_hash(config or OCR_CONFIG)))
+
+    def for_image(self, path, config=None):
+        """Stored record for the image at path (as it is now), or None."""
+        return self.get(file_sha256(path), config)
+
+    def stale(self):
+        """Records that cannot be replayed as current: image missing or changed since OCR, or other OCR settings."""
+        return [r for r in self.records if r.stale]
+
+    def write_keys(self):
+        """Record each row's image sha256 and OCR config in the OCR CSV, so later image changes are detected."""
+        df = pd.read_csv(self.csv_path, dtype=str, keep_default_na=False)
+        df['image_sha256'] = [r.content_hash or '' for r in self.records]
+        df['ocr_config'] = [json.dumps(r.config, sort_keys=True) for r in self.records]
+        df.to_csv(self.csv_path, index=False)
+
+def replay_text(ocr_text, bank):
+    """Parser fields for one slip's OCR text, or None when no rule set handles bank."""
+    ruleset = find_ruleset(E_SLIP_RULES, (bank or '').lower())
+    if ruleset is None:
+        return None
+    return ruleset.parse(ocr_text or '', {'months': MONTHS})
+
+def replay(records, bank_column='predicted_bank'):
+    """eslip_result.csv rows for records (the parser fields, then bank, image_path and ocr)."""
+    rows = []
+    for record in records:
+        bank = getattr(record, bank_column)
+        fields = replay_text(record.ocr, bank)
+        if fields is None:
+            fields = dict.fromkeys(EVALUATED_COLUMNS)
+        rows.append({**fields, 'bank': bank, 'image_path': record.image_path, 'ocr': record.ocr})
+    return pd.DataFrame(rows)
+
+def _missing(series):
+    # (null, empty string) counts, as the notebook counted them
+    null_count = int(series.isnull().sum())
+    empty_count = int((series == '').sum()) if series.dtype == 'object' else 0
+    return null_count, empty_count
+
+def _status(success_rate):
+    return 'Excellent' if success_rate >= 95 else 'Good' if success_rate >= 80 else 'Poor'
+
+def simple_evaluation(df, out_dir=EVALUATION_DIR):
+    """Missing-data counts per bank and field (the notebook's simple_evaluation), written to out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    banks = sorted(df['bank'].unique())
+
+    detailed_results, summary_table_data, comprehensive_data = [], [], []
+    bank_performance = {}
+    for bank in banks:
+        bank_data = df[df['bank'] == bank]
+        total_records = len(bank_data)
+        summary_row = {'bank': bank.upper(), 'total_records': total_records}
+        missing_by_column = {}
+        for column in EVALUATED_COLUMNS:
+            null_count, empty_count = _missing(bank_data[column])
+            total_missing = null_count + empty_count
+            success_count = total_records - total_missing
+            success_rate = (success_count / total_records) * 100
+            detailed_results.append({
+                'bank': bank.upper(), 'column': column, 'total_records': total_records,
+                'null_count': null_count, 'empty_count': empty_count, 'total_missing': total_missing,
+                'success_count': success_count, 'success_rate': round(success_rate, 1), 'status': _status(success_rate)})
+            summary_row[f'{column}_missing'] = total_missing
+            summary_row[f'{column}_success_rate'] = round(success_rate, 1)
+            missing_by_column[column] = total_missing
+        summary_table_data.append(summary_row)
+
+        total_fields = len(EVALUATED_COLUMNS) * total_records
+        overall_success = ((total_fields - sum(missing_by_column.values())) / total_fields) * 100
+        bank_performance[bank] = overall_success
+        comprehensive_data.append({'bank': bank.upper(), 'total_records': total_records,
+                                   'overall_success_rate': round(overall_success, 1),
+                                   **{f'{column}_missing': missing_by_column[column] for column in EVALUATED_COLUMNS}})
+
+    overall_stats, field_performance = [], {}
+    for column in EVALUATED_COLUMNS:
+        total_missing = sum(_missing(df[column]))
+        success_rate = ((len(df) - total_missing) / len(df)) * 100
+        field_performance[column] = success_rate
+        overall_stats.append({'column': column, 'total_records': len(df), 'total_missing': total_missing,
+                              'success_rate': round(success_rate, 1), 'status': _status(success_rate)})
+
+    sorted_fields = sorted(field_performance.items(), key=lambda x: x[1], reverse=True)
+    sorted_banks = sorted(bank_performance.items(), key=lambda x: x[1], reverse=True)
+    frames = {
+        'detailed_results': pd.DataFrame(detailed_results),
+        'summary_by_bank': pd.DataFrame(summary_table_data),
+        'overall_stats': pd.DataFrame(overall_stats),
+        'field_ranking': pd.DataFrame([{'rank': i, 'field': f, 'success_rate': round(rate, 1)}
+                                       for i, (f, rate) in enumerate(sorted_fields, 1)]),
+        'bank_ranking': pd.DataFrame([{'rank': i, 'bank': b.upper(), 'overall_success_rate': round(rate, 1)}
+                                      for i, (b, rate) in enumerate(sorted_banks, 1)]),
+        'comprehensive_summary': pd.DataFrame(comprehensive_data),
+    }
+    for name, file_name in (('detailed_results', 'detailed_missing_data_by_bank_column.csv'),
+                            ('summary_by_bank', 'summary_missing_data_by_bank.csv'),
+                            ('overall_stats', 'overall_statistics.csv'),
+                            ('field_ranking', 'field_performance_ranking.csv'),
+                            ('bank_ranking', 'bank_performance_ranking.csv'),
+                            ('comprehensive_summary', 'comprehensive_evaluation_summary.csv')):
+        frames[name].to_csv(os.path.join(out_dir, file_name), index=False)
+
+    with open(os.path.join(out_dir, 'simple_evaluation_summary.txt'), 'w', encoding='utf-8') as f:
+        f.write("SIMPLE E-SLIP EXTRACTION EVALUATION\n")
+        f.write("="*50 + "\n\n")
+        f.write("MISSING DATA COUNT BY BANK:\n\n")
+        for row in summary_table_data:
+            total_records = row['total_records']
+            f.write(f"{row['bank']} BANK ({total_records} records):\n")
+            for column in EVALUATED_COLUMNS:
+                total_missing = row[f'{column}_missing']
+                success_rate = ((total_records - total_missing) / total_records) * 100
+                f.write(f"  {column}: {total_missing}/{total_records} missing ({success_rate:.1f}% success)\n")
+            f.write("\n")
+        f.write("FIELD PERFORMANCE RANKING:\n")
+        for i, (field_name, rate) in enumerate(sorted_fields, 1):
+            f.write(f"  #{i} {field_name}: {rate:.1f}% success\n")
+        f.write("\nBANK PERFORMANCE RANKING:\n")
+        for i, (bank, rate) in enumerate(sorted_banks, 1):
+            f.write(f"  #{i} {bank.upper()}: {rate:.1f}% overall success\n")
+    return frames
+
+def ref_date(ref_number):
+    """Date a slip's reference number encodes, or None when it carries none."""
+    ref_number = str(ref_number or '')
+    try:
+        match = _REF_YMD.match(ref_number)
+        if match:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        match = _REF_KBANK.match(ref_number)
+        if match and 1 <= int(match.group(2)) <= 366:
+            return date(2010 + int(match.group(1)), 1, 1) + timedelta(days=int(match.group(2)) - 1)
+    except ValueError:
+        pass # digits that are not a date
+    return None
+
+def date_consistency(df, out_dir=EVALUATION_DIR):
+    """Parsed transaction_date against the date in ref_number, for the rows that have both.
+
+    simple_evaluation only counts missing values, so a wrongly read month still counts as a success
+    there; this catches it. Writes out_dir/date_consistency.csv (one row per checked slip) and
+    returns that frame; status is "consistent" or "mismatch".
+    """
+    rows = []
+    for row in df.to_dict('records'):
+        expected = ref_date(row.get('ref_number'))
+        parsed = row.get('transaction_date')
+        if expected is None or not isinstance(parsed, str) or not parsed:
+            continue
+        try:
+            consistent = abs(date.fromisoformat(parsed) - expected) <= DATE_CHECK_TOLERANCE
+        except ValueError:
+            consistent = False
+        rows.append({'bank': row['bank'], 'image_path': row['image_path'], 'transaction_date': parsed,
+                     'ref_number': row['ref_number'], 'ref_date': expected.isoformat(),
+                     'status': 'consistent' if consistent else 'mismatch'})
+    checked = pd.DataFrame(rows, columns=['bank', 'image_path', 'transaction_date', 'ref_number', 'ref_date', 'status'])
+    os.makedirs(out_dir, exist_ok=True)
+    checked.to_csv(os.path.join(out_dir, 'date_consistency.csv'), index=False)
+    return checked
+
+def changed_rows(before, after):
+    """Number of rows whose evaluated fields differ between two eslip_result frames (same row order)."""
+    if len(before) != len(after):
+        return max(len(before), len(after))
+    a = before[EVALUATED_COLUMNS].astype(str).where(before[EVALUATED_COLUMNS].notna(), '')
+    b = after[EVALUATED_COLUMNS].astype(str).where(after[EVALUATED_COLUMNS].notna(), '')
+    return int((a.values != b.values).any(axis=1).sum())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ocr-csv', default=OCR_CSV)
+    parser.add_argument('--result-csv', default=RESULT_CSV)
+    parser.add_argument('--evaluation-dir', default=EVALUATION_DIR)
+    parser.add_argument('--bank-column', default='predicted_bank', choices=['predicted_bank', 'bank'],
+                        help='parse with the logo classification (default) or the labelled bank')
+    parser.add_argument('--no-evaluation', action='store_true', help='only regenerate the result CSV')
+    parser.add_argument('--allow-stale', action='store_true',
+                        help='also replay OCR whose image is missing or changed, or made with other OCR settings')
+    parser.add_argument('--write-keys', action='store_true',
+                        help='add image_sha256 and ocr_config columns to the OCR CSV')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    store = OcrStore.from_csv(args.ocr_csv)
+    stale = store.stale()
+    t1 = time.perf_counter()
+    if stale and not args.allow_stale:
+        for record in stale:
+            print(f"Stale OCR for {record.image_path} (image missing or changed, or other OCR settings)")
+        print(f"{len(stale)} of {len(store.records)} records are stale; re-run OCR for them or pass --allow-stale")
+        return 1
+    if args.write_keys:
+        store.write_keys()
+
+    result = replay(store.records, bank_column=args.bank_column)
+    t2 = time.perf_counter()
+    previous = pd.read_csv(args.result_csv) if os.path.isfile(args.result_csv) else None
+    result.to_csv(args.result_csv, index=False)
+    result = pd.read_csv(args.result_csv) # evaluate what the CSV holds, as the notebook did
+    changed = f", {changed_rows(previous, result)} changed" if previous is not None else ""
+    print(f"Replayed {len(result)} slips into {args.result_csv}{changed} "
+          f"(load and hash {t1 - t0:.2f}s, parse {t2 - t1:.2f}s)")
+    if not args.no_evaluation:
+        frames = simple_evaluation(result, args.evaluation_dir)
+        print(f"Evaluation written to {args.evaluation_dir}/")
+        for row in frames['bank_ranking'].to_dict('records'):
+            print(f"  #{row['rank']} {row['bank']}: {row['overall_success_rate']:.1f}% overall success")
+        checked = date_consistency(result, args.evaluation_dir)
+        mismatches = checked[checked['status'] == 'mismatch']
+        print(f"Date check: {len(checked) - len(mismatches)} of {len(checked)} dated references agree with the parsed date")
+        for row in mismatches.to_dict('records'):
+            print(f"  MISMATCH {row['image_path']}: parsed {row['transaction_date']}, reference says {row['ref_date']}")
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
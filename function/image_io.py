@@ -0,0 +1,133 @@
+#  Shared image decoding for uploads.
+#  A DecodedImage reads the file (or request body) once and derives each view the pipeline needs
+#  on first use: grayscale for e-slip OCR and logo matching, colour for the physical-slip detector,
+#  and smaller JPEG decodes (libjpeg DCT scaling) when a stage is going to shrink the image anyway.
+#  HEIC/HEIF goes through pillow-heif here and nowhere else.
+import hashlib
+import io
+import os
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+import pillow_heif
+
+pillow_heif.register_heif_opener()
+
+HEIF_EXTENSIONS = ('.heic', '.heif')
+HEIF_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1')
+JPEG_REDUCTIONS = {8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                   4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                   2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2)}
+
+class DecodedImage:
+    """One upload's bytes plus lazily decoded, cached views.
+
+    color is BGR in the stored pixel orientation (what the physical-slip detector has always
+    been given), gray applies the EXIF orientation (what the e-slip OCR has always read).
+    Views are read-only by convention: stages copy before drawing on them.
+    """
+
+    def __init__(self, data, name=''):
+        self.data = data
+        self.name = name
+        self._views = {}
+        self._lock = threading.RLock() # views may be built from other views
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read(), path)
+
+    @classmethod
+    def ensure(cls, image):
+        """DecodedImage for a DecodedImage, a file path or raw bytes."""
+        if isinstance(image, cls):
+            return image
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return cls(bytes(image))
+        if isinstance(image, (str, os.PathLike)):
+            return cls.open(os.fspath(image))
+        raise TypeError(f"Cannot decode an image from {type(image)}")
+
+    @property
+    def is_heif(self):
+        return self.data[4:8] == b'ftyp' and self.data[8:12] in HEIF_BRANDS \
+            or os.path.splitext(self.name)[1].lower() in HEIF_EXTENSIONS
+
+    @property
+    def is_jpeg(self):
+        return self.data[:3] == b'\xff\xd8\xff'
+
+    @property
+    def sha256(self):
+        return self._view('sha256', lambda: hashlib.sha256(self.data).hexdigest())
+
+    @property
+    def size(self):
+        """(width, height) from the header, without decoding pixels."""
+        def read():
+            try:
+                with self.pil() as image:
+                    return image.size
+            except Exception as e:
+                raise ValueError(f'Could not decode image {self.name or "(bytes)"}') from e
+        return self._view('size', read)
+
+    @property
+    def rgb(self):
+        if self.is_heif:
+            return self._view('rgb', lambda: np.array(self.pil().convert('RGB')))
+        return self._view('rgb', lambda: cv2.cvtColor(self.color, cv2.COLOR_BGR2RGB))
+
+    @property
+    def color(self):
+        if self.is_heif:
+            return self._view('color', lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR))
+        return self._view('color', lambda: self._imdecode(cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION))
+
+    @property
+    def gray(self):
+        if self.is_heif:
+            return self._view('gray', lambda: np.array(self.pil().convert('L')))
+        return self._view('gray', lambda: self._imdecode(cv2.IMREAD_GRAYSCALE))
+
+    def reduction_for(self, scale):
+        """Largest JPEG decode reduction (1, 2, 4 or 8) that still leaves at least scale * size."""
+        if not self.is_jpeg or scale >= 1:
+            return 1
+        return next((factor for factor in JPEG_REDUCTIONS if factor * scale <= 1), 1)
+
+    def color_reduced(self, factor):
+        # BGR decoded at 1/factor (JPEG only, any other factor or format -> full colour)
+        if factor not in JPEG_REDUCTIONS or not self.is_jpeg:
+            return self.color
+        return self._view(f'color/{factor}', lambda: self._imdecode(JPEG_REDUCTIONS[factor][0] | cv2.IMREAD_IGNORE_ORIENTATION))
+
+    def gray_reduced(self, factor):
+        if factor not in JPEG_REDUCTIONS or not self.is_jpeg:
+            return self.gray
+        return self._view(f'gray/{factor}', lambda: self._imdecode(JPEG_REDUCTIONS[factor][1]))
+
+    def to_jpeg(self, quality=75):
+        """Full-size JPEG of the image as a BytesIO (for browsers that cannot show HEIC)."""
+        output = io.BytesIO()
+        self.pil().convert('RGB').save(output, format='JPEG', quality=quality)
+        output.seek(0)
+        return output
+
+    def pil(self):
+        """A new PIL image over the bytes (HEIC/HEIF through pillow-heif)."""
+        return Image.open(io.BytesIO(self.data))
+
+    def _imdecode(self, flags):
+        image = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), flags)
+        if image is None:
+            raise ValueError(f'Could not decode image {self.name or "(bytes)"}')
+        return image
+
+    def _view(self, name, build):
+        with self._lock:
+            if name not in self._views:
+                self._views[name] = build()
+            return self._views[name]
@@ -0,0 +1,147 @@
+#  In-process background jobs (no external broker).
+#  Long-running work such as /extract_all_data is submitted to a JobQueue and runs on its worker
+#  threads; the request returns the job id straight away and clients poll the job for progress,
+#  per-file status and ETA, or ask it to stop.
+import itertools
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import dataclass, field
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+JOB_HISTORY = 50 # finished jobs kept for status queries
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    target: object = None                      # callable(job) -> JSON-friendly result
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    files: dict = field(default_factory=dict)  # key -> {'status', 'error', 'seconds'}
+    total: int = 0                             # files that will go through the pipeline
+    completed: int = 0                         # of those, finished (ok or failed)
+    failed: int = 0
+    skipped: int = 0                           # files left out of the run (e.g. unchanged)
+    result: object = None
+    error: str = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    # --- progress hooks called by the running work ---
+    def plan(self, keys, skipped=()):
+        with self._lock:
+            for key in skipped:
+                self.files[key] = {'status': 'skipped', 'error': None, 'seconds': None}
+            for key in keys:
+                self.files[key] = {'status': 'pending', 'error': None, 'seconds': None}
+            self.total = len(keys)
+            self.skipped = len(skipped)
+
+    def file_done(self, key, error=None, seconds=None):
+        with self._lock:
+            self.files[key] = {'status': 'failed' if error else 'done', 'error': error, 'seconds': seconds}
+            self.completed += 1
+            self.failed += bool(error)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    # --- views for the JSON endpoints ---
+    def eta(self):
+        # seconds left, from the mean time per finished file so far
+        if self.status != RUNNING or not self.completed or not self.started:
+            return None
+        per_file = (time.time() - self.started) / self.completed
+        return per_file * (self.total - self.completed)
+
+    def progress(self):
+        end = self.finished or time.time()
+        with self._lock:
+            return {'job_id': self.id, 'kind': self.kind, 'status': self.status,
+                    'total': self.total, 'completed': self.completed, 'failed': self.failed, 'skipped': self.skipped,
+                    'percent': round(100.0 * self.completed / self.total, 1) if self.total else (100.0 if self.status == DONE else 0.0),
+                    'elapsed_seconds': (end - self.started) if self.started else 0.0,
+                    'eta_seconds': self.eta(), 'cancel_requested': self.cancelled(),
+                    'result': self.result, 'error': self.error}
+
+    def file_status(self):
+        with self._lock:
+            return {'job_id': self.id, 'status': self.status, 'files': dict(self.files)}
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, history=JOB_HISTORY):
+        self.history = history
+        self._jobs = {} # id -> Job, in submission order
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._counter = itertools.count(1)
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._run, daemon=True, name=f'job-worker-{i}').start()
+
+    def submit(self, kind, target):
+        job = Job(id=f'{next(self._counter)}-{uuid.uuid4().hex[:8]}', kind=kind, target=target)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        if job.status == QUEUED:
+            job.status, job.finished = CANCELLED, time.time()
+        return job
+
+    def _trim(self):
+        finished = [j for j in self._jobs.values() if j.status in (DONE, FAILED, CANCELLED)]
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job.status == CANCELLED:
+                continue
+            job.status, job.started = RUNNING, time.time()
+            try:
+                job.result = job.target(job)
+                job.status = CANCELLED if job.cancelled() else DONE
+            except Exception as e:
+                traceback.print_exc()
+                job.error, job.status = str(e), FAILED
+            finally:
+                job.finished = time.time()
+                job.target = None # drop references to the work once it is done
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Shared JobQueue, started on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,76 @@
+#  Month and year normalisation for slip dates, built once at import.
+#  Month tokens are folded (dots and spaces removed, lower-cased) so every spelling of an
+#  abbreviation ("มี.ค.", "มีค", "มี.ค") is one dict lookup. OCR-garbled forms seen in the dataset
+#  (Thai glyphs read as Latin letters: "w.A." for พ.ค., "n.A." for ก.ค.) have their own table, and a
+#  two-character prefix index stands in for the old scan over every key.
+import re
+
+THAI_MONTHS = {
+    "ม.ค.": "01", "ก.พ.": "02", "มี.ค.": "03", "เม.ย.": "04",
+    "พ.ค.": "05", "มิ.ย.": "06", "ก.ค.": "07", "ส.ค.": "08",
+    "ก.ย.": "09", "ต.ค.": "10", "พ.ย.": "11", "ธ.ค.": "12",
+    "ก.ุพ.": "02", # sara u read under ก
+    "Jan": "01", "Feb": "02", "Mar": "03", "Apr": "04",
+    "May": "05", "Jun": "06", "Jul": "07", "Aug": "08",
+    "Sep": "09", "Oct": "10", "Nov": "11", "Dec": "12"
+}
+
+# garbled month tokens from results_csv/eslip_ocr.csv. Checked against the date in the slip's
+# reference number where it carries one; "มมี.ค.", "กท.ย." and "ก.ุย." (no dated reference) are
+# read from the glyphs, a doubled or stray character around a known abbreviation.
+FUZZY_MONTHS = {
+    "nw.": "02", "7.W.": "02",
+    "U.A.": "03", "G.A.": "03", "มมี.ค.": "03",
+    "wig.": "04", "Wg.": "04", # SCB refs 20250404...; the paired slips read "04 เม.ย. 2568"
+    "w.A.": "05",
+    "n.A.": "07", "ท.ค.": "07", "ทก.ค.": "07",
+    "ท.ย.": "09", "กท.ย.": "09", "ก.ุย.": "09",
+    "o.A.": "10", "๓.ค.": "10"
+}
+
+_FOLD = re.compile(r"[.\s]+")
+
+def fold_month(token):
+    """Canonical key of a month token: no dots or spaces, lower case."""
+    return _FOLD.sub("", token).lower()
+
+class MonthTable:
+    """Month number ("01".."12") lookup over folded keys."""
+
+    def __init__(self, months, fuzzy=None):
+        self.months = months
+        self._exact = {}
+        self._prefix = {} # first two folded characters -> month of the first key (in table order) with them
+        for key, month in months.items():
+            folded = fold_month(key)
+            if self._exact.setdefault(folded, month) != month:
+                raise ValueError(f"Month key {key!r} folds onto another month")
+            if len(folded) > 1:
+                self._prefix.setdefault(folded[:2], month)
+        self._fuzzy = {fold_month(key): month for key, month in (fuzzy or {}).items()}
+
+    def lookup(self, token, prefix=False):
+        """Month number for token, or None. prefix=True also accepts a token that only shares
+        its first two characters with a known abbreviation (what OCR usually keeps intact)."""
+        folded = fold_month(token)
+        month = self._exact.get(folded) or self._fuzzy.get(folded)
+        if month is None and prefix and len(folded) > 1:
+            month = self._prefix.get(folded[:2])
+        return month
+
+MONTHS = MonthTable(THAI_MONTHS, FUZZY_MONTHS)
+
+def normalize_year(year_str):
+    """Gregorian year from a 2- or 4-digit Buddhist-era or Gregorian year, None if not a number."""
+    try:
+        year = int(year_str)
+        if year < 100:
+            if year > 50:
+                year += 2500
+            else:
+                year += 2000
+        if year > 2500:
+            year -= 543
+        return year
+    except ValueError:
+        return None
@@ -0,0 +1,61 @@
+#  Optional sink for per-slip debug artifacts (OCR lines, extracted fields).
+#  Off by default. Set ARTIFACT_DIR to enable it: every slip is then written to
+#  ARTIFACT_DIR/<sha256 of the slip image>.json by one background thread, so the request path
+#  never waits on disk and concurrent workers never share a file.
+import hashlib
+import json
+import os
+import queue
+import threading
+
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR')
+
+def content_hash(image):
+    # sha256 of the decoded pixels, so the key does not depend on file name or container format
+    return hashlib.sha256(image.tobytes()).hexdigest()
+
+class ArtifactSink:
+    def __init__(self, directory, max_pending=256):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True, name='artifact-sink')
+        self._thread.start()
+
+    def submit(self, key, payload):
+        """Queue payload for ARTIFACT_DIR/<key>.json; dropped (not blocking) when the writer is behind."""
+        try:
+            self._queue.put_nowait((key, payload))
+        except queue.Full:
+            print(f"Artifact sink is full, dropping artifact {key}")
+
+    def flush(self):
+        """Block until every queued artifact has been written."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            key, payload = self._queue.get()
+            try:
+                path = os.path.join(self.directory, f'{key}.json')
+                tmp_path = f'{path}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, indent=4, default=str)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Could not write artifact {key}: {e}")
+            finally:
+                self._queue.task_done()
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_artifact_sink():
+    """Shared ArtifactSink for ARTIFACT_DIR, or None when artifacts are disabled."""
+    global _sink
+    if not ARTIFACT_DIR:
+        return None
+    with _sink_lock:
+        if _sink is None:
+            _sink = ArtifactSink(ARTIFACT_DIR)
+        return _sink
@@ -0,0 +1,189 @@
+#  Pluggable slip detectors for process_physical_slip.
+#  'pytorch'  -> Ultralytics YOLO on best.pt (shared through model_registry)
+#  'onnx'     -> best.pt exported to ONNX and run with ONNX Runtime on CPU
+#  'onnx-int8'-> same, with dynamically quantised INT8 weights
+#  'openvino' -> the ONNX model on ONNX Runtime's OpenVINO execution provider (falls back to CPU)
+#  Every backend returns the same list of Detection(box, class_name, confidence).
+import ast
+import os
+import threading
+import time
+from dataclasses import dataclass
+import cv2
+import numpy as np
+from function.physical import model_registry
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+DETECTOR_BACKEND = os.environ.get('DETECTOR_BACKEND', 'pytorch')
+DETECTOR_BACKENDS = ('pytorch', 'onnx', 'onnx-int8', 'openvino')
+
+@dataclass
+class Detection:
+    box: tuple          # (xmin, ymin, xmax, ymax) in image pixels
+    class_name: str
+    confidence: float
+
+class UltralyticsDetector:
+    backend = 'pytorch'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.names = model_registry.get_model(model_path).names
+
+    def detect(self, image):
+        # image is BGR, as Ultralytics expects for numpy input
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        # Ultralytics letterboxes a batch of mixed shapes to a full square, but one image (or a batch
+        # of one shape) to the smallest stride-aligned rectangle. Batching by shape keeps each image's
+        # letterbox, and so its detections, the same as detect() on it alone.
+        images = list(images)
+        by_shape = {}
+        for i, image in enumerate(images):
+            by_shape.setdefault(image.shape, []).append(i)
+        batch = [None] * len(images)
+        for indices in by_shape.values():
+            results = model_registry.predict(self.model_path, [images[i] for i in indices], verbose=False)
+            for i, result in zip(indices, results):
+                detections = []
+                for box in result.boxes:
+                    xmin, ymin, xmax, ymax = box.xyxy.cpu().numpy().squeeze().astype(int)
+                    detections.append(Detection((xmin, ymin, xmax, ymax), self.names[int(box.cls.item())], box.conf.item()))
+                batch[i] = detections
+        return batch
+
+def letterbox(image, size):
+    # resize keeping aspect ratio and pad to size x size with grey, as Ultralytics does
+    h, w = image.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, r, (left, top)
+
+class OnnxDetector:
+    def __init__(self, onnx_path, backend='onnx', conf=0.25, iou=0.7):
+        if ort is None:
+            raise ImportError("onnxruntime is required for the ONNX detector backend (pip install onnxruntime)")
+        self.onnx_path = onnx_path
+        self.backend = backend
+        self.conf = conf
+        self.iou = iou
+        providers = ['CPUExecutionProvider']
+        if backend == 'openvino' and 'OpenVINOExecutionProvider' in ort.get_available_providers():
+            providers.insert(0, 'OpenVINOExecutionProvider')
+        t0 = time.perf_counter()
+        self.session = ort.InferenceSession(onnx_path, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        # Ultralytics stores class names and image size in the ONNX metadata
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(meta['names']) if 'names' in meta else {}
+        imgsz = ast.literal_eval(meta['imgsz']) if 'imgsz' in meta else [640, 640]
+        self.imgsz = imgsz[0] if isinstance(imgsz, (list, tuple)) else int(imgsz)
+        self.metrics = {'load_time': time.perf_counter() - t0, 'warmup_time': None,
+                        'inference_count': 0, 'inference_time_total': 0.0, 'last_inference_time': None}
+        t0 = time.perf_counter()
+        self.detect(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8))
+        self.metrics['warmup_time'] = time.perf_counter() - t0
+
+    def _preprocess(self, image):
+        padded, r, pad = letterbox(image, self.imgsz)
+        blob = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255.0
+        return blob, r, pad
+
+    def _postprocess(self, output, r, pad, shape):
+        # output: (4 + num_classes, num_anchors) with boxes as centre x, centre y, w, h
+        preds = output.T
+        scores = preds[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > self.conf
+        preds, class_ids, confidences = preds[keep], class_ids[keep], confidences[keep]
+        if len(preds) == 0:
+            return []
+        boxes = preds[:, :4].copy()
+        boxes[:, 0] -= boxes[:, 2] / 2
+        boxes[:, 1] -= boxes[:, 3] / 2
+        # per-class NMS, like Ultralytics' default (agnostic=False)
+        indices = cv2.dnn.NMSBoxesBatched(boxes.tolist(), confidences.tolist(), class_ids.tolist(), self.conf, self.iou)
+        detections = []
+        h, w = shape[:2]
+        for i in sorted(np.array(indices).flatten(), key=lambda i: -confidences[i]):
+            x, y, bw, bh = boxes[i]
+            xmin = int(np.clip((x - pad[0]) / r, 0, w))
+            ymin = int(np.clip((y - pad[1]) / r, 0, h))
+            xmax = int(np.clip((x + bw - pad[0]) / r, 0, w))
+            ymax = int(np.clip((y + bh - pad[1]) / r, 0, h))
+            detections.append(Detection((xmin, ymin, xmax, ymax), self.names.get(int(class_ids[i]), str(class_ids[i])), float(confidences[i])))
+        return detections
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        batch = [self._preprocess(image) for image in images]
+        t0 = time.perf_counter()
+        outputs = []
+        # exported models have a fixed batch size of 1 unless exported with dynamic=True
+        for blob, _, _ in batch:
+            outputs.append(self.session.run(None, {self.input_name: blob[None]})[0][0])
+        elapsed = time.perf_counter() - t0
+        self.metrics['inference_count'] += len(images)
+        self.metrics['inference_time_total'] += elapsed
+        self.metrics['last_inference_time'] = elapsed / max(len(images), 1)
+        return [self._postprocess(output, r, pad, image.shape) for output, (_, r, pad), image in zip(outputs, batch, images)]
+
+def export_onnx(model_path, int8=False, imgsz=640):
+    """Export best.pt to best.onnx next to it (and best.int8.onnx when int8=True); returns the path to use."""
+    onnx_path = os.path.splitext(model_path)[0] + '.onnx'
+    if not os.path.exists(onnx_path):
+        exported = model_registry.get_model(model_path, warmup=False).export(format='onnx', imgsz=imgsz)
+        if os.path.abspath(exported) != os.path.abspath(onnx_path):
+            os.replace(exported, onnx_path)
+    if not int8:
+        return onnx_path
+    int8_path = os.path.splitext(model_path)[0] + '.int8.onnx'
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+def get_detector(model_path, backend=None):
+    """Shared detector for (model_path, backend); ONNX models are exported from best.pt on first use."""
+    backend = backend or DETECTOR_BACKEND
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r}, expected one of {DETECTOR_BACKENDS}")
+    key = (os.path.abspath(model_path), backend)
+    with _detectors_lock:
+        detector = _detectors.get(key)
+        if detector is None:
+            if backend == 'pytorch':
+                detector = UltralyticsDetector(model_path)
+            else:
+                onnx_path = model_path if model_path.endswith('.onnx') else export_onnx(model_path, int8=backend == 'onnx-int8')
+                detector = OnnxDetector(onnx_path, backend=backend)
+            _detectors[key] = detector
+        return detector
+
+def get_detector_metrics():
+    """Load and inference metrics of every detector backend in use."""
+    metrics = {f'{path} [pytorch]': m for path, m in model_registry.get_model_metrics().items()}
+    with _detectors_lock:
+        for (path, backend), detector in _detectors.items():
+            if backend != 'pytorch':
+                m = dict(detector.metrics)
+                m['mean_inference_time'] = (m['inference_time_total'] / m['inference_count']) if m['inference_count'] else None
+                metrics[f'{detector.onnx_path} [{backend}]'] = m
+    return metrics
@@ -0,0 +1,80 @@
+#  Process-wide registry of YOLO models, keyed by model path.
+#  A model is loaded (and warmed up with one dummy inference) the first time it is asked for,
+#  then reused by every request; load and inference times are kept as metrics.
+import os
+import threading
+import time
+import numpy as np
+from ultralytics import YOLO
+
+WARMUP_SHAPE = (640, 640, 3)
+
+class _ModelEntry:
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+        self.lock = threading.Lock() # Ultralytics predictors are not thread-safe
+        self.metrics = {
+            'load_time': None,
+            'warmup_time': None,
+            'inference_count': 0,
+            'inference_time_total': 0.0,
+            'last_inference_time': None,
+        }
+
+    def load(self, warmup=True):
+        t0 = time.perf_counter()
+        self.model = YOLO(self.model_path, task='detect') # task='detect' => obj detection => get bb and class
+        self.metrics['load_time'] = time.perf_counter() - t0
+        if warmup:
+            t0 = time.perf_counter()
+            self.model(np.zeros(WARMUP_SHAPE, dtype=np.uint8), verbose=False)
+            self.metrics['warmup_time'] = time.perf_counter() - t0
+
+_entries = {}
+_registry_lock = threading.Lock()
+
+def _get_entry(model_path, warmup=True):
+    key = os.path.abspath(model_path)
+    with _registry_lock:
+        entry = _entries.get(key)
+        if entry is None:
+            entry = _ModelEntry(key)
+            _entries[key] = entry
+    # load outside the registry lock so other models are not blocked
+    with entry.lock:
+        if entry.model is None:
+            entry.load(warmup=warmup)
+    return entry
+
+def get_model(model_path, warmup=True):
+    """Shared YOLO model for model_path, loaded and warmed up on first use."""
+    return _get_entry(model_path, warmup).model
+
+def warm_up(model_path):
+    """Load and warm up a model ahead of the first request."""
+    get_model(model_path, warmup=True)
+
+def predict(model_path, image, **kwargs):
+    """Run detection with the shared model (one image or a list) and record the inference time."""
+    entry = _get_entry(model_path)
+    with entry.lock:
+        t0 = time.perf_counter()
+        results = entry.model(image, **kwargs)
+        elapsed = time.perf_counter() - t0
+    images = len(image) if isinstance(image, (list, tuple)) else 1 # a batch counts once per image
+    entry.metrics['inference_count'] += images
+    entry.metrics['inference_time_total'] += elapsed
+    entry.metrics['last_inference_time'] = elapsed / max(images, 1)
+    return results
+
+def get_model_metrics():
+    """{model_path: metrics} for every loaded model."""
+    with _registry_lock:
+        entries = list(_entries.values())
+    metrics = {}
+    for entry in entries:
+        m = dict(entry.metrics)
+        m['mean_inference_time'] = (m['inference_time_total'] / m['inference_count']) if m['inference_count'] else None
+        metrics[entry.model_path] = m
+    return metrics
@@ -1,32 +1,20 @@
-from ultralytics import YOLO
 import cv2
-import pandas as pd
 import numpy as np
 import os
-from PIL import Image
-from pathlib import Path
-# import matplotlib.pylab as plt
-import matplotlib.pyplot as plt
-import pillow_heif
-import sys
 import imutils
-from operator import itemgetter
-from glob import glob
 from scipy.spatial import distance as dist
-import pytesseract
-import json
-import re
-from function.physical.extract_info import bkk_extracted, kplus_extracted, krungthai_extracted
-from function.e_slip.ocr_tesseract import ocr_pytesseract
-
-# Register HEIC support
-pillow_heif.register_heif_opener()
-def convert_heic_or_heif_to_jpeg(filepath):
-    try:
-        img = Image.open(filepath).convert("RGB")
-        return np.array(img)  # Return image as NumPy array
-    except Exception as e:
-        return None 
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from function.physical.extract_info import PHYSICAL_RULES
+from function.rule_engine import find_ruleset, rules_signature
+from function.e_slip.ocr_engine import get_ocr_engine
+from function.physical.detector import get_detector, DETECTOR_BACKEND
+from function.result_cache import get_result_cache, cache_key
+from function.physical.artifacts import content_hash, get_artifact_sink
+from function.image_io import DecodedImage
 
 # resize image for display
 def resize(image, max_width=1280, max_height=720):
@@ -36,32 +24,31 @@ def resize(image, max_width=1280, max_height=720):
         image = cv2.resize(image, (int(width * scale), int(height * scale)))
     return image
 
-def get_4_coordinates(binary,gray_image):
+def get_4_coordinates(binary,gray_image,debug=False):
     # find the largest contour in the threshold image
-    cnts = cv2.findContours(binary.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     cnts = imutils.grab_contours(cnts)
     c = max(cnts, key=cv2.contourArea)
     (x, y, w, h) = cv2.boundingRect(c)
 
-    # to demonstrate the impact of contour approximation -> loop over a number of epsilon sizes
+    # loop over a number of epsilon sizes until the contour approximates to 4 points
+    peri = cv2.arcLength(c, True)
     for eps in np.linspace(0.001, 0.05, 10):
         # approximate the contour
-        peri = cv2.arcLength(c, True)
         approx = cv2.approxPolyDP(c, eps * peri, True)
+        if len(approx)==4:
+            break
 
-        # draw the approximated contour on the image
+    # draw the final approximated contour on the image (debug only)
+    detected_4_coor_with_contour = None
+    if debug:
         detected_4_coor_with_contour = gray_image.copy()
         cv2.drawContours(detected_4_coor_with_contour, [approx], -1, (0, 255, 0), 3)
         text = "eps={:.4f}, num_pts={}".format(eps, len(approx))
         cv2.putText(detected_4_coor_with_contour, text, (x, y - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-        
-        if len(approx)==4:
-            break
 
     if len(approx)==4:
         corners = approx.reshape(4, 2)  # reshape to (4, 2) for convenience
-        for i, point in enumerate(corners):
-            x, y = point
 
         # sort the corners for perspective transform
         # Use top-left, top-right, bottom-right, bottom-left order
@@ -77,71 +64,262 @@ def get_4_coordinates(binary,gray_image):
 
         ordered_corners = sort_corners(corners)
     else:
-        print(f"ERROR: Got {len(approx)} points — not a quadrilateral. Try adjusting epsilon.")
-        sys.exit(0)
+        raise ValueError(f"Got {len(approx)} points — not a quadrilateral. Try adjusting epsilon.")
     
     return ordered_corners, detected_4_coor_with_contour
 
-def process_physical_slip(image_path, model_path=r'models\best.pt'):
+@dataclass
+class PhysicalSlipResult:
+    bank: str                                   # detector class: bkk, kplus, krungthai, scb
+    confidence: float
+    box: tuple                                  # (xmin, ymin, xmax, ymax) of the slip in the resized image
+    corners: np.ndarray = None                  # TL, TR, BL, BR inside the box
+    fields: object = None                       # bank regex output (dict), or OCR lines for scb
+    raw_ocr: str = ''
+    timings: dict = field(default_factory=dict) # seconds per stage
+    debug: dict = None                          # intermediate images, only with debug=True
+
+    def as_tuple(self):
+        # legacy 10-tuple of process_physical_slip (images only with debug=True)
+        d = self.debug or {}
+        return (d.get('image'), d.get('after_yolo'), self.confidence, self.bank, d.get('binary'),
+                d.get('detected_4_coor_with_contour'), d.get('perspective_trans'), d.get('thresh'),
+                d.get('binaryInv'), self.fields)
+
+    def to_dict(self):
+        # JSON-friendly view without the debug images
+        return {'bank': self.bank, 'confidence': float(self.confidence), 'box': [int(v) for v in self.box],
+                'corners': None if self.corners is None else np.asarray(self.corners).tolist(),
+                'fields': self.fields, 'raw_ocr': self.raw_ocr, 'timings': dict(self.timings)}
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data['box'] = tuple(data['box'])
+        if data.get('corners') is not None:
+            data['corners'] = np.array(data['corners'])
+        return cls(**data)
+
+PHYSICAL_BATCH_SIZE = int(os.environ.get('PHYSICAL_BATCH_SIZE', 8))
+
+def load_physical_image(image_path, max_width=1280, max_height=720):
+    """Decode a physical slip and bring it to the size and channel order the detector expects.
+
+    image_path may also be raw bytes or a DecodedImage. A JPEG much larger than max_width x
+    max_height is decoded at 1/2, 1/4 or 1/8 scale instead of in full.
+    """
 
     # supported filetype
-    img_ext_list = ['.jpg','.JPG','.jpeg','.JPEG','.png','.PNG','.bmp','.BMP']
-
-    # check image type
-    file_extension = os.path.splitext(image_path)[1]
-    # change image type(if .heif/.heic)
-    if file_extension in img_ext_list:
-        # read image
-        image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-    elif (file_extension=='.HEIC'or file_extension=='.heic'or file_extension=='.HEIF'or file_extension=='.heif'):
-        # convert to .JPEG
-        image = convert_heic_or_heif_to_jpeg(image_path) # return as np array
-        if image is None:
-            print('ERROR: HEIC/HEIF file conversion failed. Please check the file.')
-            sys.exit(0)
+    img_ext_list = ['.jpg','.jpeg','.png','.bmp']
+
+    decoded = DecodedImage.ensure(image_path)
+    file_extension = os.path.splitext(decoded.name)[1].lower()
+    if decoded.is_heif:
+        # the detector was tuned on PIL's RGB for HEIC and OpenCV's BGR for the rest (swapped below)
+        try:
+            image = decoded.rgb
+        except Exception as e:
+            raise ValueError('HEIC/HEIF file conversion failed. Please check the file.') from e
+    elif file_extension in img_ext_list or not decoded.name:
+        width, height = decoded.size
+        image = decoded.color_reduced(decoded.reduction_for(min(max_width / width, max_height / height)))
     else:
-        print(f'Input {image_path} is invalid. Please try again.')
-        sys.exit(0)
-
-    # load YOLO model and get labelmap
-    model = YOLO(model_path, task='detect') # task='detect' => obj detection => get bb and class
-    labels = model.names # is to map between class id and classname 
+        raise ValueError(f'Input {decoded.name} is invalid. Please try again.')
 
     # resize for appropriate scale
-    image = resize(image)
+    image = resize(image, max_width, max_height)
 
     # rescale color scale -> effect model's confidence percentage
     image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    return image
 
-    # -------image preprocessing--------
-    # run detection
-    results = model(image)
-    # get the results
-    detections = results[0].boxes
+def _physical_cache_key(image, model_path, detector_backend):
+    # image bytes + detector model (path, mtime, backend) + OCR settings + parser rules
+    model_mtime = os.stat(model_path).st_mtime_ns if os.path.exists(model_path) else None
+    config = {'model': os.path.abspath(model_path), 'model_mtime': model_mtime,
+              'backend': detector_backend or DETECTOR_BACKEND, 'ocr': {'lang': 'tha+eng', 'psm': 6, 'oem': 3},
+              'rules': rules_signature('physical')}
+    return cache_key('physical', image.sha256, config)
+
+def _cache_lookup(cache, image, model_path, detector_backend):
+    # (key, cached PhysicalSlipResult or None); (None, None) when the cache cannot be used
+    t0 = time.perf_counter()
+    try:
+        key = _physical_cache_key(image, model_path, detector_backend)
+        cached = cache.get(key)
+    except Exception as e:
+        print(f"Result cache unavailable for {image.name}: {e}")
+        return None, None
+    if cached is None:
+        return key, None
+    payload, raw_ocr = cached
+    result = PhysicalSlipResult.from_dict({**payload, 'raw_ocr': raw_ocr})
+    result.timings = {'cache': time.perf_counter() - t0}
+    return key, result
+
+def _cache_store(cache, key, result):
+    try:
+        payload = result.to_dict()
+        cache.put(key, 'physical', payload, payload.pop('raw_ocr'))
+    except Exception as e:
+        print(f"Could not cache physical slip result: {e}")
+
+def extract_physical_slip(image_path, model_path=r'models\best.pt', detector_backend=None, debug=False, use_cache=True):
+    """Detect, rectify and OCR one physical slip; returns a PhysicalSlipResult.
+
+    image_path may also be raw bytes or a DecodedImage. Intermediate images are only kept (in
+    result.debug) when debug=True. Otherwise results of unchanged files are served from the
+    result cache unless use_cache is False.
+    """
+    t0 = time.perf_counter()
+    decoded = DecodedImage.ensure(image_path) # one read for the cache key and the decode
+    image_path = decoded.name
+    cache = get_result_cache() if use_cache and not debug else None
+    key = None
+    if cache is not None:
+        key, cached = _cache_lookup(cache, decoded, model_path, detector_backend)
+        if cached is not None:
+            return cached
+
+    image = load_physical_image(decoded)
+    t1 = time.perf_counter()
+
+    # shared detector (PyTorch or exported ONNX, see DETECTOR_BACKEND), loaded once per process
+    detector = get_detector(model_path, detector_backend)
 
+    # -------image preprocessing--------
+    # run detection -> [Detection(box, class_name, confidence)], highest confidence first
+    detections = detector.detect(image)
+    if not detections:
+        raise ValueError(f'No slip detected in {image_path}')
+    t2 = time.perf_counter()
+
+    result = finish_physical_slip(image, detections[0], debug=debug)
+    result.timings = {'decode': t1 - t0, 'detection': t2 - t1, **result.timings}
+    if key is not None:
+        _cache_store(cache, key, result)
+    return result
+
+def process_physical_slip(image_path, model_path=r'models\best.pt', detector_backend=None, debug=False):
+    # legacy interface: the extracted text plus, with debug=True, every intermediate image (None otherwise)
+    result = extract_physical_slip(image_path, model_path, detector_backend, debug=debug)
+    return result.as_tuple()
+
+def process_physical_slips_batched(image_paths, model_path=r'models\best.pt', batch_size=None, detector_backend=None, workers=None, debug=False, use_cache=True):
+    """Bulk version of process_physical_slip.
+
+    A producer thread looks each file up in the result cache and decodes and resizes the misses
+    into a bounded queue, the detector runs on batches of batch_size images, and each batch fans
+    out to perspective correction and OCR per slip on a thread pool. Yields
+    (image_path, result, error) in input order, where result is a PhysicalSlipResult (debug
+    images only with debug=True). image_paths may also hold raw bytes or DecodedImages, which
+    are yielded back as given.
+    """
+    batch_size = batch_size or PHYSICAL_BATCH_SIZE
+    detector = get_detector(model_path, detector_backend)
+    cache = get_result_cache() if use_cache and not debug else None
+    decoded = queue.Queue(maxsize=batch_size * 2)
+    done = object()
+    producer_error = []
+    stop = threading.Event() # set when the consumer stops early (generator closed)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                decoded.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def produce():
+        # always ends with done, so the consumer never waits forever; an error outside a single
+        # file's decode (e.g. image_paths itself failing) is handed to the consumer to raise
+        try:
+            for image_path in image_paths:
+                if stop.is_set():
+                    return
+                key = None
+                try:
+                    image = DecodedImage.ensure(image_path)
+                    if cache is not None:
+                        key, cached = _cache_lookup(cache, image, model_path, detector_backend)
+                        if cached is not None:
+                            put((image_path, None, None, key, cached))
+                            continue
+                    put((image_path, load_physical_image(image), None, key, None))
+                except Exception as e:
+                    put((image_path, None, e, key, None))
+        except BaseException as e:
+            producer_error.append(e)
+        finally:
+            put(done)
+
+    def finish(image, detections, key):
+        if not detections:
+            raise ValueError('No slip detected')
+        result = finish_physical_slip(image, detections[0], debug=debug)
+        if key is not None:
+            _cache_store(cache, key, result)
+        return result
+
+    threading.Thread(target=produce, daemon=True, name='physical-decode').start()
+    pool = ThreadPoolExecutor(max_workers=workers or get_ocr_engine(lang='tha+eng', psm=6).size)
+    try:
+        finished = False
+        while not finished:
+            batch = []
+            while len(batch) < batch_size:
+                item = decoded.get()
+                if item is done:
+                    finished = True
+                    break
+                batch.append(item)
+            if not batch:
+                break
+
+            ready = [i for i, (_, image, error, _, cached) in enumerate(batch) if error is None and cached is None]
+            try:
+                detections = detector.detect_batch([batch[i][1] for i in ready]) if ready else []
+                detect_error = None
+            except Exception as e:
+                detections, detect_error = [], e
+
+            futures = {i: pool.submit(finish, batch[i][1], dets, batch[i][3]) for i, dets in zip(ready, detections)}
+            for i, (path, _, error, _, cached) in enumerate(batch):
+                if cached is not None:
+                    yield path, cached, None
+                    continue
+                if error is not None or detect_error is not None:
+                    yield path, None, error or detect_error
+                    continue
+                try:
+                    yield path, futures[i].result(), None
+                except Exception as e:
+                    yield path, None, e
+        if producer_error:
+            raise producer_error[0]
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def finish_physical_slip(image, detection, debug=False):
+    """Everything after detection: crop, perspective correction, OCR and bank regex."""
     # project scope => 1 image = 1 receipt
-    for i in range(0,1): # if there are several obj, get the first one
-        # get bounding box coordinates
-        # Ultralytics returns results in Tensor format, which have to be converted to a regular Python array
-        xyxy_tensor = detections[i].xyxy.cpu() # Detections in Tensor format in CPU memory
-        xyxy = xyxy_tensor.numpy().squeeze() # Convert tensors to Numpy array
-        xmin, ymin, xmax, ymax = xyxy.astype(int) # Extract individual coordinates and convert to int
+    xmin, ymin, xmax, ymax = detection.box
+    classname = detection.class_name
+    conf = detection.confidence
+    t0 = time.perf_counter()
 
-        # get classname
-        classidx = int(detections[i].cls.item())
-        classname = labels[classidx] # map to get classname of the obj
-
-        # get confidence
-        conf = detections[i].conf.item()
-
-        # cropped 
-        # roi = img[y1:y2,x1:x2]
-        after_yolo = image[ymin:ymax,xmin:xmax]
+    # cropped 
+    # roi = img[y1:y2,x1:x2]
+    after_yolo = image[ymin:ymax,xmin:xmax]
 
     # ---perspective transformation---
     # edge detection
     gray_image = cv2.cvtColor(after_yolo, cv2.COLOR_BGR2GRAY)
-    _, binary = cv2.threshold(gray_image, 127, 255, cv2.THRESH_BINARY)
+    binary = None
+    if debug:
+        _, binary = cv2.threshold(gray_image, 127, 255, cv2.THRESH_BINARY)
 
     # get 4 coordinates for perspective transformation
     # optimize image before go get 4 coordinates
@@ -152,7 +330,7 @@ def process_physical_slip(image_path, model_path=r'models\best.pt'):
     _,binaryInv = cv2.threshold(thresh, 0, 255, cv2.THRESH_BINARY_INV)
     # get 4 coordinates
     # corners' order=TL, TR, BL, BR
-    corners, detected_4_coor_with_contour = get_4_coordinates(binaryInv,gray_image) #binary
+    corners, detected_4_coor_with_contour = get_4_coordinates(binaryInv,gray_image,debug=debug) #binary
     # for i,(x,y) in enumerate(corners):
     #     print(f"Corner {i + 1}: (x={x}, y={y})")
     
@@ -195,42 +373,44 @@ def process_physical_slip(image_path, model_path=r'models\best.pt'):
         perspective_trans = cv2.warpPerspective(gray_image,M,(height,width))
 
     # adaptive thresholding -> for handle image with shadow
-    # blur for make edges softer
-    blurred = cv2.GaussianBlur(perspective_trans,(3,3),0) 
-    
     thresh = cv2.adaptiveThreshold(perspective_trans, 255,
                                    cv2.ADAPTIVE_THRESH_MEAN_C, 
                                    cv2.THRESH_BINARY_INV, 21, 10)
     _,binaryInv = cv2.threshold(thresh, 0, 255, cv2.THRESH_BINARY_INV)
 
+    t1 = time.perf_counter()
+
     # --------OCR--------
     # pytesseract
-    custom_config = r'--oem 3 --psm 6'
-    textPytess = pytesseract.image_to_string(binaryInv, lang='tha+eng', config=custom_config)               
+    # --oem 3 --psm 6 on a pooled engine (traineddata stays loaded between slips)
+    textPytess = get_ocr_engine(lang='tha+eng', psm=6).image_to_string(binaryInv)
     #perspective_trans
     # print("-----------PYTESSERACT------------")
     # print(textPytess)
 
     lines = textPytess.splitlines()
-
-    with open("pytesseract.json", "w", encoding="utf-8") as f:
-        json.dump({"lines": lines}, f, ensure_ascii=False, indent=4)
+    t2 = time.perf_counter()
 
     # regex
     extracted_text = None
 
-    if classname=='bkk':
-        extracted_text = bkk_extracted(lines)
-
-    if classname=='kplus':
-        extracted_text = kplus_extracted(lines)
-    
-    if classname=='krungthai':
-        extracted_text = krungthai_extracted(lines)
+    ruleset = find_ruleset(PHYSICAL_RULES, classname) # function/rules/physical/*.json "match"
+    if ruleset is not None:
+        extracted_text = ruleset.parse(lines)
 
     if classname=='scb':
         extracted_text = lines
 
 
-    # return json (info in image)
-    return image, after_yolo, conf, classname, binary, detected_4_coor_with_contour, perspective_trans, thresh, binaryInv, extracted_text
+    # OCR lines and fields go to the artifact sink (off unless ARTIFACT_DIR is set)
+    sink = get_artifact_sink()
+    if sink is not None:
+        sink.submit(content_hash(image), {'bank': classname, 'confidence': conf, 'lines': lines, 'fields': extracted_text})
+
+    result = PhysicalSlipResult(classname, conf, detection.box, corners, extracted_text, textPytess,
+                                {'perspective': t1 - t0, 'ocr': t2 - t1, 'extraction': time.perf_counter() - t2})
+    if debug:
+        result.debug = {'image': image, 'after_yolo': after_yolo, 'binary': binary,
+                        'detected_4_coor_with_contour': detected_4_coor_with_contour,
+                        'perspective_trans': perspective_trans, 'thresh': thresh, 'binaryInv': binaryInv}
+    return result
@@ -0,0 +1,92 @@
+#  Preview derivatives for uploaded slips.
+#  Every upload gets a thumbnail and a display-size JPEG, decoded once (HEIC included) and stored
+#  in a hidden .previews/ folder next to the upload as <sha256 of the file>_<size>.jpg. The content
+#  hash doubles as the ETag, so a re-uploaded file with the same name never serves a stale preview
+#  and browsers can revalidate without the image being decoded again. Derivatives are made in the
+#  background at upload time, or on the first request for an upload that has none yet.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from function.image_io import DecodedImage
+from function.result_cache import file_sha256
+
+PREVIEW_DIR_NAME = '.previews'
+PREVIEW_SIZES = {'thumb': 320, 'display': int(os.environ.get('PREVIEW_DISPLAY_SIZE', 1600))} # longest side, px
+PREVIEW_QUALITY = int(os.environ.get('PREVIEW_JPEG_QUALITY', 85))
+
+_hashes = {} # abs path -> (size, mtime_ns, sha256), so a preview request does not re-read the upload
+_hashes_lock = threading.Lock()
+_build_locks = {} # sha256 -> Lock, one build per content at a time
+_build_locks_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+def _content_hash(file_path):
+    st = os.stat(file_path)
+    key = os.path.abspath(file_path)
+    with _hashes_lock:
+        cached = _hashes.get(key)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    sha = file_sha256(file_path)
+    with _hashes_lock:
+        _hashes[key] = (st.st_size, st.st_mtime_ns, sha)
+    return sha
+
+def preview_dir(file_path):
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), PREVIEW_DIR_NAME)
+
+def _derivative_path(file_path, sha, size):
+    return os.path.join(preview_dir(file_path), f'{sha}_{size}.jpg')
+
+def ensure_previews(file_path):
+    """{size: (path, etag)} for file_path, decoding it once to build whichever derivatives are missing."""
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(file_path)
+    sha = _content_hash(file_path)
+    paths = {size: _derivative_path(file_path, sha, size) for size in PREVIEW_SIZES}
+    missing = [size for size, path in paths.items() if not os.path.exists(path)]
+    if missing:
+        with _build_locks_lock:
+            lock = _build_locks.setdefault(sha, threading.Lock())
+        with lock:
+            missing = [size for size in missing if not os.path.exists(paths[size])] # built while we waited
+            if missing:
+                os.makedirs(preview_dir(file_path), exist_ok=True)
+                with DecodedImage.open(file_path).pil() as image:
+                    image = ImageOps.exif_transpose(image).convert('RGB')
+                # largest first, so each smaller derivative is resized from the previous one
+                for size in sorted(missing, key=PREVIEW_SIZES.get, reverse=True):
+                    image.thumbnail((PREVIEW_SIZES[size], PREVIEW_SIZES[size]), Image.LANCZOS)
+                    tmp_path = f'{paths[size]}.{threading.get_ident()}.tmp'
+                    image.save(tmp_path, format='JPEG', quality=PREVIEW_QUALITY, optimize=True)
+                    os.replace(tmp_path, paths[size])
+        with _build_locks_lock:
+            _build_locks.pop(sha, None)
+    return {size: (path, f'{sha}-{size}') for size, path in paths.items()}
+
+def schedule_previews(file_path):
+    """Build file_path's derivatives on a background thread (called right after an upload is saved)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='previews')
+    def build():
+        try:
+            ensure_previews(file_path)
+        except Exception as e:
+            print(f"Error building previews for {file_path}: {e}")
+    return _executor.submit(build)
+
+def remove_previews(file_path):
+    """Delete file_path's derivatives (before the upload is deleted or overwritten)."""
+    if not os.path.isfile(file_path):
+        return
+    sha = _content_hash(file_path)
+    for size in PREVIEW_SIZES:
+        path = _derivative_path(file_path, sha, size)
+        if os.path.exists(path):
+            os.remove(path)
+    with _hashes_lock:
+        _hashes.pop(os.path.abspath(file_path), None)
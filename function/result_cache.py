@@ -0,0 +1,101 @@
+#  Persistent, content-addressed cache of extraction results (SQLite).
+#  A result is stored under sha256(image bytes) + PIPELINE_VERSION + a hash of the stage config
+#  (logo index, OCR settings, detector model, parser rules...), so re-processing an unchanged file skips logo
+#  matching, YOLO and OCR. Entries are evicted least-recently-used once the cache outgrows
+#  RESULT_CACHE_MAX_MB. Set RESULT_CACHE_PATH to an empty string to disable the cache.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# bump whenever a change to the pipeline alters results, so old entries stop matching
+PIPELINE_VERSION = 2
+
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', os.path.join('cache', 'results.sqlite'))
+RESULT_CACHE_MAX_MB = float(os.environ.get('RESULT_CACHE_MAX_MB', 256))
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def config_hash(config):
+    # stable hash of a JSON-serialisable config (dict keys sorted)
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def cache_key(kind, content_hash, config):
+    return hashlib.sha256(f'{kind}:{PIPELINE_VERSION}:{content_hash}:{config_hash(config)}'.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    def __init__(self, path, max_bytes):
+        self.path = os.path.abspath(path)
+        self.max_bytes = int(max_bytes)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local() # sqlite3 connections are per thread
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'key TEXT PRIMARY KEY, kind TEXT, payload TEXT, raw_ocr TEXT, '
+                         'size INTEGER, created REAL, last_access REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """(payload dict, raw_ocr) for key, or None; a hit refreshes the entry's LRU position."""
+        conn = self._connect()
+        row = conn.execute('SELECT payload, raw_ocr FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, kind, payload, raw_ocr=None):
+        data = json.dumps(payload, ensure_ascii=False, default=str)
+        size = len(data.encode('utf-8')) + len((raw_ocr or '').encode('utf-8'))
+        now = time.time()
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (key, kind, data, raw_ocr, size, now, now))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop least recently used entries until the cache fits again
+        for key, size in conn.execute('SELECT key, size FROM results ORDER BY last_access').fetchall():
+            conn.execute('DELETE FROM results WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        count, total = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        return {'path': self.path, 'entries': count, 'bytes': total, 'max_bytes': self.max_bytes}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Shared ResultCache, or None when RESULT_CACHE_PATH is empty."""
+    global _cache
+    if not RESULT_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
@@ -0,0 +1,141 @@
+#  Streaming writers for bulk extraction results.
+#  Rows are appended as soon as they are produced and flushed to disk every FLUSH_EVERY rows, so
+#  memory stays flat and a crash only loses the unflushed tail. E-slips and physical slips share
+#  ROW_SCHEMA, so every output file has the same columns whatever the slip type or bank.
+#  Formats: csv, ndjson, parquet (needs pyarrow; a Parquet file is only readable once closed).
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+BULK_OUTPUT_FORMAT = os.environ.get('BULK_OUTPUT_FORMAT', 'csv')
+FLUSH_EVERY = int(os.environ.get('BULK_FLUSH_EVERY', 20))
+
+# extracted fields (e-slip parsers, then physical parsers), then the metadata added per slip
+ROW_SCHEMA = [
+    # e-slip
+    'transaction_date', 'transaction_time', 'amount', 'from_account_name', 'to_account_name',
+    'to_bank', 'ref_number', 'from_bank',
+    # physical slip
+    'date', 'time', 'transaction_type', 'from_account', 'withdrawal_amount', 'deposit_amount',
+    'fee_amount', 'available_balance', 'account_balance', 'ac_name', 'extracted_text',
+    # metadata
+    'filename', 'slip_type', 'processing_timestamp', 'detected_bank', 'confidence',
+]
+FLOAT_COLUMNS = {'confidence'}
+
+EXTENSIONS = {'csv': '.csv', 'ndjson': '.ndjson', 'parquet': '.parquet'}
+
+def conform(row, schema=ROW_SCHEMA):
+    """row restricted to schema, in schema order, missing columns as None."""
+    unknown = set(row) - set(schema)
+    if unknown:
+        print(f"Dropping columns not in the result schema: {sorted(unknown)}")
+    return {column: row.get(column) for column in schema}
+
+class ResultSink(ABC):
+    def __init__(self, path, schema=ROW_SCHEMA, flush_every=FLUSH_EVERY):
+        self.path = path
+        self.schema = schema
+        self.flush_every = max(1, flush_every)
+        self.count = 0
+        self._buffer = []
+
+    def write(self, row):
+        self._buffer.append(conform(row, self.schema))
+        self.count += 1
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    @abstractmethod
+    def _write_batch(self, rows):
+        """Append rows (already conformed to the schema) to the output."""
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvSink(ResultSink):
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.schema)
+        if new_file:
+            self._writer.writeheader()
+
+    def _write_batch(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+class NdjsonSink(ResultSink):
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _write_batch(self, rows):
+        self._file.writelines(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+class ParquetSink(ResultSink):
+    def __init__(self, path, **kwargs):
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet output (pip install pyarrow)")
+        super().__init__(path, **kwargs)
+        self._arrow_schema = pa.schema([(c, pa.float64() if c in FLOAT_COLUMNS else pa.string()) for c in self.schema])
+        self._writer = pq.ParquetWriter(path, self._arrow_schema)
+
+    def _write_batch(self, rows):
+        # one row group per flush
+        columns = {}
+        for c in self.schema:
+            if c in FLOAT_COLUMNS:
+                columns[c] = [None if r[c] is None else float(r[c]) for r in rows]
+            else:
+                columns[c] = [None if r[c] is None else str(r[c]) for r in rows]
+        self._writer.write_table(pa.table(columns, schema=self._arrow_schema))
+
+    def _close(self):
+        self._writer.close()
+
+SINKS = {'csv': CsvSink, 'ndjson': NdjsonSink, 'parquet': ParquetSink}
+
+def check_format(fmt=None):
+    """Raise before any work is done if fmt cannot be written here; returns the resolved format."""
+    fmt = fmt or BULK_OUTPUT_FORMAT
+    if fmt not in SINKS:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {sorted(SINKS)}")
+    if fmt == 'parquet' and pa is None:
+        raise ImportError("pyarrow is required for Parquet output (pip install pyarrow)")
+    return fmt
+
+def open_sink(path_without_ext, fmt=None, **kwargs):
+    """Sink for fmt (default BULK_OUTPUT_FORMAT) writing to path_without_ext + its extension."""
+    fmt = check_format(fmt)
+    return SINKS[fmt](path_without_ext + EXTENSIONS[fmt], **kwargs)
@@ -0,0 +1,186 @@
+#  Catalogue of the result files in app_extraction_csv/ (catalog.json).
+#  For every file it keeps the kind (e_slip / physical_slip / summary), row count, creation time,
+#  columns and a sparse index of record offsets, so /view_results can list files without opening
+#  them and read just the rows of the page it shows. Writers register files as they finish them;
+#  sync() picks up anything written or removed behind the catalogue's back (checked by mtime/size).
+import csv
+import io
+import json
+import os
+import threading
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+CATALOG_NAME = 'catalog.json'
+INDEX_STRIDE = 50 # remember the byte offset of every INDEX_STRIDE-th record
+RESULT_EXTENSIONS = ('.csv', '.ndjson', '.parquet')
+
+def result_kind(filename):
+    if 'e_slip_extraction' in filename:
+        return 'e_slip'
+    if 'physical_slip_extraction' in filename:
+        return 'physical_slip'
+    if 'extraction_summary' in filename:
+        return 'summary'
+    return None
+
+def _csv_records(f):
+    # yield (offset, raw record) for a CSV opened in binary mode; a record ends on a line where
+    # the running count of quote characters is even, so quoted newlines stay inside the record
+    offset = f.tell()
+    record, quotes = [], 0
+    for line in iter(f.readline, b''):
+        record.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            yield offset, b''.join(record)
+            offset += sum(len(part) for part in record)
+            record, quotes = [], 0
+    if record:
+        yield offset, b''.join(record)
+
+def _ndjson_records(f):
+    offset = f.tell()
+    for line in iter(f.readline, b''):
+        if line.strip():
+            yield offset, line
+        offset += len(line)
+
+def _scan(path):
+    # (row count, columns, [offset of record 0, INDEX_STRIDE, 2*INDEX_STRIDE...]) in one pass
+    ext = os.path.splitext(path)[1]
+    if ext == '.parquet':
+        if pq is None:
+            return None, [], []
+        meta = pq.ParquetFile(path)
+        return meta.metadata.num_rows, meta.schema_arrow.names, []
+    rows, columns, offsets = 0, [], []
+    with open(path, 'rb') as f:
+        if ext == '.csv':
+            records = _csv_records(f)
+            header = next(records, None)
+            if header is not None:
+                columns = next(csv.reader(io.StringIO(header[1].decode('utf-8-sig'))), [])
+        else:
+            records = _ndjson_records(f)
+        for offset, record in records:
+            if ext == '.ndjson' and rows == 0:
+                columns = list(json.loads(record))
+            if rows % INDEX_STRIDE == 0:
+                offsets.append(offset)
+            rows += 1
+    return rows, columns, offsets
+
+class ResultsCatalog:
+    def __init__(self, results_dir):
+        self.results_dir = results_dir
+        self.path = os.path.join(results_dir, CATALOG_NAME)
+        self.entries = {} # filename -> {kind, format, rows, columns, created, size, mtime_ns, offsets}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self.entries = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                print(f"Rebuilding unreadable results catalogue {self.path}: {e}")
+
+    def register(self, path, save=True):
+        """(Re)read one result file's metadata into the catalogue."""
+        filename = os.path.basename(path)
+        kind = result_kind(filename)
+        if kind is None:
+            return None
+        st = os.stat(path)
+        rows, columns, offsets = _scan(path)
+        entry = {'kind': kind, 'format': os.path.splitext(filename)[1][1:], 'rows': rows, 'columns': columns,
+                 'created': st.st_mtime, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'offsets': offsets}
+        with self._lock:
+            self.entries[filename] = entry
+        if save:
+            self.save()
+        return entry
+
+    def sync(self):
+        """Bring the catalogue in line with the folder using stat() only; rescan changed files."""
+        present = {}
+        if os.path.exists(self.results_dir):
+            for entry in os.scandir(self.results_dir):
+                if entry.is_file() and entry.name.endswith(RESULT_EXTENSIONS) and not entry.name.startswith('.') \
+                        and result_kind(entry.name):
+                    present[entry.name] = entry.stat()
+        changed = False
+        with self._lock:
+            for filename in [f for f in self.entries if f not in present]:
+                del self.entries[filename]
+                changed = True
+            stale = [f for f, st in present.items()
+                     if f not in self.entries or self.entries[f]['mtime_ns'] != st.st_mtime_ns or self.entries[f]['size'] != st.st_size]
+        for filename in stale:
+            try:
+                self.register(os.path.join(self.results_dir, filename), save=False)
+            except Exception as e:
+                print(f"Error reading {filename}: {e}")
+            changed = True
+        if changed:
+            self.save()
+
+    def files(self, kind=None):
+        """[(filename, entry)] newest first."""
+        with self._lock:
+            items = [(f, dict(e)) for f, e in self.entries.items() if kind is None or e['kind'] == kind]
+        return sorted(items, key=lambda item: item[1]['created'], reverse=True)
+
+    def read_rows(self, filename, start, count):
+        """(columns, rows) for records [start, start + count) of filename, read via the offset index."""
+        entry = self.entries.get(filename)
+        if entry is None:
+            raise KeyError(filename)
+        path = os.path.join(self.results_dir, filename)
+        if entry['format'] == 'parquet':
+            table = pq.read_table(path).slice(start, count)
+            return table.column_names, [list(r.values()) for r in table.to_pylist()]
+        offsets = entry['offsets']
+        block = min(start // INDEX_STRIDE, len(offsets) - 1) if offsets else 0
+        rows = []
+        with open(path, 'rb') as f:
+            if not offsets:
+                return entry['columns'], rows
+            f.seek(offsets[block])
+            records = _csv_records(f) if entry['format'] == 'csv' else _ndjson_records(f)
+            for i, (_, record) in enumerate(records, start=block * INDEX_STRIDE):
+                if i < start:
+                    continue
+                if i >= start + count:
+                    break
+                text = record.decode('utf-8')
+                if entry['format'] == 'csv':
+                    rows.append(next(csv.reader(io.StringIO(text)), []))
+                else:
+                    data = json.loads(text)
+                    rows.append([data.get(c) for c in entry['columns']])
+        return entry['columns'], rows
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'version': 1, 'files': self.entries}, ensure_ascii=False)
+        tmp_path = f'{self.path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_results_catalog(results_dir):
+    """Shared ResultsCatalog for results_dir."""
+    key = os.path.abspath(results_dir)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            os.makedirs(key, exist_ok=True)
+            catalog = ResultsCatalog(key)
+            _catalogs[key] = catalog
+        return catalog
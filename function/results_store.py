@@ -0,0 +1,180 @@
+#  Indexed SQLite store of extracted slips (app_extraction_csv/results.sqlite).
+#  Bulk extraction upserts one row per upload, with the _extract_*_info fields normalised into
+#  typed, indexed columns (ISO transaction_date, numeric amount, canonical bank names). query()
+#  filters and aggregates on those columns in SQL, so "all kbank slips over 5,000 THB in April"
+#  is an index range scan instead of loading every CSV into pandas.
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from function.months import normalize_year
+
+STORE_NAME = 'results.sqlite'
+QUERY_LIMIT_MAX = 1000
+
+COLUMNS = ['source_key', 'slip_type', 'filename', 'transaction_date', 'transaction_time', 'amount',
+           'from_bank', 'to_bank', 'ref_number', 'detected_bank', 'confidence', 'processed_at', 'row_json']
+
+# columns a query may filter, group or order on
+GROUPS = {
+    'from_bank': 'from_bank', 'to_bank': 'to_bank', 'detected_bank': 'detected_bank', 'slip_type': 'slip_type',
+    'day': 'transaction_date', 'month': "substr(transaction_date, 1, 7)", 'year': "substr(transaction_date, 1, 4)",
+}
+AGGREGATES = {'count': 'COUNT(*)', 'sum': 'SUM(amount)', 'avg': 'AVG(amount)', 'min': 'MIN(amount)', 'max': 'MAX(amount)'}
+ORDERS = {'transaction_date', 'amount', 'from_bank', 'to_bank', 'processed_at', 'filename'}
+
+_PHYSICAL_DATE = re.compile(r'(\d{1,2})\D(\d{1,2})\D(\d{2,4})')
+
+def _amount(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(str(value).replace(',', '').strip())
+    except ValueError:
+        return None
+
+def _physical_date(value):
+    # physical slips print dd/mm/yy (Buddhist-era years) -> ISO yyyy-mm-dd
+    match = _PHYSICAL_DATE.search(value or '')
+    if not match:
+        return None
+    day, month, year = int(match.group(1)), int(match.group(2)), normalize_year(match.group(3))
+    if not year or not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    return f'{year:04d}-{month:02d}-{day:02d}'
+
+def to_record(key, row, normalize_bank):
+    """Store columns for one bulk row (see function.bulk_extract.e_slip_row / physical_row)."""
+    if row.get('slip_type') == 'physical':
+        date = _physical_date(row.get('date'))
+        time_ = row.get('time')
+        amount = _amount(row.get('withdrawal_amount') or row.get('deposit_amount'))
+        from_bank = row.get('detected_bank')
+        to_bank = None
+    else:
+        date = row.get('transaction_date') or None
+        time_ = row.get('transaction_time')
+        amount = _amount(row.get('amount'))
+        from_bank = row.get('from_bank') or row.get('detected_bank')
+        to_bank = row.get('to_bank')
+    canonical = lambda bank: normalize_bank(bank.strip().lower()) if bank else None
+    return {'source_key': key, 'slip_type': row.get('slip_type'), 'filename': row.get('filename'),
+            'transaction_date': date, 'transaction_time': time_, 'amount': amount,
+            'from_bank': canonical(from_bank), 'to_bank': canonical(to_bank), 'ref_number': row.get('ref_number'),
+            'detected_bank': row.get('detected_bank'), 'confidence': _amount(row.get('confidence')),
+            'processed_at': row.get('processing_timestamp'), 'row_json': json.dumps(row, ensure_ascii=False, default=str)}
+
+class ResultsStore:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS slips ('
+                         'id INTEGER PRIMARY KEY, source_key TEXT UNIQUE NOT NULL, slip_type TEXT, filename TEXT, '
+                         'transaction_date TEXT, transaction_time TEXT, amount REAL, from_bank TEXT, to_bank TEXT, '
+                         'ref_number TEXT, detected_bank TEXT, confidence REAL, processed_at TEXT, row_json TEXT)')
+            # composite indexes serve "bank + date range (+ amount)" filters and grouped aggregates
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_from_bank_date ON slips (from_bank, transaction_date, amount)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_to_bank_date ON slips (to_bank, transaction_date, amount)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_date_amount ON slips (transaction_date, amount)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_amount ON slips (amount)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_ref_number ON slips (ref_number)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_type_date ON slips (slip_type, transaction_date)')
+            conn.execute('CREATE INDEX IF NOT EXISTS slips_detected_bank_date ON slips (detected_bank, transaction_date)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def upsert_many(self, records):
+        if not records:
+            return
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        updates = ', '.join(f'{c} = excluded.{c}' for c in COLUMNS[1:])
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany(f'INSERT INTO slips ({", ".join(COLUMNS)}) VALUES ({placeholders}) '
+                             f'ON CONFLICT (source_key) DO UPDATE SET {updates}',
+                             [[r[c] for c in COLUMNS] for r in records])
+
+    def delete(self, keys):
+        if not keys:
+            return
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executemany('DELETE FROM slips WHERE source_key = ?', [(k,) for k in keys])
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM slips').fetchone()[0]
+
+    def query(self, bank=None, from_bank=None, to_bank=None, detected_bank=None, slip_type=None,
+              date_from=None, date_to=None, min_amount=None, max_amount=None, ref_number=None,
+              agg=None, group_by=None, order_by='transaction_date', descending=False, limit=100, offset=0):
+        """Filter slips and either return rows or aggregate them.
+
+        bank matches from_bank or to_bank. Dates are ISO yyyy-mm-dd (inclusive). With agg
+        (count, sum, avg, min, max over amount) the result is one value per group_by group
+        (from_bank, to_bank, detected_bank, slip_type, day, month, year), otherwise matching rows.
+        """
+        where, params = [], []
+        for column, value in (('from_bank', from_bank), ('to_bank', to_bank), ('detected_bank', detected_bank),
+                              ('slip_type', slip_type), ('ref_number', ref_number)):
+            if value is not None:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if bank is not None:
+            where.append('(from_bank = ? OR to_bank = ?)')
+            params += [bank, bank]
+        for clause, value in (('transaction_date >= ?', date_from), ('transaction_date <= ?', date_to),
+                              ('amount >= ?', min_amount), ('amount <= ?', max_amount)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        where_sql = f' WHERE {" AND ".join(where)}' if where else ''
+
+        t0 = time.perf_counter()
+        conn = self._connect()
+        if agg:
+            if agg not in AGGREGATES:
+                raise ValueError(f"Unknown aggregate {agg!r}, expected one of {sorted(AGGREGATES)}")
+            if group_by and group_by not in GROUPS:
+                raise ValueError(f"Unknown group_by {group_by!r}, expected one of {sorted(GROUPS)}")
+            if group_by:
+                sql = (f'SELECT {GROUPS[group_by]} AS grp, {AGGREGATES[agg]} AS value, COUNT(*) AS slips '
+                       f'FROM slips{where_sql} GROUP BY grp ORDER BY grp')
+                data = [{group_by: r['grp'], agg: r['value'], 'slips': r['slips']} for r in conn.execute(sql, params)]
+            else:
+                r = conn.execute(f'SELECT {AGGREGATES[agg]} AS value, COUNT(*) AS slips FROM slips{where_sql}', params).fetchone()
+                data = [{agg: r['value'], 'slips': r['slips']}]
+            return {'groups': data, 'elapsed_ms': (time.perf_counter() - t0) * 1000}
+
+        if order_by not in ORDERS:
+            raise ValueError(f"Unknown order_by {order_by!r}, expected one of {sorted(ORDERS)}")
+        limit = max(0, min(int(limit), QUERY_LIMIT_MAX))
+        sql = (f'SELECT {", ".join(COLUMNS[:-1])} FROM slips{where_sql} '
+               f'ORDER BY {order_by} {"DESC" if descending else "ASC"}, id LIMIT ? OFFSET ?')
+        rows = [dict(r) for r in conn.execute(sql, params + [limit, int(offset)])]
+        return {'rows': rows, 'limit': limit, 'offset': int(offset), 'elapsed_ms': (time.perf_counter() - t0) * 1000}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_results_store(results_dir):
+    """Shared ResultsStore in results_dir."""
+    key = os.path.abspath(results_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            os.makedirs(key, exist_ok=True)
+            store = ResultsStore(os.path.join(key, STORE_NAME))
+            _stores[key] = store
+        return store
@@ -0,0 +1,268 @@
+#  Data-driven field extraction for OCR'd slips.
+#  Every bank's field rules live in a JSON rule file (function/rules/<kind>/<bank>.json) and are
+#  compiled once when the rule files are loaded. A RuleSet parses a slip in one pass: "lines" rule
+#  sets walk the OCR lines once and stop trying a field as soon as it is filled, "text" rule sets
+#  run each field's patterns in order over the whole text. Anything that is not a plain
+#  pattern -> value rule (multi-line recipient blocks, month names) is a named transform or hook
+#  registered in Python. Supporting a new bank means adding its rule file to the folder.
+#
+#  Rule file:
+#    {"bank": "kbank",                       name the rule set is stored under
+#     "match": ["kbank", "kasikorn"],        detector classes / logo names it handles (substring)
+#     "scope": "text" | "lines",
+#     "fields": ["date", "time", ...],       output keys, in order, None until found
+#     "normalize": {"upper": true, "replace": [["O", "0"]], "strip": true},   per line, "lines" only
+#     "rules": [{
+#         "field": "amount" | ["date", "time"],   one field, or several filled by one transform
+#         "patterns": ["regex", ...],        tried in order, the first match decides
+#         "flags": ["IGNORECASE"],           re flag names
+#         "group": 1,                        group to take (default 1 if the pattern has groups, else 0;
+#                                            "join": the non-empty groups joined by spaces)
+#         "value": "WITHDRAWAL",             constant instead of the matched text
+#         "replace": [["'", "/"]], "format": "{}:00",  applied to the value in this order
+#         "transform": "amount",             registered transform(match, context) -> value or None
+#         "anchor": "regex",                 "lines": only try lines that match the anchor
+#         "lookahead": "fallback" | "required",  "lines": also try the next line ("required": only when there is one)
+#         "requires": {"field": "value"},    "lines": only once another field holds this value
+#         "keep": "first" | "last"}],        "last": later matches overwrite
+#     "post": "hook name"}                   registered hook(text, fields, context) for what regexes cannot say
+import hashlib
+import inspect
+import json
+import os
+import re
+import threading
+import time
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+
+_transforms = {}
+_hooks = {}
+
+def register_transform(name):
+    """Decorator: fn(match, context) -> value (or a tuple for multi-field rules, None = not found)."""
+    def decorator(fn):
+        _transforms[name] = fn
+        return fn
+    return decorator
+
+def register_hook(name):
+    """Decorator: fn(text, fields, context), fills fields in place after the rules ran."""
+    def decorator(fn):
+        _hooks[name] = fn
+        return fn
+    return decorator
+
+@register_transform('strip')
+def _strip(match, context):
+    return match.strip()
+
+@register_transform('upper')
+def _upper(match, context):
+    return match.upper()
+
+@register_transform('first_line')
+def _first_line(match, context):
+    return match.strip().split('\n')[0]
+
+@register_transform('amount')
+def _amount(match, context):
+    return float(match.replace(',', '').replace('“', '').replace('”', ''))
+
+class FieldRule:
+    def __init__(self, spec):
+        self.fields = spec['field'] if isinstance(spec['field'], list) else [spec['field']]
+        flags = 0
+        for name in spec.get('flags', []):
+            flags |= getattr(re, name)
+        self.patterns = [re.compile(p, flags) for p in spec['patterns']]
+        self.group = spec.get('group')
+        self.value = spec.get('value')
+        self.replace = spec.get('replace', [])
+        self.format = spec.get('format')
+        self.transform = spec.get('transform')
+        self.anchor = re.compile(spec['anchor']) if spec.get('anchor') else None
+        self.lookahead = spec.get('lookahead')
+        self.requires = spec.get('requires', {})
+        self.keep_last = spec.get('keep', 'first') == 'last'
+        if self.transform is not None and self.transform not in _transforms:
+            raise ValueError(f"Unknown transform {self.transform!r}")
+
+    def search(self, text):
+        # first pattern that matches, or None
+        for pattern in self.patterns:
+            match = pattern.search(text)
+            if match:
+                return match
+        return None
+
+    def extract(self, match, context):
+        """Value(s) for a match as a tuple, one per field; ValueError when the match cannot be used."""
+        if self.value is not None:
+            return (self.value,)
+        if self.transform is not None and len(self.fields) > 1:
+            # multi-field transforms get the whole match
+            values = _transforms[self.transform](match, context)
+            if values is None:
+                raise ValueError('no value')
+            return tuple(values)
+        if self.group == 'join':
+            value = ' '.join(g for g in match.groups() if g).strip()
+        else:
+            value = match.group(self.group if self.group is not None else (1 if match.re.groups else 0))
+        for old, new in self.replace:
+            value = value.replace(old, new)
+        if self.format is not None:
+            value = self.format.format(value)
+        if self.transform is not None:
+            value = _transforms[self.transform](value, context)
+        return (value,)
+
+class RuleSet:
+    def __init__(self, spec, source=None):
+        self.bank = spec['bank']
+        self.match = [m.lower() for m in spec.get('match', [self.bank])]
+        self.scope = spec.get('scope', 'text')
+        self.fields = spec['fields']
+        normalize = spec.get('normalize', {})
+        self._upper = normalize.get('upper', False)
+        self._replace = normalize.get('replace', [])
+        self._strip = normalize.get('strip', False)
+        self.rules = [FieldRule(rule) for rule in spec['rules']]
+        self.post = spec.get('post')
+        if self.post is not None and self.post not in _hooks:
+            raise ValueError(f"Unknown hook {self.post!r}")
+        self.source = source
+        self._stats = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def handles(self, name):
+        name = (name or '').lower()
+        return any(m in name for m in self.match)
+
+    def normalize_line(self, line):
+        if self._upper:
+            line = line.upper()
+        for old, new in self._replace:
+            line = line.replace(old, new)
+        return line.strip() if self._strip else line
+
+    def parse(self, text_or_lines, context=None):
+        """Fields dict for one slip: OCR text ("text" scope) or OCR lines ("lines" scope)."""
+        t0 = time.perf_counter()
+        context = context or {}
+        fields = dict.fromkeys(self.fields)
+        if self.scope == 'lines':
+            lines = text_or_lines if isinstance(text_or_lines, list) else text_or_lines.splitlines()
+            self._parse_lines(lines, fields, context)
+            text = '\n'.join(lines)
+        else:
+            text = text_or_lines
+            self._parse_text(text, fields, context)
+        if self.post is not None:
+            _hooks[self.post](text, fields, context)
+        seconds = time.perf_counter() - t0
+        with self._stats_lock:
+            self._stats['calls'] += 1
+            self._stats['seconds'] += seconds
+            self._stats['max_seconds'] = max(self._stats['max_seconds'], seconds)
+        return fields
+
+    def _parse_text(self, text, fields, context):
+        for rule in self.rules:
+            if all(fields[f] is not None for f in rule.fields):
+                continue
+            match = rule.search(text)
+            if match is None:
+                continue
+            try:
+                values = rule.extract(match, context)
+            except (ValueError, IndexError, KeyError):
+                continue # matched but unusable: the field stays empty
+            for f, value in zip(rule.fields, values):
+                fields[f] = value
+
+    def _parse_lines(self, lines, fields, context):
+        pending = list(self.rules)
+        cleaned = [None] * len(lines)
+        def line_at(i):
+            if cleaned[i] is None:
+                cleaned[i] = self.normalize_line(lines[i])
+            return cleaned[i]
+
+        for i in range(len(lines)):
+            if not pending:
+                break # every field is filled
+            line = line_at(i)
+            has_next = i + 1 < len(lines)
+            for rule in pending:
+                if any(fields.get(f) != v for f, v in rule.requires.items()):
+                    continue
+                if rule.anchor is not None and not rule.anchor.search(line):
+                    continue
+                if rule.lookahead == 'required' and not has_next:
+                    continue
+                match = rule.search(line)
+                if match is None and rule.lookahead and has_next:
+                    match = rule.search(line_at(i + 1))
+                if match is None:
+                    continue
+                try:
+                    values = rule.extract(match, context)
+                except (ValueError, IndexError, KeyError):
+                    continue
+                for f, value in zip(rule.fields, values):
+                    fields[f] = value
+            pending = [r for r in pending if r.keep_last or any(fields[f] is None for f in r.fields)]
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['mean_ms'] = stats['seconds'] / stats['calls'] * 1000 if stats['calls'] else None
+        return stats
+
+def load_rulesets(kind):
+    """{bank: RuleSet} for every rule file in function/rules/<kind>/, compiled now."""
+    directory = os.path.join(RULES_DIR, kind)
+    rulesets = {}
+    signature = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            ruleset = RuleSet(json.loads(data.decode('utf-8')), source=path)
+        except (ValueError, KeyError, re.error) as e:
+            raise ValueError(f"Invalid rule file {path}: {e}") from e
+        signature.update(name.encode('utf-8') + b'\0' + data + b'\0')
+        rulesets[ruleset.bank] = ruleset
+        _loaded[(kind, ruleset.bank)] = ruleset
+    # the Python transforms and hooks the rules name are part of the parsers too
+    used = sorted({('transform', r.transform) for rs in rulesets.values() for r in rs.rules if r.transform}
+                  | {('hook', rs.post) for rs in rulesets.values() if rs.post})
+    for role, name in used:
+        fn = (_transforms if role == 'transform' else _hooks)[name]
+        try:
+            source = inspect.getsource(fn)
+        except (OSError, TypeError):
+            source = f'{fn.__module__}.{fn.__qualname__}'
+        signature.update(f'{role}:{name}\0{source}\0'.encode('utf-8'))
+    _signatures[kind] = signature.hexdigest()
+    return rulesets
+
+def rules_signature(kind):
+    """Hash of the loaded <kind> rule files and the transforms/hooks they use, for result-cache keys."""
+    return _signatures[kind]
+
+def find_ruleset(rulesets, name):
+    """First rule set (in file name order) that handles a detector class / logo name, or None."""
+    return next((r for r in rulesets.values() if r.handles(name)), None)
+
+_loaded = {}
+_signatures = {}
+
+def get_parse_metrics():
+    """Parse counts and times per loaded rule set."""
+    return {f'{kind}/{bank}': ruleset.stats() for (kind, bank), ruleset in _loaded.items()}